@@ -1,24 +1,48 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
-from app.db.models.user import User
+from app.db.batch_writer import insert
 from app.db.models.dream import Dream
-from app.db.schemas.dream import DreamCreate, DreamResponse
+from app.db.schemas.dream import DreamCreate, DreamResponse, DreamSearchPage, DreamSearchResult, DreamSimilarResult
+from app.db.search import search_dreams, search_supported, render_highlight
 from app.services.stable_diffusion import generate_image
-from app.core.security import get_current_user_optional, get_current_user
+from app.services.history_export import EXPORT_MEDIA_TYPES, export_headers, iter_export
+from app.services.media_archive import iter_user_archive
+from app.core.security import AuthenticatedUser, get_current_user_optional, get_current_user
+from app.core.metrics import observe_stage
+from app.core.scheduler import SchedulerFull, schedule_generation, scheduler_full_exception
+from app.core.tracing import span
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def image_url_for(image_path: str) -> str:
+    filename = image_path.split('/')[-1]
+    return f"/static/generated_images/{filename}"
+
+# The vector index is used from worker threads: it takes a blocking file lock,
+# and numpy is only imported (there, not on the event loop) once it is needed
+def _index_dream(dream_id: int, owner_id: Optional[int], prompt: str) -> None:
+    from app.services.dream_embeddings import get_dream_index
+    get_dream_index().add(dream_id, owner_id, prompt)
+
+def _search_similar(user_id: int, prompt: str, limit: int, exclude_id: Optional[int]):
+    from app.services.dream_embeddings import embed_prompt, get_dream_index
+    return get_dream_index().search(embed_prompt(prompt), k=limit, owner_id=user_id, exclude_id=exclude_id)
+
 @router.post("/", response_model=DreamResponse)
 async def create_dream(
+    request: Request,
     dream_data: DreamCreate,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user_optional)
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_user_optional)
 ):
     """
     Create a new dream by generating an image from the prompt.
@@ -27,42 +51,50 @@ async def create_dream(
     try:
         logger.info(f"Creating dream with prompt: {dream_data.prompt}")
         
-        result = generate_image(dream_data.prompt)
+        result = await schedule_generation(
+            request, current_user, generate_image, dream_data.prompt, None, current_user.id if current_user else None
+        )
         image_path = result["file_path"]
         image_url = result["image_url"]
         
         logger.info(f"Image generated and saved to: {image_path}")
         
-        db_dream = Dream(
+        db_dream = await insert(db, Dream(
             user_id=current_user.id if current_user else None,
             prompt=dream_data.prompt,
             image_path=image_path
-        )
-        
-        db.add(db_dream)
-        db.commit()
-        db.refresh(db_dream)
+        ))
         
         logger.info(f"Dream created with ID: {db_dream.id}")
         
-        response = DreamResponse(
-            id=db_dream.id,
-            user_id=db_dream.user_id,
-            prompt=db_dream.prompt,
-            image_url=image_url,
-            created_at=db_dream.created_at
-        )
+        try:
+            with span("dream_index.add", dream_id=db_dream.id):
+                await run_in_threadpool(_index_dream, db_dream.id, db_dream.user_id, db_dream.prompt)
+        except Exception as index_error:
+            logger.error(f"Failed to index dream {db_dream.id}: {index_error}")
+        
+        # Serialized here rather than by FastAPI so the time is measured
+        with observe_stage("serialization"):
+            body = DreamResponse(
+                id=db_dream.id,
+                user_id=db_dream.user_id,
+                prompt=db_dream.prompt,
+                image_url=image_url,
+                created_at=db_dream.created_at
+            ).model_dump_json()
         
-        return response
+        return Response(content=body, media_type="application/json")
         
+    except SchedulerFull as e:
+        raise scheduler_full_exception(e)
     except Exception as e:
         logger.error(f"Failed to create dream: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate dream image")
 
 @router.get("/me", response_model=List[DreamResponse])
 async def get_my_dreams(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Get all dreams for the current authenticated user.
@@ -70,21 +102,148 @@ async def get_my_dreams(
     """
     logger.info(f"Fetching dreams for user ID: {current_user.id}")
     
-    dreams = db.query(Dream).filter(Dream.user_id == current_user.id).all()
+    dreams = (await db.scalars(select(Dream).where(Dream.user_id == current_user.id))).all()
     
     logger.info(f"Found {len(dreams)} dreams for user {current_user.id}")
     
     response_dreams = []
     for dream in dreams:
-        filename = dream.image_path.split('/')[-1]
-        image_url = f"/static/generated_images/{filename}"
-        
         response_dreams.append(DreamResponse(
             id=dream.id,
             user_id=dream.user_id,
             prompt=dream.prompt,
-            image_url=image_url,
+            image_url=image_url_for(dream.image_path),
             created_at=dream.created_at
         ))
     
-    return response_dreams 
\ No newline at end of file
+    return response_dreams
+
+DREAM_EXPORT_FIELDS = ["id", "user_id", "prompt", "image_url", "created_at"]
+
+def _dream_export_record(row) -> dict:
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "prompt": row.prompt,
+        "image_url": image_url_for(row.image_path),
+        "created_at": row.created_at
+    }
+
+@router.get("/export")
+async def export_my_dreams(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Stream the current user's complete dream history as NDJSON or CSV.
+    Rows are read in batches so memory use does not grow with history size.
+    """
+    statement = (
+        select(Dream.id, Dream.user_id, Dream.prompt, Dream.image_path, Dream.created_at)
+        .where(Dream.user_id == current_user.id)
+        .order_by(Dream.id)
+    )
+    return StreamingResponse(
+        iter_export(statement, DREAM_EXPORT_FIELDS, _dream_export_record, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers=export_headers("dreams", export_format)
+    )
+
+@router.get("/archive")
+async def download_my_media_archive(
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Download every image and video the current user has generated as a ZIP.
+    The archive is built while it is sent, so the download starts immediately.
+    """
+    return StreamingResponse(
+        iter_user_archive(current_user.id),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="dreams.zip"'}
+    )
+
+@router.get("/search", response_model=DreamSearchPage)
+async def search_my_dreams(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Full-text search over the current user's dream prompts.
+    Results are ranked by relevance; pass next_cursor back to get the next page.
+    """
+    if not search_supported(db.get_bind()):
+        raise HTTPException(status_code=501, detail="Dream search is not available on this database")
+    
+    try:
+        rows, next_cursor = await db.run_sync(search_dreams, current_user.id, q, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    results = [
+        DreamSearchResult(
+            id=row["id"],
+            user_id=row["user_id"],
+            prompt=row["prompt"],
+            image_url=image_url_for(row["image_path"]),
+            created_at=row["created_at"],
+            highlight=render_highlight(row["highlighted"])
+        )
+        for row in rows
+    ]
+    return DreamSearchPage(results=results, next_cursor=next_cursor) 
+
+async def _similar_dreams(db: AsyncSession, user_id: int, prompt: str, limit: int, exclude_id: Optional[int] = None) -> List[DreamSimilarResult]:
+    matches = await run_in_threadpool(_search_similar, user_id, prompt, limit, exclude_id)
+    if not matches:
+        return []
+    
+    dreams = {
+        dream.id: dream
+        for dream in await db.scalars(
+            select(Dream).where(Dream.id.in_([dream_id for dream_id, _ in matches]), Dream.user_id == user_id)
+        )
+    }
+    return [
+        DreamSimilarResult(
+            id=dream.id,
+            user_id=dream.user_id,
+            prompt=dream.prompt,
+            image_url=image_url_for(dream.image_path),
+            created_at=dream.created_at,
+            score=score
+        )
+        for dream_id, score in matches
+        if (dream := dreams.get(dream_id)) is not None
+    ]
+
+@router.get("/similar", response_model=List[DreamSimilarResult])
+async def find_similar_dreams(
+    q: str = Query(..., min_length=1, max_length=1000),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Find the current user's dreams whose prompts are most similar to free text.
+    """
+    return await _similar_dreams(db, current_user.id, q, limit)
+
+@router.get("/{dream_id}/similar", response_model=List[DreamSimilarResult])
+async def find_dreams_like(
+    dream_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Find the current user's dreams most similar to one of their existing dreams.
+    """
+    dream = await db.scalar(select(Dream).where(Dream.id == dream_id, Dream.user_id == current_user.id))
+    if dream is None:
+        raise HTTPException(status_code=404, detail="Dream not found")
+    
+    return await _similar_dreams(db, current_user.id, dream.prompt, limit, exclude_id=dream.id)
\ No newline at end of file
@@ -0,0 +1,62 @@
+from functools import partial
+from pathlib import Path
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import get_db, release_read_transaction
+from app.db.models.dream import Dream
+from app.services.image_variants import VARIANT_FORMATS, get_variant_cache, parse_sizes, render_variant
+from app.services.media_archive import resolve_media
+from app.core.config import settings
+from app.core.security import AuthenticatedUser, get_current_user_optional
+
+router = APIRouter()
+
+# Variants never change once rendered, since generated images are never rewritten
+VARIANT_MAX_AGE = 365 * 24 * 3600
+
+@router.get("/images/{dream_id}")
+async def get_dream_image(
+    dream_id: int,
+    w: Optional[int] = Query(None, description="Maximum width, one of MEDIA_VARIANT_SIZES"),
+    h: Optional[int] = Query(None, description="Maximum height, one of MEDIA_VARIANT_SIZES"),
+    fmt: Optional[Literal["webp", "jpeg", "png"]] = Query(None, description="Output format"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_user_optional)
+):
+    """
+    Get a dream's image, optionally resized to fit w x h and converted to fmt.
+    Only the configured sizes are accepted, and each variant is rendered once
+    and then served from a disk cache. Anonymous dreams are public; others are
+    only visible to their owner.
+    """
+    allowed_sizes = parse_sizes(settings.MEDIA_VARIANT_SIZES)
+    if any(size is not None and size not in allowed_sizes for size in (w, h)):
+        raise HTTPException(
+            status_code=400,
+            detail=f"w and h must be one of {', '.join(map(str, sorted(allowed_sizes)))}"
+        )
+
+    dream = await db.scalar(select(Dream).where(Dream.id == dream_id))
+    await release_read_transaction(db)
+    if dream is None or (dream.user_id is not None and (current_user is None or current_user.id != dream.user_id)):
+        raise HTTPException(status_code=404, detail="Dream not found")
+
+    source = resolve_media(dream.image_path, Path("generated_images").resolve())
+    if source is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    visibility = "public" if dream.user_id is None else "private"
+    headers = {"Cache-Control": f"{visibility}, max-age={VARIANT_MAX_AGE}, immutable"}
+    if w is None and h is None and fmt is None:
+        return FileResponse(source, headers=headers)
+
+    fmt = fmt or source.suffix.lstrip(".").lower().replace("jpg", "jpeg")
+    if fmt not in VARIANT_FORMATS:
+        fmt = "png"
+    key = f"{source.stem}-{w or 0}x{h or 0}.{fmt}"
+    path = await get_variant_cache().get_or_render(key, partial(render_variant, source, w, h, fmt))
+    return FileResponse(path, media_type=VARIANT_FORMATS[fmt][1], headers=headers)
@@ -1,21 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 import logging
 
 from ....db.session import get_db
+from ....db.batch_writer import insert
 from ....db.models.video import Video
 from ....db.schemas.video import VideoRequest, VideoResponse, VideoCreate
 from ....services.video_generation import generate_video
+from ....services.history_export import EXPORT_MEDIA_TYPES, export_headers, iter_export
 from ....core.security import get_current_user_optional
+from ....core.cache import TTLCache, get_cache_version, track_invalidation
+from ....core.config import settings
+from ....core.metrics import observe_stage
+from ....core.scheduler import SchedulerFull, schedule_generation, scheduler_full_exception
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+GALLERY_CACHE_NAME = "video_gallery"
+
+gallery_cache = TTLCache(ttl=settings.GALLERY_CACHE_TTL_SECONDS, maxsize=32, name=GALLERY_CACHE_NAME)
+track_invalidation(Video, GALLERY_CACHE_NAME, gallery_cache)
+# Other workers' inserts are seen through the shared version counter, which is
+# re-read at most every GALLERY_VERSION_CHECK_SECONDS rather than per request
+gallery_version_cache = TTLCache(ttl=settings.GALLERY_VERSION_CHECK_SECONDS, maxsize=1)
+
 @router.post("/", response_model=VideoResponse)
 async def create_video(
+    request: Request,
     video_request: VideoRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user_optional)
 ):
     """
@@ -24,7 +41,9 @@ async def create_video(
     try:
         logger.info(f"Generating video for prompt: {video_request.prompt}")
         
-        result = generate_video(video_request.prompt)
+        result = await schedule_generation(
+            request, current_user, generate_video, video_request.prompt, cost=settings.SCHEDULER_VIDEO_COST
+        )
         
         video_data = VideoCreate(
             prompt=video_request.prompt,
@@ -33,20 +52,22 @@ async def create_video(
             user_id=current_user.id if current_user else None
         )
         
-        db_video = Video(**video_data.model_dump())
-        db.add(db_video)
-        db.commit()
-        db.refresh(db_video)
+        db_video = await insert(db, Video(**video_data.model_dump()))
         
-        return VideoResponse.model_validate(db_video)
+        # Serialized here rather than by FastAPI so the time is measured
+        with observe_stage("serialization"):
+            body = VideoResponse.model_validate(db_video).model_dump_json()
+        return Response(content=body, media_type="application/json")
         
+    except SchedulerFull as e:
+        raise scheduler_full_exception(e)
     except Exception as e:
         logger.error(f"Video generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Video generation failed: {str(e)}")
 
 @router.get("/me", response_model=List[VideoResponse])
 async def get_user_videos(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user_optional)
 ):
     """
@@ -56,16 +77,49 @@ async def get_user_videos(
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    videos = db.query(Video).filter(Video.user_id == current_user.id).order_by(Video.created_at.desc()).all()
+    videos = await db.scalars(select(Video).where(Video.user_id == current_user.id).order_by(Video.created_at.desc()))
     return [VideoResponse.model_validate(video) for video in videos]
 
+VIDEO_EXPORT_FIELDS = ["id", "user_id", "prompt", "video_url", "created_at"]
+
+@router.get("/export")
+async def export_user_videos(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    current_user = Depends(get_current_user_optional)
+):
+    """
+    Stream the current user's complete video history as NDJSON or CSV
+    Requires authentication
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    statement = (
+        select(Video.id, Video.user_id, Video.prompt, Video.video_url, Video.created_at)
+        .where(Video.user_id == current_user.id)
+        .order_by(Video.id)
+    )
+    return StreamingResponse(
+        iter_export(statement, VIDEO_EXPORT_FIELDS, lambda row: dict(row._mapping), export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers=export_headers("videos", export_format)
+    )
+
 @router.get("/", response_model=List[VideoResponse])
 async def get_recent_videos(
-    limit: int = 10,
-    db: Session = Depends(get_db)
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get recent public videos (for gallery/showcase)
+    Results are cached per limit until the TTL expires or a new video is created
     """
-    videos = db.query(Video).order_by(Video.created_at.desc()).limit(limit).all()
-    return [VideoResponse.model_validate(video) for video in videos] 
\ No newline at end of file
+    async def load_recent_videos():
+        videos = await db.scalars(select(Video).order_by(Video.created_at.desc()).limit(limit))
+        return [VideoResponse.model_validate(video) for video in videos]
+
+    async def load_version():
+        return await db.run_sync(get_cache_version, GALLERY_CACHE_NAME)
+
+    version = await gallery_version_cache.get_or_load(GALLERY_CACHE_NAME, load_version)
+    return await gallery_cache.get_or_load(limit, load_recent_videos, version=version) 
\ No newline at end of file
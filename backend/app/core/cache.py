@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from ..db.models.cache_version import CacheVersion
+from .metrics import CACHE_LOOKUPS
+from .tracing import set_attribute
+
+_MISSING = object()
+
+BUMP_VERSION_SQL = text(
+    "INSERT INTO cache_versions (name, version) VALUES (:name, 1) "
+    "ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1"
+)
+
+
+class TTLCache:
+    """
+    Small in-process LRU cache whose entries expire after ``ttl`` seconds.
+
+    Entries can be tagged with a version; a lookup with a different version is
+    treated as a miss, which lets a shared counter invalidate every worker.
+    Lookups are counted per ``name`` in the cache_lookups_total metric and
+    recorded on the current trace span.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 128, name: Optional[str] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = name
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None, version: Optional[int] = None) -> Any:
+        """Return the cached value for key, or default if missing, expired or stale"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, entry_version = entry
+                if expires_at <= time.monotonic() or entry_version != version:
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+        if self.name is not None:
+            result = "miss" if entry is None else "hit"
+            CACHE_LOOKUPS.labels(cache=self.name, result=result).inc()
+            set_attribute(f"cache.{self.name}", result)
+        return default if entry is None else value
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop a single key, or every entry when no key is given"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        version: Optional[int] = None,
+    ) -> Any:
+        """
+        Return the cached value for key, calling loader on a miss.
+
+        Concurrent misses for the same key share a single loader call so an
+        expired entry is only refilled once.
+        """
+        value = self.get(key, _MISSING, version)
+        if value is not _MISSING:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            self.set(key, value, version)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+
+def get_cache_version(db: Session, name: str) -> int:
+    """Read the shared version counter for a cache namespace"""
+    version = db.query(CacheVersion.version).filter(CacheVersion.name == name).scalar()
+    return version or 0
+
+
+def track_invalidation(model: type, name: str, cache: TTLCache) -> None:
+    """
+    Invalidate cache whenever a new instance of model is committed.
+
+    The shared version counter is bumped inside the inserting transaction so
+    other workers see the change; the local cache is cleared after commit.
+    """
+    pending_key = f"cache_invalidate:{name}"
+
+    @event.listens_for(Session, "after_flush")
+    def _bump_version(session, flush_context):
+        if any(isinstance(obj, model) for obj in session.new):
+            session.connection().execute(BUMP_VERSION_SQL, {"name": name})
+            session.info[pending_key] = True
+
+    @event.listens_for(Session, "after_commit")
+    def _invalidate_local(session):
+        if session.info.pop(pending_key, False):
+            cache.invalidate()
+
+    @event.listens_for(Session, "after_rollback")
+    def _discard_pending(session):
+        session.info.pop(pending_key, None)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Response compression middleware and static files with precompressed variants
+"""
+
+import gzip
+import mimetypes
+import os
+import stat
+import sys
+import time
+import zlib
+from typing import Iterable, List, Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import (
+    COMPRESSION_CPU_SECONDS,
+    COMPRESSION_INPUT_BYTES,
+    COMPRESSION_OUTPUT_BYTES,
+    PRECOMPRESSED_RESPONSES,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "application/manifest+json",
+    "image/svg+xml",
+}
+
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """
+    Only text-like media types are worth compressing; images, video and
+    archives are already compressed and are always passed through untouched.
+    """
+    if not content_type:
+        return False
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def negotiate_encodings(accept_encoding: str, available: Iterable[str]) -> List[str]:
+    """Return the available encodings the client accepts, in server preference order"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if token:
+            weights[token.strip().lower()] = quality
+    default = weights.get("*", 0.0)
+    return [encoding for encoding in available if weights.get(encoding, default) > 0]
+
+
+class _Compressor:
+    """Incremental gzip or brotli encoder that records size and CPU metrics"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._encoder = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._encoder = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        started = time.thread_time()
+        if self.encoding == "br":
+            output = self._encoder.process(data)
+            output += self._encoder.finish() if final else self._encoder.flush()
+        else:
+            output = self._encoder.compress(data)
+            output += self._encoder.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        COMPRESSION_CPU_SECONDS.labels(self.encoding).inc(time.thread_time() - started)
+        COMPRESSION_INPUT_BYTES.labels(self.encoding).inc(len(data))
+        COMPRESSION_OUTPUT_BYTES.labels(self.encoding).inc(len(output))
+        return output
+
+
+class CompressionMiddleware:
+    """
+    Compress text-like responses with brotli or gzip, negotiated per request.
+
+    Small bodies below ``minimum_size`` are sent as-is, and streaming responses
+    are compressed chunk by chunk so they keep streaming.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.available = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encodings = negotiate_encodings(Headers(scope=scope).get("accept-encoding", ""), self.available)
+        if not encodings:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(send, encodings[0], self)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, middleware: CompressionMiddleware):
+        self._send = send
+        self.encoding = encoding
+        self.middleware = middleware
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or "content-range" in headers
+                or message["status"] in (204, 206, 304)
+                or not is_compressible(headers.get("content-type"))
+            )
+            if self.passthrough:
+                await self._send(message)
+            else:
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            body = self.compressor.compress(body, final=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self._send(start)
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        await self._send({
+            "type": "http.response.body",
+            "body": self.compressor.compress(body, final=not more_body),
+            "more_body": more_body,
+        })
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves ``<file>.br`` or ``<file>.gz`` siblings when they
+    exist and the client accepts that encoding, so nothing is compressed per
+    request.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        media_type, _ = mimetypes.guess_type(path)
+        if scope["method"] in ("GET", "HEAD") and is_compressible(media_type):
+            accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+            for encoding in negotiate_encodings(accept_encoding, PRECOMPRESSED_SUFFIXES):
+                full_path, stat_result = await anyio.to_thread.run_sync(
+                    self.lookup_path, path + PRECOMPRESSED_SUFFIXES[encoding]
+                )
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    PRECOMPRESSED_RESPONSES.labels(encoding).inc()
+                    return self.precompressed_response(full_path, stat_result, scope, media_type, encoding)
+
+        response = await super().get_response(path, scope)
+        if is_compressible(media_type):
+            response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+    def precompressed_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        media_type: str,
+        encoding: str,
+    ) -> Response:
+        response = FileResponse(
+            full_path,
+            stat_result=stat_result,
+            method=scope["method"],
+            media_type=media_type,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress_directory(directory: str, brotli_quality: int = 11, gzip_level: int = 9) -> int:
+    """Write .gz (and .br when brotli is installed) siblings for compressible files"""
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith((".gz", ".br")) or not is_compressible(mimetypes.guess_type(name)[0]):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(path + ".gz", "wb") as f:
+                f.write(gzip.compress(data, compresslevel=gzip_level, mtime=0))
+            written += 1
+            if brotli is not None:
+                with open(path + ".br", "wb") as f:
+                    f.write(brotli.compress(data, quality=brotli_quality))
+                written += 1
+    return written
+
+
+if __name__ == "__main__":
+    for target in sys.argv[1:]:
+        print(f"{target}: wrote {precompress_directory(target)} precompressed files")
@@ -1,5 +1,20 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
+import math
+
+# Scheduler tiers every deployment needs a weight for
+ANONYMOUS_TIER = "anonymous"
+USER_TIER = "user"
+
+def parse_pairs(text: str) -> Dict[str, str]:
+    """"a=1,b=2" -> {"a": "1", "b": "2"}"""
+    pairs = {}
+    for item in text.split(","):
+        key, _, value = item.partition("=")
+        if key.strip():
+            pairs[key.strip()] = value.strip()
+    return pairs
 
 class Settings(BaseSettings):
     DATABASE_URL: str
@@ -7,6 +22,94 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     MODEL_PATH: Optional[str] = None
+    DB_INIT_ON_STARTUP: bool = True
+    WARM_STATE: bool = False
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    WRITE_BATCH_ENABLED: bool = False
+    WRITE_BATCH_INTERVAL_MS: float = 5.0
+    WRITE_BATCH_MAX_SIZE: int = 64
+    GALLERY_CACHE_TTL_SECONDS: float = 30.0
+    GALLERY_VERSION_CHECK_SECONDS: float = 1.0
+    AUTH_CACHE_ENABLED: bool = True
+    AUTH_CACHE_TTL_SECONDS: float = 30.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CLAIMS_MODE: bool = False
+    BCRYPT_ROUNDS: int = 12
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_MAX_CONCURRENCY: int = 4
+    SCHEDULER_PER_CLIENT_CONCURRENCY: int = 1
+    SCHEDULER_MAX_QUEUE: int = 64
+    SCHEDULER_PER_CLIENT_QUEUE: int = 8
+    SCHEDULER_TIER_WEIGHTS: str = "anonymous=1,user=4"
+    SCHEDULER_USER_TIERS: str = ""
+    SCHEDULER_VIDEO_COST: float = 4.0
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+    LOGIN_RATE_LIMIT_ENABLED: bool = True
+    LOGIN_RATE_LIMIT_PER_IP: int = 20
+    LOGIN_RATE_LIMIT_PER_ACCOUNT: int = 10
+    LOGIN_RATE_LIMIT_WINDOW_SECONDS: float = 60.0
+    LOGIN_RATE_LIMIT_DB: Optional[str] = None
+    DREAM_INDEX_DIR: str = "dream_index"
+    IMAGE_DEDUP_ENABLED: bool = False
+    IMAGE_DEDUP_HASH: str = "dhash"
+    IMAGE_DEDUP_MAX_DISTANCE: int = 4
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    FRONTEND_DIST_DIR: Optional[str] = None
+    MEDIA_DELIVERY: str = "python"
+    MEDIA_ACCEL_PREFIX: str = "/_media"
+    MEDIA_AUTHORIZE: bool = False
+    MEDIA_VARIANT_SIZES: str = "64,128,256,512"
+    MEDIA_VARIANT_CACHE_DIR: str = "image_variants"
+    MEDIA_VARIANT_CACHE_MAX_MB: int = 256
+    HUGGINGFACE_API_URL: str = "https://api-inference.huggingface.co/models/runwayml/stable-diffusion-v1-5"
+    POLLINATIONS_API_URL: str = "https://image.pollinations.ai/prompt/"
+    IMAGE_PROVIDER: str = "auto"
+    SIMULATED_PROVIDER_SEED: int = 0
+    SIMULATED_PROVIDER_LATENCY_MS: float = 300.0
+    SIMULATED_PROVIDER_LATENCY_SIGMA: float = 0.0
+    SIMULATED_PROVIDER_FAILURE_RATE: float = 0.0
+    SIMULATED_PROVIDER_UNAVAILABLE_RATE: float = 0.0
+    SIMULATED_PROVIDER_IMAGE_SIZE: int = 512
+    SIMULATED_PROVIDER_PATTERN: str = ""
+    PROFILING_ENABLED: bool = False
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MODE: str = "sampling"
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_PATHS: str = "/api/v1/dreams/,/api/v1/videos/"
+    PROFILING_TOKEN: Optional[str] = None
+    PROFILING_INTERVAL_MS: float = 5.0
+    TRACING_EXPORTER: str = "none"
+    TRACING_FILE: str = "traces/spans.jsonl"
+
+    @model_validator(mode="after")
+    def check_scheduler_tiers(self):
+        """Reject tier weights and user tiers the scheduler could not use, at startup rather than per job"""
+        weights = parse_pairs(self.SCHEDULER_TIER_WEIGHTS)
+        for tier, weight in weights.items():
+            try:
+                value = float(weight)
+            except ValueError:
+                raise ValueError(f"SCHEDULER_TIER_WEIGHTS: weight of tier {tier!r} is not a number: {weight!r}")
+            if not (value > 0 and math.isfinite(value)):
+                raise ValueError(f"SCHEDULER_TIER_WEIGHTS: weight of tier {tier!r} must be positive, got {weight!r}")
+        missing = {ANONYMOUS_TIER, USER_TIER} - set(weights)
+        if missing:
+            raise ValueError(f"SCHEDULER_TIER_WEIGHTS has no weight for tiers {sorted(missing)}")
+        unknown = set(parse_pairs(self.SCHEDULER_USER_TIERS).values()) - set(weights)
+        if unknown:
+            raise ValueError(f"SCHEDULER_USER_TIERS uses tiers without a weight: {sorted(unknown)}")
+        return self
 
     class Config:
         env_file = ".env"
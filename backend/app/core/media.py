@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Static media delivery that hands the byte transfer to the server or a proxy
+"""
+
+import logging
+import mimetypes
+import os
+import posixpath
+import stat
+from typing import Awaitable, Callable, Optional
+from urllib.parse import quote
+
+import anyio
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import select
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Receive, Scope, Send
+
+from .compression import PrecompressedStaticFiles, is_compressible
+from .metrics import MEDIA_DELIVERIES
+from .security import principal_from_token
+from ..db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_MODES = ("python", "sendfile", "x-accel", "x-sendfile")
+# ASGI extensions a server advertises in scope["extensions"] when it can send
+# a file itself; zerocopysend is the os.sendfile one
+ZERO_COPY_EXTENSIONS = ("http.response.zerocopysend", "http.response.pathsend")
+
+
+# Decides whether the request in scope may read the file at a mount-relative path
+MediaAuthorizer = Callable[[str, Scope], Awaitable[bool]]
+
+
+def owner_authorizer(model, path_column: str, media_dir: str) -> MediaAuthorizer:
+    """
+    Allow a file when a row of model pointing at it is anonymous or owned by
+    the bearer of the request's token, the rule GET /api/v1/media/images uses.
+    Files no row points at are refused.
+
+    Rows store the path relative to the backend directory
+    (``generated_images/<name>``), so the lookup is one exact match on the
+    indexed path column.
+    """
+    column = getattr(model, path_column)
+
+    async def authorize(path: str, scope: Scope) -> bool:
+        name = posixpath.normpath(path.replace(os.sep, "/"))
+        if name.startswith(("../", "/")) or name in ("..", "."):
+            return False
+        async with AsyncSessionLocal() as db:
+            owners = set((await db.scalars(
+                select(model.user_id).where(column == f"{media_dir}/{name}")
+            )).all())
+            if not owners:
+                return False
+            if None in owners:
+                return True
+            scheme, token = get_authorization_scheme_param(Headers(scope=scope).get("authorization"))
+            principal = await principal_from_token(db, token if scheme.lower() == "bearer" else None)
+        return principal is not None and principal.id in owners
+
+    return authorize
+
+
+def zero_copy_extension(scope: Scope):
+    """The zero-copy ASGI extension the server supports, if any"""
+    extensions = scope.get("extensions") or {}
+    return next((name for name in ZERO_COPY_EXTENSIONS if name in extensions), None)
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """FileResponse whose body is sent by the server (os.sendfile) instead of read in Python"""
+
+    def __init__(self, *args, extension: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.extension = extension
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.extension == "http.response.zerocopysend":
+            with open(self.path, "rb") as file:
+                await send({"type": self.extension, "file": file, "count": self.stat_result.st_size})
+        else:
+            await send({"type": self.extension, "path": os.path.abspath(self.path)})
+        if self.background is not None:
+            await self.background()
+
+
+class MediaFiles(PrecompressedStaticFiles):
+    """
+    Static files for generated media with a choice of delivery mode.
+
+    ``python`` streams the file from the worker as StaticFiles does.
+    ``sendfile`` lets the ASGI server send it with os.sendfile when it supports
+    the zerocopysend or pathsend extension, and streams it otherwise.
+    ``x-accel`` and ``x-sendfile`` only resolve the file and answer with an
+    ``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache, lighttpd) header;
+    the proxy in front sends the bytes. ``accel_prefix`` is the internal nginx
+    location that maps to ``directory``.
+
+    With an ``authorize`` callback every request is checked before any of
+    these hand-offs; refused files get the same 404 as missing ones, and
+    allowed ones are marked ``Cache-Control: private``.
+    """
+
+    def __init__(
+        self,
+        *args,
+        mode: str = "python",
+        accel_prefix: str = "",
+        authorize: Optional[MediaAuthorizer] = None,
+        **kwargs,
+    ):
+        if mode not in DELIVERY_MODES:
+            raise ValueError(f"Unknown MEDIA_DELIVERY {mode!r}, expected one of {DELIVERY_MODES}")
+        super().__init__(*args, **kwargs)
+        self.mode = mode
+        self.accel_prefix = accel_prefix.rstrip("/")
+        self.authorize = authorize
+        self._warned = False
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if self.authorize is None:
+            return await self._deliver(path, scope)
+        if not await self.authorize(path, scope):
+            raise HTTPException(status_code=404)
+        response = await self._deliver(path, scope)
+        response.headers["Cache-Control"] = "private"
+        return response
+
+    async def _deliver(self, path: str, scope: Scope) -> Response:
+        media_type, _ = mimetypes.guess_type(path)
+        if self.mode == "python" or scope["method"] not in ("GET", "HEAD") or is_compressible(media_type):
+            # Text-like files keep their precompressed variants
+            MEDIA_DELIVERIES.labels("python").inc()
+            return await super().get_response(path, scope)
+
+        full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        if not (stat_result and stat.S_ISREG(stat_result.st_mode)):
+            # Let StaticFiles produce its usual 404/405
+            return await super().get_response(path, scope)
+
+        if self.mode == "x-accel":
+            MEDIA_DELIVERIES.labels(self.mode).inc()
+            target = f"{self.accel_prefix}/{quote(path.replace(os.sep, '/'))}"
+            return Response(headers={"X-Accel-Redirect": target}, media_type=media_type)
+        if self.mode == "x-sendfile":
+            MEDIA_DELIVERIES.labels(self.mode).inc()
+            return Response(headers={"X-Sendfile": os.path.abspath(full_path)}, media_type=media_type)
+
+        extension = zero_copy_extension(scope)
+        if extension is None or scope["method"] == "HEAD":
+            if extension is None and not self._warned:
+                logger.warning("MEDIA_DELIVERY=sendfile but the server supports neither zerocopysend nor pathsend; streaming from Python")
+                self._warned = True
+            MEDIA_DELIVERIES.labels("python").inc()
+            return await super().get_response(path, scope)
+
+        MEDIA_DELIVERIES.labels(self.mode).inc()
+        response = ZeroCopyFileResponse(
+            full_path, stat_result=stat_result, method=scope["method"], media_type=media_type, extension=extension
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
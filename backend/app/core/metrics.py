@@ -0,0 +1,146 @@
+import os
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from .tracing import span
+
+COMPRESSION_INPUT_BYTES = Counter(
+    "http_compression_input_bytes_total",
+    "Uncompressed response bytes passed through the compression middleware",
+    ["encoding"],
+)
+COMPRESSION_OUTPUT_BYTES = Counter(
+    "http_compression_output_bytes_total",
+    "Compressed response bytes sent by the compression middleware",
+    ["encoding"],
+)
+COMPRESSION_CPU_SECONDS = Counter(
+    "http_compression_cpu_seconds_total",
+    "Thread CPU time spent compressing responses",
+    ["encoding"],
+)
+PRECOMPRESSED_RESPONSES = Counter(
+    "static_precompressed_responses_total",
+    "Static files served from a precompressed sibling",
+    ["encoding"],
+)
+MEDIA_DELIVERIES = Counter(
+    "static_media_deliveries_total",
+    "Generated images and videos served, by how the bytes were sent",
+    ["mode"],
+)
+
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "password_hash_in_flight",
+    "Password hash/verify jobs running or waiting in the bcrypt pool",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "password_hash_queue_depth",
+    "Password hash/verify jobs waiting for a free bcrypt pool thread",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total",
+    "Password hash/verify jobs rejected because the bcrypt queue was full",
+)
+LOGIN_THROTTLED = Counter(
+    "login_throttled_total",
+    "Login attempts rejected by the rate limiter before password hashing",
+    ["scope"],
+)
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    "dream_pipeline_stage_seconds",
+    "Time spent in each stage of dream and video creation",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+PROVIDER_REQUESTS = Counter(
+    "media_provider_requests_total",
+    "Image and video generation attempts per provider and outcome",
+    ["provider", "outcome"],
+)
+PLACEHOLDER_FALLBACKS = Counter(
+    "media_placeholder_fallbacks_total",
+    "Images and videos rendered as placeholders because the provider failed",
+    ["provider"],
+)
+IMAGE_DEDUP_RESULTS = Counter(
+    "media_image_dedup_total",
+    "Generated images stored as new files or replaced by a near-duplicate already on disk",
+    ["result"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "In-process cache lookups per cache and result",
+    ["cache", "result"],
+)
+GENERATIONS_IN_FLIGHT = Gauge(
+    "media_generations_in_flight",
+    "Image and video generations currently running",
+    ["kind"],
+    multiprocess_mode="livesum",
+)
+WRITE_BATCH_QUEUE_DEPTH = Gauge(
+    "write_batch_queue_depth",
+    "Inserts waiting for the group-commit writer",
+    multiprocess_mode="livesum",
+)
+GENERATION_QUEUE_DEPTH = Gauge(
+    "generation_queue_depth",
+    "Generation jobs waiting in the fair-share scheduler",
+    multiprocess_mode="livesum",
+)
+GENERATION_REJECTED = Counter(
+    "generation_rejected_total",
+    "Generation requests rejected with 429 because the scheduler queue was full",
+    ["scope"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str, **attributes):
+    """
+    Time one pipeline stage into PIPELINE_STAGE_SECONDS and trace it as a
+    span; the span is yielded so the stage can add attributes
+    """
+    with PIPELINE_STAGE_SECONDS.labels(stage=stage).time(), span(stage, **attributes) as stage_span:
+        yield stage_span
+
+
+def prepare_multiprocess_dir(path: str) -> None:
+    """
+    Empty the directory shared by worker processes for their metric files.
+
+    Must run before the workers start; files left by a previous run would
+    otherwise be added to the new totals.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+
+
+def mark_worker_dead(pid: int) -> None:
+    """Drop the live gauges of a worker that exited (multiprocess mode only)"""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        multiprocess.mark_process_dead(pid, path)
+
+
+def render_metrics() -> tuple:
+    """
+    Render every metric in the Prometheus text format.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (multiple uvicorn workers) the values
+    of all worker processes are aggregated from that directory.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,111 @@
+"""
+Prefork server: warm shared state once, then fork uvicorn workers.
+
+`uvicorn.run(..., workers=N)` spawns fresh interpreters, so each worker
+imports the app and loads its own copy of every font, index and model. Here
+the parent loads that state (app.core.warm_state), binds the listening
+socket and forks; the workers share the warmed pages copy-on-write and
+accept connections from the inherited socket. The parent only supervises,
+restarting workers that die and passing SIGTERM/SIGINT on to them.
+"""
+
+import gc
+import logging
+import os
+import signal
+import time
+from typing import Dict
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# A worker dying sooner than this after its start is restarted with a delay
+MIN_WORKER_UPTIME = 1.0
+
+
+def _run_worker(worker_id: int, config: uvicorn.Config, sock) -> None:
+    os.environ["PREFORK_WORKER_ID"] = str(worker_id)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    from ..db.session import async_engine, engine
+
+    # Pooled connections belong to the parent; drop them without closing
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(worker_id: int, config: uvicorn.Config, sock) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        _run_worker(worker_id, config, sock)
+    except BaseException:
+        logger.exception(f"Prefork worker {worker_id} crashed")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve_prefork(host: str, port: int, workers: int, log_level: str = "info", access_log: bool = True) -> None:
+    """Warm up, fork `workers` uvicorn servers on one socket and supervise them"""
+    from .metrics import mark_worker_dead
+    from .warm_state import memory_usage, warm_up
+
+    state = warm_up()
+    from ..main import app
+
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level, access_log=access_log)
+    sock = config.bind_socket()
+    logger.info(f"Warm state loaded in parent {os.getpid()}: {state}")
+    logger.info(f"Parent memory before fork: {memory_usage()}")
+
+    # Move everything loaded so far out of the collector's generations, so
+    # collections in the workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}
+    started: Dict[int, float] = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker_id in range(workers):
+        children[_spawn(worker_id, config, sock)] = worker_id
+        started[worker_id] = time.monotonic()
+    logger.info(f"Started {workers} prefork workers: {sorted(children)}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = children.pop(pid, None)
+        mark_worker_dead(pid)
+        if worker_id is None or stopping:
+            continue
+        logger.warning(f"Prefork worker {worker_id} (pid {pid}) exited with status {status}, restarting")
+        if time.monotonic() - started[worker_id] < MIN_WORKER_UPTIME:
+            time.sleep(MIN_WORKER_UPTIME)
+        if stopping:
+            continue
+        children[_spawn(worker_id, config, sock)] = worker_id
+        started[worker_id] = time.monotonic()
+
+    sock.close()
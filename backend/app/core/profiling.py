@@ -0,0 +1,211 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries the configured token in
+``X-Profile-Token`` or is picked by the sampling rule. Sampling profiles are
+written as collapsed stacks (``<request id>.collapsed``, one ``a;b;c count``
+line per stack, readable by flamegraph.pl and speedscope); deterministic
+profiles are cProfile dumps (``<request id>.prof``). The middleware is only
+installed when PROFILING_ENABLED is set, so it costs nothing otherwise.
+"""
+
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sampling", "deterministic")
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Frames from the outermost call to frame, joined by ';'"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Record the stacks of a set of threads every ``interval`` seconds from a background thread.
+
+    Requests are served on the event loop thread, so the samples also include
+    whatever else that worker was running at the same time. Threads doing
+    work for the request, such as generation jobs, are added while they run
+    it with ``sampled_thread()``.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._extra_threads: Counter = Counter()
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def add_thread(self, thread_id: int) -> None:
+        with self._threads_lock:
+            self._extra_threads[thread_id] += 1
+
+    def remove_thread(self, thread_id: int) -> None:
+        with self._threads_lock:
+            self._extra_threads[thread_id] -= 1
+            if not self._extra_threads[thread_id]:
+                del self._extra_threads[thread_id]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                thread_ids = {self.thread_id, *self._extra_threads}
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[collapse_stack(frame)] += 1
+
+
+# Sampler of the request being profiled, inherited by work it hands to other threads
+_current_sampler: ContextVar[Optional[StackSampler]] = ContextVar("profile_sampler", default=None)
+
+
+@contextmanager
+def sampled_thread():
+    """Include the calling thread in the current request's sampling profile, if it has one"""
+    sampler = _current_sampler.get()
+    if sampler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    sampler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        sampler.remove_thread(thread_id)
+
+
+def write_collapsed(samples: Counter, path: str) -> None:
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """
+    Profile selected requests and save one profile file per request id.
+
+    The request id comes from a valid ``X-Request-ID`` header or is generated,
+    and is returned in ``X-Profile-Id``. One request is profiled at a time per
+    worker; others arriving meanwhile run unprofiled.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        output_dir: str = "profiles",
+        sample_rate: float = 0.0,
+        paths: Iterable[str] = (),
+        token: Optional[str] = None,
+        mode: str = "sampling",
+        interval: float = 0.005,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {PROFILE_MODES}")
+        self.app = app
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.paths = tuple(paths)
+        self.token = token
+        self.mode = mode
+        self.interval = interval
+        self._busy = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def select_mode(self, scope: Scope) -> Optional[str]:
+        """Profiling mode for this request, or None to run it unprofiled"""
+        headers = Headers(scope=scope)
+        supplied = headers.get("x-profile-token")
+        if supplied is not None and self.token and hmac.compare_digest(supplied, self.token):
+            requested = headers.get("x-profile-mode")
+            return requested if requested in PROFILE_MODES else self.mode
+        if self.sample_rate > 0 and scope["path"].startswith(self.paths) and random.random() < self.sample_rate:
+            return self.mode
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = self.select_mode(scope)
+        if mode is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        try:
+            supplied_id = Headers(scope=scope).get("x-request-id", "")
+            request_id = supplied_id if REQUEST_ID_PATTERN.match(supplied_id) else uuid.uuid4().hex
+
+            async def send_with_id(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).append("X-Profile-Id", request_id)
+                await send(message)
+
+            if mode == "deterministic":
+                await self._run_deterministic(scope, receive, send_with_id, request_id)
+            else:
+                await self._run_sampling(scope, receive, send_with_id, request_id)
+        finally:
+            self._busy.release()
+
+    async def _run_sampling(self, scope: Scope, receive: Receive, send: Send, request_id: str) -> None:
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        token = _current_sampler.set(sampler)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_sampler.reset(token)
+            samples = sampler.stop()
+            path = os.path.join(self.output_dir, f"{request_id}.collapsed")
+            await anyio.to_thread.run_sync(write_collapsed, samples, path)
+            logger.info(f"Wrote sampling profile of {scope['method']} {scope['path']} to {path}")
+
+    async def _run_deterministic(self, scope: Scope, receive: Receive, send: Send, request_id: str) -> None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.disable()
+            path = os.path.join(self.output_dir, f"{request_id}.prof")
+            await anyio.to_thread.run_sync(profiler.dump_stats, path)
+            logger.info(f"Wrote deterministic profile of {scope['method']} {scope['path']} to {path}")
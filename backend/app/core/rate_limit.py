@@ -0,0 +1,234 @@
+"""
+Sliding-window rate limiting for the login endpoint
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+
+class MemoryWindowStore:
+    """
+    Per-process attempt counts: key -> (window index, previous count, current count).
+    Least recently used keys are dropped beyond max_keys.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._counts: "OrderedDict[str, Tuple[int, int, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _counts_for(self, key: str, window: int) -> Tuple[int, int]:
+        entry = self._counts.get(key)
+        if entry is None:
+            return 0, 0
+        index, previous, current = entry
+        if index == window:
+            return previous, current
+        if index == window - 1:
+            return current, 0
+        return 0, 0
+
+    def counts(self, key: str, window: int) -> Tuple[int, int]:
+        """Attempts in the previous and current window"""
+        with self._lock:
+            return self._counts_for(key, window)
+
+    def increment(self, key: str, window: int, amount: int = 1) -> None:
+        with self._lock:
+            entry = self._counts.get(key)
+            if amount < 0 and (entry is None or entry[0] != window):
+                return
+            previous, current = self._counts_for(key, window)
+            self._counts[key] = (window, previous, max(0, current + amount))
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_keys:
+                self._counts.popitem(last=False)
+
+    @contextmanager
+    def transaction(self):
+        """Make the counts read and increments done inside atomic"""
+        with self._lock:
+            yield
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+class SQLiteWindowStore:
+    """
+    Attempt counts in a shared SQLite file, so limits hold across worker processes
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = self._connect()
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_windows ("
+            "key TEXT NOT NULL, window INTEGER NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (key, window)) WITHOUT ROWID"
+        )
+        self._lock = threading.RLock()
+        self._writes = 0
+        if hasattr(os, "register_at_fork"):
+            # An SQLite connection must not be used across fork (prefork workers)
+            store = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: store() is not None and store()._reopen())
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reopen(self) -> None:
+        self._lock = threading.RLock()
+        self._connection = self._connect()
+
+    def counts(self, key: str, window: int) -> Tuple[int, int]:
+        with self._lock:
+            rows = dict(self._connection.execute(
+                "SELECT window, count FROM rate_limit_windows WHERE key = ? AND window IN (?, ?)",
+                (key, window - 1, window),
+            ).fetchall())
+        return rows.get(window - 1, 0), rows.get(window, 0)
+
+    def increment(self, key: str, window: int, amount: int = 1) -> None:
+        with self._lock:
+            if amount < 0:
+                self._connection.execute(
+                    "UPDATE rate_limit_windows SET count = MAX(count + ?, 0) WHERE key = ? AND window = ?",
+                    (amount, key, window),
+                )
+                return
+            self._connection.execute(
+                "INSERT INTO rate_limit_windows (key, window, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (key, window) DO UPDATE SET count = count + excluded.count",
+                (key, window, amount),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._connection.execute("DELETE FROM rate_limit_windows WHERE window < ?", (window - 1,))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Make the counts read and increments done inside atomic across
+        processes: BEGIN IMMEDIATE takes the write lock before the first read,
+        so two workers cannot both see a count under the limit
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM rate_limit_windows")
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding-window counter.
+
+    The previous fixed window is weighted by how much of it still overlaps the
+    sliding window, which needs two counters per key instead of a timestamp
+    per attempt.
+    """
+
+    def __init__(self, limit: int, window_seconds: float, store=None):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.store = store if store is not None else MemoryWindowStore()
+
+    def _window(self, now: float) -> Tuple[int, float]:
+        index = int(now // self.window_seconds)
+        return index, now - index * self.window_seconds
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        """Seconds until another attempt is allowed for key (0 when allowed now)"""
+        now = time.time() if now is None else now
+        window, elapsed = self._window(now)
+        previous, current = self.store.counts(key, window)
+        remaining = 1 - elapsed / self.window_seconds
+        if previous * remaining + current + 1 <= self.limit:
+            return 0.0
+        if current + 1 > self.limit or previous == 0:
+            return self.window_seconds - elapsed
+        # Wait until the weighted previous window has decayed enough
+        excess = previous * remaining + current + 1 - self.limit
+        return min(excess / previous * self.window_seconds, self.window_seconds - elapsed)
+
+    def hit(self, key: str, now: Optional[float] = None) -> None:
+        """Record one attempt for key"""
+        now = time.time() if now is None else now
+        self.store.increment(key, self._window(now)[0])
+
+    def release(self, key: str, now: float) -> None:
+        """Take back an attempt recorded at now"""
+        self.store.increment(key, self._window(now)[0], -1)
+
+
+class LoginThrottle:
+    """
+    Per-IP and per-account limits on failed logins, sharing one store.
+
+    An attempt is counted by check before the password is verified, so a
+    burst of concurrent guesses cannot all pass under the limit, and given
+    back with release once the login works, so only failures add up.
+    """
+
+    def __init__(self, ip_limit: int, account_limit: int, window_seconds: float, store=None):
+        store = store if store is not None else MemoryWindowStore()
+        self.store = store
+        self.ip = SlidingWindowLimiter(ip_limit, window_seconds, store)
+        self.account = SlidingWindowLimiter(account_limit, window_seconds, store)
+
+    def check(self, ip: Optional[str], account: str, now: Optional[float] = None) -> Tuple[Optional[str], int]:
+        """
+        Record a login attempt unless a limit is exceeded.
+        Returns (None, 0) when allowed, or the limiting scope and Retry-After seconds.
+        """
+        now = time.time() if now is None else now
+        keys = self._keys(ip, account)
+        with self.store.transaction():
+            for scope, key, limiter in keys:
+                wait = limiter.retry_after(key, now)
+                if wait > 0:
+                    return scope, max(1, math.ceil(wait))
+            for _, key, limiter in keys:
+                limiter.hit(key, now)
+        return None, 0
+
+    def release(self, ip: Optional[str], account: str, now: float) -> None:
+        """Un-count an attempt allowed by check(ip, account, now) that did not fail"""
+        with self.store.transaction():
+            for _, key, limiter in self._keys(ip, account):
+                limiter.release(key, now)
+
+    def _keys(self, ip: Optional[str], account: str):
+        return (("ip", f"ip:{ip or 'unknown'}", self.ip), ("account", f"account:{account.strip().lower()}", self.account))
+
+
+def build_login_throttle(settings) -> LoginThrottle:
+    """Login throttle configured from settings, shared across workers when LOGIN_RATE_LIMIT_DB is set"""
+    store = SQLiteWindowStore(settings.LOGIN_RATE_LIMIT_DB) if settings.LOGIN_RATE_LIMIT_DB else MemoryWindowStore()
+    return LoginThrottle(
+        ip_limit=settings.LOGIN_RATE_LIMIT_PER_IP,
+        account_limit=settings.LOGIN_RATE_LIMIT_PER_ACCOUNT,
+        window_seconds=settings.LOGIN_RATE_LIMIT_WINDOW_SECONDS,
+        store=store,
+    )
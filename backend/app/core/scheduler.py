@@ -0,0 +1,235 @@
+"""
+Fair-share scheduling and admission control for image and video generation
+"""
+
+import asyncio
+import contextvars
+import itertools
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from .config import ANONYMOUS_TIER, USER_TIER, parse_pairs, settings
+from .metrics import GENERATION_QUEUE_DEPTH, GENERATION_REJECTED, PIPELINE_STAGE_SECONDS
+from .profiling import sampled_thread
+
+
+class SchedulerFull(Exception):
+    """Raised when a generation job cannot be queued"""
+
+    def __init__(self, scope: str, retry_after: int):
+        super().__init__(f"Generation queue full ({scope})")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Job:
+    client: str
+    func: Callable[..., Any]
+    args: tuple
+    start: float
+    finish: float
+    future: asyncio.Future
+    sequence: int
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of blocking generation jobs across clients.
+
+    Every client (a user, or an anonymous IP address) has its own FIFO queue.
+    A job is tagged with a virtual finish time of
+    ``max(virtual time, client's last finish) + cost / weight``, and whenever
+    a slot is free the queued head job with the smallest tag runs next. A
+    client with weight 4 therefore gets four times the share of a weight 1
+    client while both are busy, and a client flooding the queue only delays
+    itself. At most ``max_concurrency`` jobs run at once (in a thread pool, so
+    they never block the event loop), and at most ``per_client_concurrency``
+    per client. Jobs beyond ``max_queue`` waiting in total, or
+    ``per_client_queue`` for one client, are rejected with SchedulerFull
+    instead of queueing up unbounded latency. Tier weights are checked here
+    and tier names when settings load, so run() trusts the tier it is given.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        per_client_concurrency: int = 1,
+        max_queue: int = 64,
+        per_client_queue: int = 8,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_client_concurrency = per_client_concurrency
+        self.max_queue = max_queue
+        self.per_client_queue = per_client_queue
+        self.weights = weights or {ANONYMOUS_TIER: 1.0, USER_TIER: 4.0}
+        for tier, weight in self.weights.items():
+            if not (weight > 0 and math.isfinite(weight)):
+                raise ValueError(f"Weight of scheduler tier {tier!r} must be positive, got {weight!r}")
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="generation")
+        self._queues: Dict[str, Deque[_Job]] = {}
+        self._running: Dict[str, int] = {}
+        self._last_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._queued = 0
+        self._total_running = 0
+        # Moving average of job duration, for Retry-After
+        self._job_seconds = 1.0
+        self._sequence = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        return self._total_running
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog has likely drained"""
+        backlog = self._queued + self._total_running
+        return max(1, math.ceil(self._job_seconds * backlog / self.max_concurrency))
+
+    def _reject(self, scope: str) -> SchedulerFull:
+        GENERATION_REJECTED.labels(scope=scope).inc()
+        return SchedulerFull(scope, self.retry_after())
+
+    async def run(self, client: str, tier: str, func: Callable[..., Any], *args, cost: float = 1.0) -> Any:
+        """Queue func(*args) for client and return its result once it has run"""
+        queue = self._queues.get(client)
+        if self._queued >= self.max_queue:
+            raise self._reject("global")
+        if queue is not None and len(queue) >= self.per_client_queue:
+            raise self._reject("client")
+
+        if len(self._last_finish) > 4 * self.max_queue:
+            self._forget_idle_clients()
+        start = max(self._virtual_time, self._last_finish.get(client, 0.0))
+        finish = start + cost / self.weights[tier]
+        self._last_finish[client] = finish
+        job = _Job(client, func, args, start, finish, asyncio.get_running_loop().create_future(), next(self._sequence))
+        self._queues.setdefault(client, deque()).append(job)
+        self._queued += 1
+        GENERATION_QUEUE_DEPTH.inc()
+        self._dispatch()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # Client went away before the job started: drop it from the queue
+            queue = self._queues.get(client)
+            if queue is not None and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[client]
+                self._queued -= 1
+                GENERATION_QUEUE_DEPTH.dec()
+            raise
+
+    def _forget_idle_clients(self) -> None:
+        """Drop finish tags of idle clients the virtual clock has caught up with"""
+        for client, finish in list(self._last_finish.items()):
+            if finish <= self._virtual_time and client not in self._queues and client not in self._running:
+                del self._last_finish[client]
+
+    def _dispatch(self) -> None:
+        while self._total_running < self.max_concurrency:
+            best = None
+            for client, queue in self._queues.items():
+                head = queue[0]
+                if self._running.get(client, 0) >= self.per_client_concurrency:
+                    continue
+                # Ties go to the job queued first
+                if best is None or (head.finish, head.sequence) < (best.finish, best.sequence):
+                    best = head
+            if best is None:
+                return
+
+            queue = self._queues[best.client]
+            queue.popleft()
+            if not queue:
+                del self._queues[best.client]
+            self._queued -= 1
+            GENERATION_QUEUE_DEPTH.dec()
+            self._running[best.client] = self._running.get(best.client, 0) + 1
+            self._total_running += 1
+            self._virtual_time = max(self._virtual_time, best.start)
+            PIPELINE_STAGE_SECONDS.labels(stage="queue_wait").observe(time.monotonic() - best.queued_at)
+
+            started = time.monotonic()
+            running = asyncio.get_running_loop().run_in_executor(
+                self._executor, best.context.run, _run_job, best.func, *best.args
+            )
+            running.add_done_callback(lambda done, job=best: self._finished(job, done, started))
+
+    def _finished(self, job: _Job, done: asyncio.Future, started: float) -> None:
+        self._job_seconds = 0.8 * self._job_seconds + 0.2 * (time.monotonic() - started)
+        self._total_running -= 1
+        self._running[job.client] -= 1
+        if not self._running[job.client]:
+            del self._running[job.client]
+            if job.client not in self._queues and self._last_finish.get(job.client, 0.0) <= self._virtual_time:
+                self._last_finish.pop(job.client, None)
+        if not job.future.done():
+            if done.exception() is not None:
+                job.future.set_exception(done.exception())
+            else:
+                job.future.set_result(done.result())
+        self._dispatch()
+
+
+def _run_job(func: Callable[..., Any], *args) -> Any:
+    # Runs in the job's copied request context, so a profiled request's
+    # sampler also records the worker thread doing its generation
+    with sampled_thread():
+        return func(*args)
+
+
+def client_and_tier(request: Request, user) -> Tuple[str, str]:
+    """Scheduler client key and tier for a request: the user, or the anonymous IP address"""
+    if user is None:
+        client_ip = request.client.host if request.client else "unknown"
+        return f"ip:{client_ip}", ANONYMOUS_TIER
+    return f"user:{user.id}", USER_TIERS.get(str(user.id), USER_TIER)
+
+
+def build_scheduler(config) -> FairScheduler:
+    return FairScheduler(
+        max_concurrency=config.SCHEDULER_MAX_CONCURRENCY,
+        per_client_concurrency=config.SCHEDULER_PER_CLIENT_CONCURRENCY,
+        max_queue=config.SCHEDULER_MAX_QUEUE,
+        per_client_queue=config.SCHEDULER_PER_CLIENT_QUEUE,
+        weights={tier: float(weight) for tier, weight in parse_pairs(config.SCHEDULER_TIER_WEIGHTS).items()},
+    )
+
+
+# Tier names and weights were validated when settings loaded
+USER_TIERS = parse_pairs(settings.SCHEDULER_USER_TIERS)
+generation_scheduler = build_scheduler(settings)
+
+
+async def schedule_generation(request: Request, user, func: Callable[..., Any], *args, cost: float = 1.0) -> Any:
+    """Run a blocking generation call through the fair-share scheduler"""
+    if not settings.SCHEDULER_ENABLED:
+        # Unscheduled, but still off the event loop
+        return await run_in_threadpool(contextvars.copy_context().run, _run_job, func, *args)
+    client, tier = client_and_tier(request, user)
+    return await generation_scheduler.run(client, tier, func, *args, cost=cost)
+
+
+def scheduler_full_exception(error: SchedulerFull) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many generation requests queued, please retry later",
+        headers={"Retry-After": str(error.retry_after)},
+    )
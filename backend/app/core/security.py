@@ -1,15 +1,31 @@
 from passlib.context import CryptContext
-from typing import Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.db.session import get_db
+from app.core.metrics import PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_REJECTED
+from app.core.tracing import span
+from app.db.session import get_db, release_read_transaction
 from app.db.models.user import User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Pinning min/max rounds to the configured cost makes existing hashes with a
+# different cost report needs_update, so they are re-hashed on next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 
 security = HTTPBearer()
 optional_security = HTTPBearer(auto_error=False)
@@ -27,6 +43,57 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already queued"""
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a dedicated, size-limited thread
+    pool so the CPU-heavy work never blocks the event loop. bcrypt releases
+    the GIL, so the pool threads run in parallel with request handling.
+    """
+    
+    def __init__(self, context: CryptContext, max_workers: int, max_queue: int):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._in_flight = 0
+    
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+    
+    def _update_gauges(self) -> None:
+        PASSWORD_HASH_IN_FLIGHT.set(self._in_flight)
+        PASSWORD_HASH_QUEUE_DEPTH.set(self.queue_depth)
+    
+    async def _run(self, func, *args):
+        if self._in_flight >= self.max_workers + self.max_queue:
+            PASSWORD_HASH_REJECTED.inc()
+            raise PasswordHasherBusy()
+        self._in_flight += 1
+        self._update_gauges()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._in_flight -= 1
+            self._update_gauges()
+    
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured cost"""
+        return await self._run(self.context.hash, password)
+    
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password, returning a re-hashed value if the stored cost is outdated"""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -115,36 +182,170 @@ def get_current_user_optional(
     except Exception:
         return None
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """Get user by email"""
-    return db.query(User).filter(User.email == email).first()
+    return await db.scalar(select(User).where(User.email == email))
 
-async def get_current_user_optional(
-    token: Optional[str] = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> Optional[User]:
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """Lightweight user record returned by the auth dependencies"""
+    id: int
+    email: str
+    token_version: int = 0
+
+authenticated_user_cache = TTLCache(
+    ttl=settings.AUTH_CACHE_TTL_SECONDS,
+    maxsize=settings.AUTH_CACHE_MAX_ENTRIES,
+    name="authenticated_user"
+)
+token_version_cache = TTLCache(
+    ttl=settings.AUTH_CACHE_TTL_SECONDS,
+    maxsize=settings.AUTH_CACHE_MAX_ENTRIES,
+    name="token_version"
+)
+
+# Session.info key of users changed in the session's transaction
+PENDING_USER_INVALIDATIONS = "auth_cache_invalidate"
+# Bumped when committed user changes are dropped from the caches; a lookup
+# that started before that does not cache what it read
+_cache_generation = 0
+
+def token_claims(user: User) -> dict:
+    """Claims identifying a user in an access token"""
+    return {"sub": user.email, "uid": user.id, "ver": user.token_version or 0}
+
+async def resolve_authenticated_user(db: AsyncSession, email: str) -> Optional[AuthenticatedUser]:
     """
-    Get current user from JWT token (optional - returns None if no token)
-    Used for endpoints that support both authenticated and anonymous access
+    Look up the user for a token subject, serving repeat lookups from an
+    in-process LRU cache so authenticated requests skip the database
     """
-    if not token:
+    if settings.AUTH_CACHE_ENABLED:
+        cached = authenticated_user_cache.get(email)
+        if cached is not None:
+            return cached
+    
+    generation = _cache_generation
+    user = await get_user_by_email(db, email)
+    if user is None:
         return None
+    
+    record = AuthenticatedUser(id=user.id, email=user.email, token_version=user.token_version or 0)
+    if settings.AUTH_CACHE_ENABLED and generation == _cache_generation:
+        authenticated_user_cache.set(email, record)
+    return record
+
+async def get_token_version(db: AsyncSession, user_id: int) -> Optional[int]:
+    """
+    Current token version of a user (None if the user no longer exists),
+    cached in memory so claims-mode requests usually skip the database
+    """
+    if settings.AUTH_CACHE_ENABLED:
+        cached = token_version_cache.get(user_id)
+        if cached is not None:
+            return cached if cached >= 0 else None
+    
+    generation = _cache_generation
+    version = await db.scalar(select(User.token_version).where(User.id == user_id))
+    if settings.AUTH_CACHE_ENABLED and generation == _cache_generation:
+        token_version_cache.set(user_id, -1 if version is None else version)
+    return version
+
+async def principal_from_claims(db: AsyncSession, payload: dict) -> Optional[AuthenticatedUser]:
+    """
+    Resolve the principal for a decoded token.
+
+    In claims mode a token carrying uid/ver is trusted as-is apart from the
+    cached token-version check; otherwise the user is looked up by email.
+    Tokens issued before a revocation are rejected in both modes.
+    """
+    email = payload.get("sub")
+    if email is None:
+        return None
+    
+    user_id, version = payload.get("uid"), payload.get("ver")
+    with span("auth.resolve_principal") as auth_span:
+        if settings.AUTH_CLAIMS_MODE and isinstance(user_id, int) and isinstance(version, int):
+            auth_span.set_attribute("auth.mode", "claims")
+            if await get_token_version(db, user_id) != version:
+                auth_span.set_attribute("auth.rejected", True)
+                return None
+            return AuthenticatedUser(id=user_id, email=email, token_version=version)
         
+        auth_span.set_attribute("auth.mode", "lookup")
+        user = await resolve_authenticated_user(db, email)
+        if user is None or (version is not None and version != user.token_version):
+            auth_span.set_attribute("auth.rejected", True)
+            return None
+        auth_span.set_attribute("user_id", user.id)
+        return user
+
+async def principal_from_token(db: AsyncSession, token: Optional[str]) -> Optional[AuthenticatedUser]:
+    """Principal for a raw bearer token, or None when it is missing or invalid"""
+    if not token:
+        return None
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
     except JWTError:
         return None
-    
-    user = get_user_by_email(db, email)
-    return user
+    return await principal_from_claims(db, payload)
+
+def _invalidate_cached_users(emails, user_ids) -> None:
+    global _cache_generation
+    _cache_generation += 1
+    for email in emails:
+        authenticated_user_cache.invalidate(email)
+    for user_id in user_ids:
+        token_version_cache.invalidate(user_id)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _collect_changed_user(mapper, connection, target):
+    """
+    Remember a changed user on its session. The cached entries are dropped
+    once the change commits, not at flush, so a concurrent lookup cannot
+    re-cache the old row in between; a rollback leaves the caches alone.
+    """
+    emails = {target.email, *inspect(target).attrs.email.history.deleted}
+    session = object_session(target)
+    if session is None:
+        _invalidate_cached_users(emails, [target.id])
+        return
+    pending_emails, pending_ids = session.info.setdefault(PENDING_USER_INVALIDATIONS, (set(), set()))
+    pending_emails.update(emails)
+    pending_ids.add(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    """
+    Drop this process's cached entries for users changed in the committed
+    transaction. Other workers keep theirs, so they see a revoke or email
+    change only once their entries expire after AUTH_CACHE_TTL_SECONDS.
+    """
+    pending = session.info.pop(PENDING_USER_INVALIDATIONS, None)
+    if pending is not None:
+        _invalidate_cached_users(*pending)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_invalidations(session):
+    session.info.pop(PENDING_USER_INVALIDATIONS, None)
+
+async def get_current_user_optional(
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> Optional[AuthenticatedUser]:
+    """
+    Get current user from JWT token (optional - returns None if no token)
+    Used for endpoints that support both authenticated and anonymous access
+    """
+    principal = await principal_from_token(db, token)
+    await release_read_transaction(db)
+    return principal
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_db)
+) -> AuthenticatedUser:
     """
     Get current user from JWT token (required)
     Used for endpoints that require authentication
@@ -164,13 +365,29 @@ async def get_current_user(
     
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_email(db, email)
+    user = await principal_from_claims(db, payload)
+    await release_read_transaction(db)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+async def get_current_db_user(
+    principal: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    Load the full User row for the authenticated principal
+    Only for endpoints that read or modify the user itself
+    """
+    user = await db.get(User, principal.id)
+    await release_read_transaction(db)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
@@ -0,0 +1,292 @@
+"""
+Lightweight in-process tracing.
+
+Spans nest through a context variable, so a span opened in a route, a
+dependency, a service or a worker thread started with run_in_threadpool
+becomes a child of the request's span without being passed around.
+Finished spans go to the configured exporter; with no exporter, span()
+returns a shared no-op and tracing costs almost nothing. Trace context is
+read from and written to W3C ``traceparent`` headers.
+"""
+
+import contextvars
+import importlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_exporter = None
+
+
+class Span:
+    """A timed operation within a trace; use as a context manager"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_time", "_started", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self) -> "Span":
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(duration * 1000, 3),
+            "status": "ok" if exc is None else "error",
+            "attributes": self.attributes,
+            "pid": os.getpid(),
+        }
+        if exc is not None:
+            record["error"] = f"{type(exc).__name__}: {exc}"
+        exporter = _exporter
+        if exporter is not None:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logger.warning(f"Span export failed: {e}")
+        return False
+
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """Start a child of the current span, or a new trace when there is none"""
+    if _exporter is None:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is None:
+        return Span(name, secrets.token_hex(16), None, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes):
+    """Start a root span, continuing the remote trace in a traceparent header if valid"""
+    if _exporter is None:
+        return NOOP_SPAN
+    match = TRACEPARENT_PATTERN.match(traceparent or "")
+    if match is None:
+        return Span(name, secrets.token_hex(16), None, attributes)
+    return Span(name, match.group(1), match.group(2), attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Set an attribute on the current span, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+def inject_headers(headers: Optional[dict] = None) -> dict:
+    """Add the current trace context to outbound HTTP request headers"""
+    headers = dict(headers or {})
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent
+    return headers
+
+
+class JSONLExporter:
+    """
+    Append one JSON object per finished span to a file.
+
+    Each span is a single O_APPEND write, so several workers can share a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def export(self, record: dict) -> None:
+        os.write(self._fd, (json.dumps(record, default=str) + "\n").encode())
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class LoggingExporter:
+    """Log each finished span as JSON"""
+
+    def export(self, record: dict) -> None:
+        logger.info(json.dumps(record, default=str))
+
+
+class InMemoryExporter:
+    """Keep finished spans in a list, for tests and debugging"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, record: dict) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+
+def build_exporter(name: str, path: str):
+    """
+    Exporter for the TRACING_EXPORTER setting: "none", "jsonl", "log", or
+    "package.module:factory" for a custom exporter with an export(record) method
+    """
+    if name == "none":
+        return None
+    if name == "jsonl":
+        return JSONLExporter(path)
+    if name == "log":
+        return LoggingExporter()
+    if ":" in name:
+        module_name, _, attribute = name.partition(":")
+        return getattr(importlib.import_module(module_name), attribute)()
+    raise ValueError(f"Unknown tracing exporter {name!r}")
+
+
+def set_exporter(exporter) -> None:
+    """Send finished spans to exporter; None turns tracing off"""
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter():
+    return _exporter
+
+
+class TracingMiddleware:
+    """
+    Open a root span per HTTP request and return its trace id in X-Trace-Id.
+
+    An incoming ``traceparent`` header continues the caller's trace.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _exporter is None:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = Headers(scope=scope).get("traceparent")
+        with start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent,
+            **{"http.method": scope["method"], "http.path": scope["path"]},
+        ) as root:
+
+            async def send_with_trace(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    root.set_attribute("http.status_code", message["status"])
+                    MutableHeaders(scope=message).append("X-Trace-Id", root.trace_id)
+                elif message["type"] == "http.response.body":
+                    root.set_attribute("http.response_bytes", root.attributes.get("http.response_bytes", 0) + len(message.get("body", b"")))
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+
+
+def load_traces(path: str) -> Dict[str, list]:
+    """Spans from a JSONL export, grouped by trace id"""
+    traces: Dict[str, list] = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                traces.setdefault(record["trace_id"], []).append(record)
+    return traces
+
+
+def format_timeline(spans: list) -> str:
+    """Render one trace as an indented timeline, offsets relative to its first span"""
+    by_parent: Dict[Optional[str], list] = {}
+    span_ids = {record["span_id"] for record in spans}
+    for record in spans:
+        parent = record["parent_id"] if record["parent_id"] in span_ids else None
+        by_parent.setdefault(parent, []).append(record)
+    origin = min(record["start"] for record in spans)
+    lines = []
+
+    def render(parent: Optional[str], depth: int) -> None:
+        for record in sorted(by_parent.get(parent, []), key=lambda r: r["start"]):
+            attributes = " ".join(f"{key}={value}" for key, value in record["attributes"].items())
+            offset = (record["start"] - origin) * 1000
+            status = "" if record["status"] == "ok" else f" [{record.get('error', 'error')}]"
+            lines.append(f"{offset:9.1f}ms {record['duration_ms']:9.1f}ms  {'  ' * depth}{record['name']}{status} {attributes}".rstrip())
+            render(record["span_id"], depth + 1)
+
+    render(None, 0)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print request timelines from a JSONL span export")
+    parser.add_argument("path", help="span file written by the jsonl exporter")
+    parser.add_argument("--trace", help="trace id to show (see the X-Trace-Id response header)")
+    parser.add_argument("--slowest", type=int, default=5, help="otherwise show the N slowest traces")
+    args = parser.parse_args()
+
+    traces = load_traces(args.path)
+    if args.trace:
+        selected = [traces[args.trace]]
+    else:
+        selected = sorted(traces.values(), key=lambda spans: -max(r["duration_ms"] for r in spans))[:args.slowest]
+    for spans in selected:
+        print(f"trace {spans[0]['trace_id']}")
+        print(format_timeline(spans))
+        print()
@@ -0,0 +1,118 @@
+"""
+Heavy read-only state loaded once per process, and per-process memory usage.
+
+In prefork mode (app.core.prefork) warm_up runs in the parent before the
+workers are forked, so the loaded pages are shared copy-on-write instead of
+being loaded again by every worker.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_state: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def _warm_imaging() -> None:
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    from PIL import Image, ImageDraw  # noqa: F401
+
+    from ..services.stable_diffusion import _placeholder_font
+
+    _placeholder_font()
+
+
+def _warm_dream_index() -> None:
+    from ..services.dream_embeddings import get_dream_index
+
+    index = get_dream_index()
+    # Maps the vector files and loads the IVF centroids
+    len(index)
+
+
+def _warm_services() -> None:
+    from ..services.stable_diffusion import get_stable_diffusion_service
+    from ..services.video_generation import get_video_generation_service
+
+    get_stable_diffusion_service()
+    get_video_generation_service()
+
+
+WARM_STEPS: Dict[str, Callable[[], None]] = {
+    "imaging": _warm_imaging,
+    "dream_index": _warm_dream_index,
+    "services": _warm_services,
+}
+
+
+def warm_up() -> Dict[str, dict]:
+    """Run every warm-up step not loaded yet in this process and return the state"""
+    with _lock:
+        for name, step in WARM_STEPS.items():
+            if _state.get(name, {}).get("loaded"):
+                continue
+            started = time.perf_counter()
+            error = None
+            try:
+                step()
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed: {e}")
+                error = str(e)
+            _state[name] = {
+                "loaded": error is None,
+                "seconds": round(time.perf_counter() - started, 4),
+                "error": error,
+                "pid": os.getpid(),
+            }
+    return warm_state()
+
+
+def warm_state() -> Dict[str, dict]:
+    """Warm-up steps that have run, including those inherited from a prefork parent"""
+    return {name: dict(step) for name, step in _state.items()}
+
+
+def is_warm() -> bool:
+    return len(_state) == len(WARM_STEPS) and all(step["loaded"] for step in _state.values())
+
+
+def reset_warm_state() -> None:
+    with _lock:
+        _state.clear()
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    Memory of a process in bytes.
+
+    rss counts every resident page, including pages shared with the prefork
+    parent and sibling workers; pss splits shared pages between the processes
+    mapping them and uss (private pages) is what the process alone costs.
+    Falls back to peak RSS from getrusage where /proc is not available.
+    """
+    path = f"/proc/{pid or 'self'}/smaps_rollup"
+    try:
+        with open(path) as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        if pid is not None and pid != os.getpid():
+            raise
+        import resource
+
+        return {"max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
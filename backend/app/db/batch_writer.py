@@ -0,0 +1,169 @@
+"""
+Group commit for new rows: concurrent inserts share one transaction
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..core.config import settings
+from ..core.metrics import WRITE_BATCH_QUEUE_DEPTH, observe_stage
+from .session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+# (object to insert, caller's future, attribute values the caller set)
+Pending = Tuple[object, asyncio.Future, Dict[str, Any]]
+
+
+def _set_values(obj: object) -> Dict[str, Any]:
+    state = inspect(obj)
+    return {key: state.dict[key] for key in state.mapper.attrs.keys() if key in state.dict}
+
+
+class BatchWriter:
+    """
+    Background task that commits pending inserts in batches.
+
+    The first insert to arrive opens a window of flush_interval seconds (or
+    until max_batch rows are waiting); everything queued in that window is
+    written in a single transaction, so concurrent requests pay for one
+    commit instead of one each. Callers get their object back with its id
+    and server defaults loaded once the batch is durable. If the writer task
+    is cancelled, callers still waiting get CancelledError.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal, flush_interval: float = 0.005, max_batch: int = 64):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        return self._queue
+
+    async def submit(self, obj: T) -> T:
+        """Insert obj as part of the next batch and wait until it is committed"""
+        future = asyncio.get_running_loop().create_future()
+        self._ensure_started().put_nowait((obj, future, _set_values(obj)))
+        WRITE_BATCH_QUEUE_DEPTH.inc()
+        return await future
+
+    async def close(self) -> None:
+        """Stop the background task after the queued inserts are written"""
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _collect(self, batch: List[Pending]) -> None:
+        """Fill batch with the next window's inserts"""
+        try:
+            batch.append(await self._queue.get())
+            deadline = self._loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            WRITE_BATCH_QUEUE_DEPTH.dec(len(batch))
+
+    async def _run(self) -> None:
+        batch: List[Pending] = []
+        try:
+            while True:
+                batch = []
+                await self._collect(batch)
+                try:
+                    await self._write(batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            # Cancelled or crashed: nothing else will resolve these callers
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                self._queue.task_done()
+                WRITE_BATCH_QUEUE_DEPTH.dec()
+            for _, future, _ in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def _write(self, batch: List[Pending]) -> None:
+        try:
+            async with self.session_factory() as db:
+                await self._commit(db, [obj for obj, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch, error=e)
+                return
+            # Retry one by one so a single bad row does not fail its neighbours.
+            # The instances went through the rolled-back session (and may carry
+            # ids it assigned), so each row is rebuilt from the caller's values
+            logger.warning(f"Batch insert of {len(batch)} rows failed, retrying individually: {e}")
+            for obj, future, values in batch:
+                await self._write([(type(obj)(**values), future, values)])
+            return
+        self._resolve(batch)
+
+    @staticmethod
+    async def _commit(db: AsyncSession, objects: list) -> None:
+        db.add_all(objects)
+        await db.flush()
+        # Load server defaults (created_at) with one query per model
+        by_model = defaultdict(list)
+        for obj in objects:
+            by_model[type(obj)].append(obj)
+        for model, rows in by_model.items():
+            primary_key = inspect(model).primary_key[0]
+            statement = select(model).where(primary_key.in_([getattr(row, primary_key.key) for row in rows]))
+            await db.execute(statement.execution_options(populate_existing=True))
+        await db.commit()
+
+    @staticmethod
+    def _resolve(batch: List[Pending], error: Optional[Exception] = None) -> None:
+        for obj, future, _ in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(obj)
+            else:
+                future.set_exception(error)
+
+
+batch_writer = BatchWriter(
+    flush_interval=settings.WRITE_BATCH_INTERVAL_MS / 1000,
+    max_batch=settings.WRITE_BATCH_MAX_SIZE,
+)
+
+
+async def insert(db: AsyncSession, obj: T) -> T:
+    """Insert and commit obj, through the group-commit writer when enabled"""
+    with observe_stage("db_commit", model=type(obj).__name__, batched=settings.WRITE_BATCH_ENABLED):
+        if settings.WRITE_BATCH_ENABLED:
+            return await batch_writer.submit(obj)
+        db.add(obj)
+        await db.commit()
+        await db.refresh(obj)
+        return obj
@@ -0,0 +1,78 @@
+"""
+Engine settings tuned per database backend, selected from the URL scheme
+"""
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from ..core.config import settings
+
+
+def sqlite_pragmas() -> dict:
+    """PRAGMAs applied to every new SQLite connection"""
+    return {
+        # Readers no longer block the writer, and commits only append to the WAL
+        "journal_mode": "WAL",
+        # In WAL mode NORMAL only fsyncs at checkpoints; a power loss can drop
+        # the last commits but never corrupts the database
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        # Negative values are KiB rather than pages
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,
+    }
+
+
+def _statement_timeout_args(driver: str) -> dict:
+    timeout = settings.DB_STATEMENT_TIMEOUT_MS
+    if not timeout:
+        return {}
+    if driver == "asyncpg":
+        return {"server_settings": {"statement_timeout": str(timeout)}}
+    if driver in ("psycopg2", "psycopg"):
+        return {"options": f"-c statement_timeout={timeout}"}
+    return {}
+
+
+def engine_options(url: str) -> dict:
+    """Keyword arguments for create_engine/create_async_engine"""
+    parsed = make_url(url)
+    backend, driver = parsed.get_backend_name(), parsed.get_driver_name()
+
+    if backend == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if driver == "aiosqlite":
+            # Each aiosqlite connection owns a thread, which is too costly to
+            # open per request
+            options["poolclass"] = AsyncAdaptedQueuePool
+        return options
+
+    if backend == "postgresql":
+        return {
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+            "pool_recycle": settings.DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+            "connect_args": _statement_timeout_args(driver),
+        }
+
+    return {}
+
+
+def configure_engine(engine: Engine) -> None:
+    """Install per-connection setup for the engine's backend"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
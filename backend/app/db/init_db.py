@@ -0,0 +1,38 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from .session import Base
+from . import models  # noqa: F401 - registers every table on Base.metadata
+from .search import ensure_dream_search
+
+# Columns added after a table was first created: (table, column, DDL type)
+ADDED_COLUMNS = (
+    ("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+def add_missing_columns(bind: Engine) -> None:
+    """Add columns that create_all does not add to existing tables"""
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table, column, ddl in ADDED_COLUMNS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def add_missing_indexes(bind: Engine) -> None:
+    """Create indexes declared after a table was first created"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def init_db(bind: Engine) -> None:
+    """Create missing tables, columns, indexes and search indexes (safe to run repeatedly)"""
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    add_missing_indexes(bind)
+    ensure_dream_search(bind)
+
+if __name__ == "__main__":
+    from .session import engine
+
+    init_db(engine)
@@ -1,5 +1,6 @@
 from .user import User
 from .dream import Dream
 from .video import Video
+from .cache_version import CacheVersion
 
-__all__ = ["User", "Dream", "Video"]
+__all__ = ["User", "Dream", "Video", "CacheVersion"]
@@ -0,0 +1,9 @@
+from sqlalchemy import Column, Integer, String
+
+from ..session import Base
+
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -9,7 +9,7 @@ class Dream(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     prompt = Column(Text, nullable=False)
-    image_path = Column(String, nullable=True)
+    image_path = Column(String, nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="dreams") 
\ No newline at end of file
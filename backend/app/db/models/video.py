@@ -11,7 +11,7 @@ class Video(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     prompt = Column(Text, nullable=False)
-    video_path = Column(String, nullable=False)
+    video_path = Column(String, nullable=False, index=True)
     video_url = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class DreamBase(BaseModel):
     prompt: str = Field(..., min_length=1, description="Dream description prompt")
@@ -31,4 +31,14 @@ class DreamResponse(DreamBase):
     created_at: datetime
     
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class DreamSearchResult(DreamResponse):
+    highlight: str = Field(..., description="Prompt with matching terms wrapped in <mark> tags")
+
+class DreamSearchPage(BaseModel):
+    results: List[DreamSearchResult]
+    next_cursor: Optional[str] = None
+
+class DreamSimilarResult(DreamResponse):
+    score: float = Field(..., description="Cosine similarity to the query prompt")
\ No newline at end of file
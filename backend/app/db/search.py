@@ -0,0 +1,171 @@
+"""
+Full-text search over dream prompts backed by an SQLite FTS5 index
+"""
+
+import base64
+import html
+import logging
+from typing import List, Optional, Tuple
+
+from sqlalchemy import DDL, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .models.dream import Dream
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+DREAM_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS dreams_fts USING fts5("
+    "prompt, content='dreams', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS dreams_fts_ai AFTER INSERT ON dreams BEGIN "
+    "INSERT INTO dreams_fts(rowid, prompt) VALUES (new.id, new.prompt); END",
+    "CREATE TRIGGER IF NOT EXISTS dreams_fts_ad AFTER DELETE ON dreams BEGIN "
+    "INSERT INTO dreams_fts(dreams_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt); END",
+    "CREATE TRIGGER IF NOT EXISTS dreams_fts_au AFTER UPDATE OF prompt ON dreams BEGIN "
+    "INSERT INTO dreams_fts(dreams_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt); "
+    "INSERT INTO dreams_fts(rowid, prompt) VALUES (new.id, new.prompt); END",
+]
+
+for statement in DREAM_SEARCH_DDL:
+    event.listen(Dream.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Dream.__table__, "before_drop", DDL("DROP TABLE IF EXISTS dreams_fts").execute_if(dialect="sqlite"))
+
+
+def search_supported(bind: Engine) -> bool:
+    """FTS5 search is only available on SQLite databases"""
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_dream_search(bind: Engine) -> None:
+    """
+    Create the FTS table and sync triggers if they are missing (idempotent).
+
+    An external-content index created over a dreams table that already has
+    rows must be backfilled before the delete triggers first fire, otherwise
+    SQLite reports the database as malformed, so a new index is rebuilt in
+    the same transaction.
+    """
+    if not search_supported(bind):
+        return
+    with bind.begin() as conn:
+        existed = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dreams_fts'")
+        ).first() is not None
+        for statement in DREAM_SEARCH_DDL:
+            conn.execute(text(statement))
+        if not existed and conn.execute(text("SELECT EXISTS (SELECT 1 FROM dreams)")).scalar():
+            conn.execute(text("INSERT INTO dreams_fts(dreams_fts) VALUES ('rebuild')"))
+            logger.info("Backfilled the dream search index")
+
+
+def rebuild_dream_search(bind: Engine) -> int:
+    """Re-index every existing dream prompt and return the number of rows indexed"""
+    ensure_dream_search(bind)
+    with bind.begin() as conn:
+        conn.execute(text("INSERT INTO dreams_fts(dreams_fts) VALUES ('rebuild')"))
+        return conn.execute(text("SELECT count(*) FROM dreams")).scalar()
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Turn free user text into a safe FTS5 MATCH expression.
+
+    Every term is quoted so FTS operators in the input are treated literally,
+    and the last term is matched as a prefix for search-as-you-type.
+    """
+    terms = [term.replace('"', '""') for term in query.split()]
+    terms = [term for term in terms if term.strip('"')]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def encode_cursor(rank: float, dream_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{rank!r}:{dream_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a pagination cursor, raising ValueError when it is malformed"""
+    try:
+        rank, dream_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return float(rank), int(dream_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def render_highlight(value: str) -> str:
+    """HTML-escape a highlighted prompt and wrap matches in <mark> tags"""
+    return (
+        html.escape(value)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_END, "</mark>")
+    )
+
+
+def search_dreams(
+    db: Session,
+    user_id: int,
+    query: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Search one user's dreams ordered by BM25 relevance.
+
+    Returns the matching rows and a cursor for the next page, or None when
+    there are no more results.
+    """
+    match = build_match_query(query)
+    if match is None:
+        return [], None
+
+    params = {
+        "match": match,
+        "user_id": user_id,
+        "limit": limit + 1,
+        "start": HIGHLIGHT_START,
+        "end": HIGHLIGHT_END,
+    }
+    keyset = ""
+    if cursor:
+        params["after_rank"], params["after_id"] = decode_cursor(cursor)
+        keyset = (
+            "AND (bm25(dreams_fts) > :after_rank "
+            "OR (bm25(dreams_fts) = :after_rank AND d.id > :after_id)) "
+        )
+
+    rows = db.execute(
+        text(
+            "SELECT d.id, d.user_id, d.prompt, d.image_path, d.created_at, "
+            "highlight(dreams_fts, 0, :start, :end) AS highlighted, "
+            "bm25(dreams_fts) AS rank "
+            "FROM dreams_fts JOIN dreams d ON d.id = dreams_fts.rowid "
+            "WHERE dreams_fts MATCH :match AND d.user_id = :user_id "
+            f"{keyset}"
+            "ORDER BY rank, d.id LIMIT :limit"
+        ),
+        params,
+    ).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["rank"], rows[-1]["id"])
+    return [dict(row) for row in rows], next_cursor
+
+
+if __name__ == "__main__":
+    from .session import engine
+
+    logging.basicConfig(level=logging.INFO)
+    if not search_supported(engine):
+        logger.error("Dream search requires an SQLite database")
+    else:
+        indexed = rebuild_dream_search(engine)
+        logger.info(f"Indexed {indexed} dream prompts")
@@ -1,20 +1,51 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from ..core.config import settings
+from .engine_profiles import configure_engine, engine_options
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+# Async drivers used by the request handlers, per database backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    """Swap the driver of a database URL for its asyncio equivalent"""
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if drivername is None:
+        return url
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+# Synchronous engine for scripts, migrations and streaming exports run in threads
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+configure_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_DATABASE_URL = async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+configure_engine(async_engine.sync_engine)
+
+# Objects stay usable after commit: reloading expired attributes would need
+# implicit IO, which AsyncSession does not allow
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
+
+async def release_read_transaction(db: AsyncSession) -> None:
+    """
+    End the session's read transaction and return its connection to the pool.
+
+    Called after lookups that precede slow work (bcrypt, image generation) or
+    a write, so no transaction idles across awaits and SQLite never has to
+    upgrade a read lock to a write lock, which fails under concurrent writers.
+    """
+    await db.commit()
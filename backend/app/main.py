@@ -1,19 +1,60 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from .api.v1 import api_router
-from .db.session import engine, Base
-from .db.models import user, dream, video
+from .core.compression import CompressionMiddleware, PrecompressedStaticFiles
+from .core.config import settings
+from .core.media import MediaFiles, owner_authorizer
+from .core.metrics import render_metrics
+from .core.tracing import TracingMiddleware, build_exporter, set_exporter
+from .core.warm_state import is_warm, memory_usage, warm_state, warm_up
+from .db.batch_writer import batch_writer
+from .db.session import AsyncSessionLocal, engine
+from .db.init_db import init_db
+from .db.models.dream import Dream
+from .db.models.video import Video
+import logging
 import os
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # run_production.py creates the schema once before starting workers and
+    # turns this off; single-process servers do it here
+    if settings.DB_INIT_ON_STARTUP:
+        await run_in_threadpool(init_db, engine)
+    # Already done by the parent in prefork mode, where workers inherit it
+    if settings.WARM_STATE and not is_warm():
+        await run_in_threadpool(warm_up)
+    if not settings.MEDIA_AUTHORIZE:
+        logger.warning("MEDIA_AUTHORIZE is off: generated media under /static/ is public, including users' private dreams")
+    yield
+    await batch_writer.close()
 
 app = FastAPI(
     title="Mind's Eye Dream-Visualizer",
     description="An AI-powered dream visualizer app",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+if settings.PROFILING_ENABLED:
+    # Innermost, so profiles cover the handler rather than CORS/compression
+    from .core.profiling import ProfilingMiddleware
+    app.add_middleware(
+        ProfilingMiddleware,
+        output_dir=settings.PROFILING_DIR,
+        sample_rate=settings.PROFILING_SAMPLE_RATE,
+        paths=[path for path in settings.PROFILING_PATHS.split(",") if path],
+        token=settings.PROFILING_TOKEN,
+        mode=settings.PROFILING_MODE,
+        interval=settings.PROFILING_INTERVAL_MS / 1000,
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
@@ -22,14 +63,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+)
+
+set_exporter(build_exporter(settings.TRACING_EXPORTER, settings.TRACING_FILE))
+if settings.TRACING_EXPORTER != "none":
+    # Outermost, so the root span covers the whole request
+    app.add_middleware(TracingMiddleware)
+
 os.makedirs("generated_images", exist_ok=True)
 os.makedirs("generated_videos", exist_ok=True)
 
-app.mount("/static/generated_images", StaticFiles(directory="generated_images"), name="generated_images")
-app.mount("/static/generated_videos", StaticFiles(directory="generated_videos"), name="generated_videos")
+for media_dir, model, path_column in (
+    ("generated_images", Dream, "image_path"),
+    ("generated_videos", Video, "video_path"),
+):
+    app.mount(
+        f"/static/{media_dir}",
+        MediaFiles(
+            directory=media_dir,
+            mode=settings.MEDIA_DELIVERY,
+            accel_prefix=f"{settings.MEDIA_ACCEL_PREFIX}/{media_dir}",
+            authorize=owner_authorizer(model, path_column, media_dir) if settings.MEDIA_AUTHORIZE else None,
+        ),
+        name=media_dir,
+    )
 
 app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/")
 async def root():
-    return {"message": "OK"} 
\ No newline at end of file
+    return {"message": "OK"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+def worker_status() -> dict:
+    return {
+        "pid": os.getpid(),
+        "worker": os.getenv("PREFORK_WORKER_ID"),
+        "warm": is_warm(),
+        "warm_state": warm_state(),
+        "memory": memory_usage(),
+    }
+
+@app.get("/health/live", include_in_schema=False)
+async def health_live():
+    return {"status": "ok", **worker_status()}
+
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready():
+    status = worker_status()
+    checks = {"warm": status["warm"] or not settings.WARM_STATE}
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        checks["database"] = True
+    except Exception:
+        checks["database"] = False
+    ready = all(checks.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "not ready", "checks": checks, **status},
+        status_code=200 if ready else 503,
+    )
+
+if settings.FRONTEND_DIST_DIR and os.path.isdir(settings.FRONTEND_DIST_DIR):
+    app.mount("/", PrecompressedStaticFiles(directory=settings.FRONTEND_DIST_DIR, html=True), name="frontend") 
\ No newline at end of file
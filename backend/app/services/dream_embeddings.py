@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Prompt embeddings and a memory-mapped vector index for similar-dream lookup
+"""
+
+import hashlib
+import logging
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 256
+ANONYMOUS_OWNER = -1
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _hash_feature(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+
+
+def embed_prompt(prompt: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Compute a hashed n-gram embedding for a prompt.
+
+    Words and character trigrams are hashed into ``dim`` signed buckets and the
+    result is L2-normalised, so a dot product is the cosine similarity.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD_RE.findall(prompt.lower()):
+        features = [(word, 1.0)]
+        padded = f" {word} "
+        features.extend((padded[i:i + 3], 0.5) for i in range(len(padded) - 2))
+        for feature, weight in features:
+            h = _hash_feature(feature)
+            vector[h % dim] += weight if (h >> 63) & 1 else -weight
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.astype(np.float16)
+
+
+class DreamVectorIndex:
+    """
+    Append-only float16 vector index stored in flat files and memory-mapped.
+
+    ``vectors.f16`` holds one embedding per row and ``meta.i64`` the matching
+    (dream_id, owner_id) pair. Rows are appended under a file lock so several
+    workers can share one index directory. An optional IVF partitioning
+    (``train_ivf``) lets searches over large corpora probe only a few
+    clusters instead of scanning every row, and an in-memory per-owner row
+    index keeps scoped searches proportional to that owner's dreams.
+    """
+
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIM, ivf_min_candidates: int = 20000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.ivf_min_candidates = ivf_min_candidates
+        self.vectors_path = self.directory / "vectors.f16"
+        self.meta_path = self.directory / "meta.i64"
+        self.centroids_path = self.directory / "ivf_centroids.npy"
+        self.assign_path = self.directory / "ivf_assign.i32"
+        self.lock_path = self.directory / "index.lock"
+        self._count = -1
+        self._vectors = np.zeros((0, dim), dtype=np.float16)
+        self._meta = np.zeros((0, 2), dtype=np.int64)
+        self._assign = None
+        self._centroids = None
+        self._centroids_mtime = None
+        # Rows of each owner, in chunks appended as the index grows
+        self._owner_rows: Dict[int, List[np.ndarray]] = {}
+        self._owner_indexed = 0
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * 2
+
+    def __len__(self) -> int:
+        self._refresh()
+        return self._count
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_rows(self) -> int:
+        vector_rows = self.vectors_path.stat().st_size // self.row_bytes if self.vectors_path.exists() else 0
+        meta_rows = self.meta_path.stat().st_size // 16 if self.meta_path.exists() else 0
+        return min(vector_rows, meta_rows)
+
+    def _load_centroids(self) -> None:
+        if not self.centroids_path.exists():
+            self._centroids = None
+            self._centroids_mtime = None
+            return
+        mtime = self.centroids_path.stat().st_mtime
+        if mtime != self._centroids_mtime:
+            self._centroids = np.load(self.centroids_path)
+            self._centroids_mtime = mtime
+            self._count = -1
+
+    def _index_owners(self, count: int) -> None:
+        """Add rows appended since the last refresh to the per-owner row index"""
+        if count < self._owner_indexed:
+            # The index was reset and rebuilt by another process
+            self._owner_rows = {}
+            self._owner_indexed = 0
+        if count == self._owner_indexed:
+            return
+        owners = np.asarray(self._meta[self._owner_indexed:count, 1])
+        order = np.argsort(owners, kind="stable")
+        owner_ids, starts = np.unique(owners[order], return_index=True)
+        for owner_id, rows in zip(owner_ids.tolist(), np.split(order + self._owner_indexed, starts[1:])):
+            self._owner_rows.setdefault(owner_id, []).append(rows)
+        self._owner_indexed = count
+
+    def _rows_of(self, owner_id: int) -> np.ndarray:
+        chunks = self._owner_rows.get(owner_id)
+        if not chunks:
+            return np.zeros(0, dtype=np.int64)
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+    def _refresh(self) -> None:
+        """Re-map the index files when another writer has appended rows"""
+        self._load_centroids()
+        count = self._file_rows()
+        if count == self._count:
+            return
+        if count == 0:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float16)
+            self._meta = np.zeros((0, 2), dtype=np.int64)
+        else:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(count, self.dim))
+            self._meta = np.memmap(self.meta_path, dtype=np.int64, mode="r", shape=(count, 2))
+        self._assign = None
+        if self._centroids is not None and self.assign_path.exists():
+            assigned = self.assign_path.stat().st_size // 4
+            if assigned >= count > 0:
+                self._assign = np.memmap(self.assign_path, dtype=np.int32, mode="r", shape=(count,))
+        self._count = count
+        self._index_owners(count)
+
+    def _assign_clusters(self, vectors: np.ndarray, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        centroids = self._centroids if centroids is None else centroids
+        return np.argmax(vectors.astype(np.float32) @ centroids.T, axis=1).astype(np.int32)
+
+    def add_vectors(self, dream_ids: List[int], owner_ids: List[Optional[int]], vectors: np.ndarray) -> None:
+        """Append embeddings for the given dreams"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float16).reshape(-1, self.dim)
+        meta = np.array(
+            [[dream_id, ANONYMOUS_OWNER if owner_id is None else owner_id]
+             for dream_id, owner_id in zip(dream_ids, owner_ids)],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        with self._locked():
+            self._load_centroids()
+            count = self._file_rows()
+            # Drop any half-written row left behind by a crashed writer
+            for path, row_bytes in ((self.vectors_path, self.row_bytes), (self.meta_path, 16)):
+                if path.exists() and path.stat().st_size != count * row_bytes:
+                    os.truncate(path, count * row_bytes)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            if self._centroids is not None:
+                with open(self.assign_path, "r+b" if self.assign_path.exists() else "wb") as f:
+                    f.seek(count * 4)
+                    f.write(self._assign_clusters(vectors).tobytes())
+                    f.truncate()
+            with open(self.meta_path, "ab") as f:
+                f.write(meta.tobytes())
+
+    def add(self, dream_id: int, owner_id: Optional[int], prompt: str) -> None:
+        """Embed a prompt and append it to the index"""
+        self.add_vectors([dream_id], [owner_id], embed_prompt(prompt, self.dim)[None, :])
+
+    def train_ivf(self, nlist: int = 1024, iterations: int = 10, sample_size: int = 100000, seed: int = 0) -> None:
+        """
+        Partition the index with spherical k-means so searches can probe a few
+        clusters.
+
+        Training runs on a snapshot of the rows present when it starts,
+        without the lock, so workers keep adding dreams meanwhile. The lock
+        is only taken again to assign those later rows and swap the new
+        centroids and assignments in.
+        """
+        with self._locked():
+            self._count = -1
+            self._refresh()
+            count = self._count
+        if count == 0:
+            raise ValueError("Cannot train IVF on an empty index")
+        vectors = self._vectors
+        rng = np.random.default_rng(seed)
+        sample_rows = rng.choice(count, size=min(sample_size, count), replace=False)
+        sample = np.asarray(vectors[np.sort(sample_rows)], dtype=np.float32)
+        nlist = min(nlist, len(sample))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+
+        assign_tmp = self.assign_path.with_suffix(".tmp")
+        centroids_tmp = self.directory / "ivf_centroids.tmp.npy"
+        with open(assign_tmp, "wb") as f:
+            for start in range(0, count, 65536):
+                f.write(self._assign_clusters(vectors[start:start + 65536], centroids).tobytes())
+        np.save(centroids_tmp, centroids)
+
+        with self._locked():
+            self._count = -1
+            self._refresh()
+            with open(assign_tmp, "ab") as f:
+                for start in range(count, self._count, 65536):
+                    end = min(start + 65536, self._count)
+                    f.write(self._assign_clusters(self._vectors[start:end], centroids).tobytes())
+            os.replace(assign_tmp, self.assign_path)
+            os.replace(centroids_tmp, self.centroids_path)
+            self._load_centroids()
+            self._count = -1
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        owner_id: Optional[int] = None,
+        exclude_id: Optional[int] = None,
+        nprobe: int = 8,
+    ) -> List[Tuple[int, float]]:
+        """
+        Return up to k (dream_id, cosine similarity) pairs, best first.
+
+        When owner_id is given only that owner's rows are considered, found
+        through the per-owner row index. IVF probing is used only when the
+        candidate set is large, so small scoped searches stay exact.
+        """
+        self._refresh()
+        if self._count == 0 or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        candidates = None
+        if owner_id is not None:
+            candidates = self._rows_of(owner_id)
+        n_candidates = self._count if candidates is None else len(candidates)
+
+        if self._assign is not None and n_candidates > self.ivf_min_candidates:
+            probes = np.argsort(-(self._centroids @ query))[:nprobe]
+            if candidates is None:
+                candidates = np.flatnonzero(np.isin(self._assign, probes))
+            else:
+                # Only the owner's own rows are looked up in the assignments
+                candidates = candidates[np.isin(self._assign[candidates], probes)]
+
+        if candidates is None:
+            scores = np.empty(self._count, dtype=np.float32)
+            for start in range(0, self._count, 65536):
+                chunk = np.asarray(self._vectors[start:start + 65536], dtype=np.float32)
+                scores[start:start + len(chunk)] = chunk @ query
+            rows = np.arange(self._count)
+        else:
+            if len(candidates) == 0:
+                return []
+            scores = np.asarray(self._vectors[candidates], dtype=np.float32) @ query
+            rows = candidates
+
+        ids = self._meta[rows, 0]
+        if exclude_id is not None:
+            scores = np.where(ids == exclude_id, -np.inf, scores)
+        top = min(k, len(scores))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[i]), float(scores[i])) for i in best if np.isfinite(scores[i])]
+
+    def reset(self) -> None:
+        """Remove every row (used before a full rebuild)"""
+        with self._locked():
+            for path in (self.vectors_path, self.meta_path, self.centroids_path, self.assign_path):
+                if path.exists():
+                    path.unlink()
+            self._count = -1
+            self._owner_rows = {}
+            self._owner_indexed = 0
+            self._load_centroids()
+
+
+_dream_index: Optional[DreamVectorIndex] = None
+
+
+def get_dream_index() -> DreamVectorIndex:
+    """Return the process-wide dream index, opening it on first use"""
+    global _dream_index
+    if _dream_index is None:
+        from ..core.config import settings
+        _dream_index = DreamVectorIndex(settings.DREAM_INDEX_DIR)
+    return _dream_index
+
+
+def rebuild_dream_index(db, index: DreamVectorIndex, batch_size: int = 10000) -> int:
+    """Re-embed every stored dream and return the number of rows indexed"""
+    from ..db.models.dream import Dream
+
+    index.reset()
+    total = 0
+    rows = db.query(Dream.id, Dream.user_id, Dream.prompt).order_by(Dream.id).yield_per(batch_size)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            total += _add_batch(index, batch)
+            batch = []
+    if batch:
+        total += _add_batch(index, batch)
+    return total
+
+
+def _add_batch(index: DreamVectorIndex, rows) -> int:
+    vectors = np.stack([embed_prompt(row.prompt, index.dim) for row in rows])
+    index.add_vectors([row.id for row in rows], [row.user_id for row in rows], vectors)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    from ..db.session import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild the similar-dream vector index")
+    parser.add_argument("--ivf", type=int, default=0, help="number of IVF clusters to train (0 disables)")
+    args = parser.parse_args()
+
+    index = get_dream_index()
+    db = SessionLocal()
+    try:
+        indexed = rebuild_dream_index(db, index)
+    finally:
+        db.close()
+    logger.info(f"Indexed {indexed} dreams into {index.directory}")
+    if args.ivf and indexed:
+        index.train_ivf(nlist=args.ivf)
+        logger.info(f"Trained IVF with {args.ivf} clusters")
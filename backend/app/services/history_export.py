@@ -0,0 +1,72 @@
+"""
+Streaming NDJSON/CSV export of a user's dream and video history
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Iterator, List
+
+from sqlalchemy.sql import Select
+
+from ..db.session import SessionLocal
+
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def iter_export(
+    statement: Select,
+    fields: List[str],
+    to_record: Callable[[object], dict],
+    export_format: str,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yield encoded export chunks, one per batch of rows.
+
+    Rows are read through a streaming cursor with ``yield_per`` so only one
+    batch is held in memory at a time, whatever the size of the history. The
+    generator opens its own session because it outlives the request handler.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            for partition in result.partitions():
+                for row in partition:
+                    record = to_record(row)
+                    if isinstance(record.get("created_at"), datetime):
+                        record["created_at"] = record["created_at"].isoformat()
+                    writer.writerow(record)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        else:
+            for partition in result.partitions():
+                yield "".join(
+                    json.dumps(to_record(row), default=_json_default, ensure_ascii=False) + "\n"
+                    for row in partition
+                ).encode()
+    finally:
+        db.close()
+
+
+def export_headers(name: str, export_format: str) -> dict:
+    return {"Content-Disposition": f'attachment; filename="{name}.{export_format}"'}
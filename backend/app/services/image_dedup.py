@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Perceptual hashes of generated images and a near-duplicate index over them
+"""
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# PIL is imported where it is used to keep API startup fast
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+NAME_BYTES = 48
+# One 64-byte row per stored image: its 64-bit hash, owning user and file name
+RECORD_DTYPE = np.dtype([("hash", "<u8"), ("owner", "<i8"), ("name", f"S{NAME_BYTES}")])
+# Lookups only compare against records sharing one of the hash's bytes. Two
+# hashes less than BANDS bits apart must agree on at least one whole byte, so
+# for those distances this finds every match; wider searches scan the owner
+BANDS = 8
+# Set bits per byte value, for vectorized Hamming distances
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_BIT_WEIGHTS = (1 << np.arange(HASH_SIZE * HASH_SIZE, dtype=np.uint64)[::-1]).astype(np.uint64)
+
+
+def _grayscale(image: "Image.Image", size: Tuple[int, int]) -> np.ndarray:
+    from PIL import Image
+
+    return np.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int((bits.reshape(-1).astype(np.uint64) * _BIT_WEIGHTS).sum())
+
+
+def dhash(image: "Image.Image") -> int:
+    """64-bit difference hash: whether each pixel is brighter than its right neighbour"""
+    pixels = _grayscale(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_SIZE * 4)
+
+
+def phash(image: "Image.Image") -> int:
+    """64-bit DCT hash: low-frequency coefficients above their median"""
+    pixels = _grayscale(image, (HASH_SIZE * 4, HASH_SIZE * 4))
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return _pack(low > np.median(low.reshape(-1)[1:]))
+
+
+HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Bits differing between value and each of hashes"""
+    diff = np.bitwise_xor(hashes.astype(np.uint64), np.uint64(value))
+    return POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class ImageHashIndex:
+    """
+    Append-only index of (perceptual hash, owner, file name) records in one
+    flat, memory-mapped file.
+
+    Lookups are scoped to one owner, so a user is never handed another
+    user's image. Records are appended under an exclusive file lock so
+    several workers can share the index directory, while lookups take a
+    shared lock and only hold out writers. Each lookup compares the hash
+    against the records in its per-owner byte buckets rather than every
+    record. A thread holding the exclusive lock can still look up, add and
+    reset records.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Records gained an owner column; hashes in the older image_hashes.bin
+        # are not read and come back when the offline pass rebuilds the index
+        self.records_path = self.directory / "image_hashes_v2.bin"
+        self.lock_path = self.directory / "image_hashes.lock"
+        self._count = -1
+        self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        # (owner, band, byte value) -> rows, for the first _bucketed rows
+        self._buckets: Dict[Tuple[int, int, int], List[np.ndarray]] = {}
+        self._bucketed = 0
+        self._thread_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._holder: Optional[int] = None
+
+    def __len__(self) -> int:
+        with self._state_lock:
+            self._refresh()
+            return self._count
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        if self._holder == threading.get_ident():
+            yield
+            return
+        if shared:
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_SH)
+                yield
+            return
+        with self._thread_lock, open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._holder = threading.get_ident()
+            try:
+                yield
+            finally:
+                self._holder = None
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_rows(self) -> int:
+        return self.records_path.stat().st_size // RECORD_DTYPE.itemsize if self.records_path.exists() else 0
+
+    def _refresh(self) -> None:
+        """Re-map the records file when another writer has appended to it"""
+        count = self._file_rows()
+        if count == self._count:
+            return
+        if count == 0:
+            self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        else:
+            self._records = np.memmap(self.records_path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+        self._count = count
+        self._index_bands(count)
+
+    def _index_bands(self, count: int) -> None:
+        """Add rows appended since the last refresh to the byte buckets"""
+        if count < self._bucketed:
+            # The index was reset and rebuilt by another process
+            self._buckets = {}
+            self._bucketed = 0
+        if count == self._bucketed:
+            return
+        hashes = np.asarray(self._records["hash"][self._bucketed:count])
+        owners = np.asarray(self._records["owner"][self._bucketed:count])
+        for band in range(BANDS):
+            values = (hashes >> np.uint64(8 * band)) & np.uint64(0xFF)
+            keys = owners * 256 + values.astype(np.int64)
+            order = np.argsort(keys, kind="stable")
+            unique_keys, starts = np.unique(keys[order], return_index=True)
+            for key, rows in zip(unique_keys.tolist(), np.split(order + self._bucketed, starts[1:])):
+                self._buckets.setdefault((key // 256, band, key % 256), []).append(rows)
+        self._bucketed = count
+
+    def _bucket(self, owner_id: int, band: int, value: int) -> np.ndarray:
+        chunks = self._buckets.get((owner_id, band, value))
+        if not chunks:
+            return np.zeros(0, dtype=np.int64)
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+    def _candidates(self, owner_id: int, value: int, max_distance: int) -> np.ndarray:
+        if max_distance >= BANDS:
+            rows = [self._bucket(owner_id, 0, byte) for byte in range(256)]
+        else:
+            rows = [self._bucket(owner_id, band, (value >> (8 * band)) & 0xFF) for band in range(BANDS)]
+        return np.unique(np.concatenate(rows))
+
+    def add(self, value: int, name: str, owner_id: int) -> None:
+        """Record the hash of a stored file belonging to owner_id"""
+        encoded = name.encode()
+        if len(encoded) > NAME_BYTES:
+            raise ValueError(f"File name longer than {NAME_BYTES} bytes: {name}")
+        record = np.array([(value, owner_id, encoded)], dtype=RECORD_DTYPE)
+        with self._locked():
+            count = self._file_rows()
+            # Drop any half-written record left behind by a crashed writer
+            if self.records_path.exists() and self.records_path.stat().st_size != count * RECORD_DTYPE.itemsize:
+                os.truncate(self.records_path, count * RECORD_DTYPE.itemsize)
+            with open(self.records_path, "ab") as f:
+                f.write(record.tobytes())
+
+    def nearest(
+        self, value: int, max_distance: int, owner_id: int, directory: Optional[Path] = None
+    ) -> Optional[Tuple[str, int]]:
+        """
+        The closest (file name, distance) stored for owner_id within
+        max_distance bits, if any. With directory, the match must also still
+        exist there; the check is made under the shared lock, so the offline
+        pass cannot delete it meanwhile.
+        """
+        if directory is not None:
+            with self._locked(shared=True):
+                match = self.nearest(value, max_distance, owner_id)
+                return match if match is not None and (directory / match[0]).is_file() else None
+        with self._state_lock:
+            self._refresh()
+            records = self._records
+            rows = self._candidates(owner_id, value, max_distance)
+        # Rows bucketed before a rebuild by another process may now hold other records
+        rows = rows[np.asarray(records["owner"][rows]) == owner_id]
+        if len(rows) == 0:
+            return None
+        distances = hamming_distances(np.asarray(records["hash"][rows]), value)
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance:
+            return None
+        return records["name"][rows[best]].decode(), int(distances[best])
+
+    def reset(self) -> None:
+        """Remove every record (used before a rebuild)"""
+        with self._locked(), self._state_lock:
+            if self.records_path.exists():
+                self.records_path.unlink()
+            self._count = -1
+            self._buckets = {}
+            self._bucketed = 0
+
+
+_image_hash_index: Optional[ImageHashIndex] = None
+
+
+def get_image_hash_index() -> ImageHashIndex:
+    """Return the process-wide image hash index, opening it on first use"""
+    global _image_hash_index
+    if _image_hash_index is None:
+        from ..core.config import settings
+        _image_hash_index = ImageHashIndex(settings.DREAM_INDEX_DIR)
+    return _image_hash_index
+
+
+def stored_path(directory: Path, name: str) -> str:
+    """image_path of a dream using directory / name: normalized and relative to the server directory"""
+    return os.path.relpath(directory / name)
+
+
+def _file_owners(db, paths: List[str]) -> Dict[str, set]:
+    from ..db.models.dream import Dream
+
+    owners: Dict[str, set] = {path: set() for path in paths}
+    for start in range(0, len(paths), 500):
+        rows = db.query(Dream.image_path, Dream.user_id).filter(Dream.image_path.in_(paths[start:start + 500]))
+        for image_path, user_id in rows:
+            owners[image_path].add(user_id)
+    return owners
+
+
+def dedup_directory(
+    db,
+    directory: Path,
+    index: ImageHashIndex,
+    hash_function=dhash,
+    max_distance: int = 4,
+    dry_run: bool = False,
+) -> Dict[str, object]:
+    """
+    Collapse near-duplicate images in directory onto the oldest copy.
+
+    Only images whose dreams all belong to the same signed-in users are
+    collapsed together, so no dream is repointed at another user's image.
+    Fallback placeholders, images of anonymous dreams and images no dream
+    uses yet are never touched. Dream rows pointing at a duplicate are
+    repointed to the kept file, the duplicate is deleted and the index is
+    rebuilt from the kept files. With dry_run nothing is changed and the
+    report shows what would be reclaimed.
+
+    The changes are made holding the index lock, so a running worker cannot
+    match a file while it is being deleted, and rows that workers saved
+    during the pass are repointed once more after the deletes. A generation
+    that matched a duplicate just before the pass and saves its dream after
+    the pass can still point at a deleted file, so run it while generation
+    is quiet or with the server stopped.
+    """
+    from PIL import Image
+    from ..db.models.dream import Dream
+    from .stable_diffusion import PLACEHOLDER_PNG_KEY
+
+    files = sorted(directory.glob("*.png"), key=lambda path: (path.stat().st_mtime, path.name))
+    owners = _file_owners(db, [stored_path(directory, path.name) for path in files])
+    # Kept files per owner group, as (hashes, names)
+    kept: Dict[FrozenSet[int], Tuple[List[int], List[str]]] = {}
+    duplicates: Dict[str, Tuple[str, FrozenSet[int]]] = {}
+    placeholders = 0
+    reclaimed = 0
+    for path in files:
+        group = frozenset(owners[stored_path(directory, path.name)])
+        if not group or None in group:
+            continue
+        try:
+            with Image.open(path) as image:
+                if image.info.get(PLACEHOLDER_PNG_KEY):
+                    placeholders += 1
+                    continue
+                value = hash_function(image)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable image {path}: {e}")
+            continue
+        kept_hashes, kept_names = kept.setdefault(group, ([], []))
+        if kept_hashes:
+            distances = hamming_distances(np.array(kept_hashes, dtype=np.uint64), value)
+            best = int(np.argmin(distances))
+            if distances[best] <= max_distance:
+                duplicates[path.name] = (kept_names[best], group)
+                reclaimed += path.stat().st_size
+                continue
+        kept_hashes.append(value)
+        kept_names.append(path.name)
+
+    def repoint() -> int:
+        rows = 0
+        for duplicate, (original, group) in duplicates.items():
+            rows += db.query(Dream).filter(
+                Dream.image_path == stored_path(directory, duplicate), Dream.user_id.in_(group)
+            ).update({Dream.image_path: stored_path(directory, original)}, synchronize_session=False)
+        db.commit()
+        return rows
+
+    repointed = 0
+    if not dry_run:
+        with index._locked():
+            repointed = repoint()
+            for duplicate in duplicates:
+                (directory / duplicate).unlink()
+            # Dreams saved by workers that matched a duplicate meanwhile
+            repointed += repoint()
+            index.reset()
+            for group, (kept_hashes, kept_names) in kept.items():
+                for value, name in zip(kept_hashes, kept_names):
+                    if len(name.encode()) <= NAME_BYTES:
+                        for owner_id in group:
+                            index.add(value, name, owner_id)
+
+    return {
+        "files_scanned": len(files),
+        "files_kept": len(files) - len(duplicates),
+        "placeholders_skipped": placeholders,
+        "duplicates": len(duplicates),
+        "dream_rows_repointed": repointed,
+        "bytes_reclaimed": reclaimed,
+        "dry_run": dry_run,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from ..core.config import settings
+    from ..db.session import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Deduplicate near-identical generated images")
+    parser.add_argument("--directory", default="generated_images")
+    parser.add_argument("--threshold", type=int, default=settings.IMAGE_DEDUP_MAX_DISTANCE, help="max Hamming distance in bits")
+    parser.add_argument("--hash", choices=sorted(HASH_FUNCTIONS), default=settings.IMAGE_DEDUP_HASH)
+    parser.add_argument("--dry-run", action="store_true", help="report without changing anything")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = dedup_directory(
+            db, Path(args.directory), get_image_hash_index(), HASH_FUNCTIONS[args.hash], args.threshold, args.dry_run
+        )
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,182 @@
+"""
+Resized image variants, rendered on demand and kept in a size-bounded disk cache
+"""
+
+import asyncio
+import io
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ..core.config import settings
+from ..core.metrics import CACHE_LOOKUPS, observe_stage
+from ..core.tracing import set_attribute
+
+# PIL is imported where it is used to keep API startup fast
+
+logger = logging.getLogger(__name__)
+
+VARIANT_CACHE_NAME = "image_variants"
+# fmt query value -> (PIL format, media type)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+# Share of max_bytes the cache is trimmed down to, so it is not trimmed on every write
+EVICT_TO = 0.9
+# Variants served or written this recently are never evicted, so a response
+# that has been handed a path can still open the file
+PIN_SECONDS = 60.0
+
+
+def parse_sizes(text: str) -> FrozenSet[int]:
+    """Comma-separated pixel sizes, e.g. "64,128,256" """
+    return frozenset(int(item) for item in text.split(",") if item.strip())
+
+
+def fit_size(source: Tuple[int, int], width: Optional[int], height: Optional[int]) -> Tuple[int, int]:
+    """Largest size within width x height that keeps the aspect ratio, never upscaling"""
+    source_width, source_height = source
+    scale = min(
+        width / source_width if width else 1.0,
+        height / source_height if height else 1.0,
+        1.0,
+    )
+    return max(1, round(source_width * scale)), max(1, round(source_height * scale))
+
+
+def render_variant(source: Path, width: Optional[int], height: Optional[int], fmt: str) -> bytes:
+    """
+    Resize an image to fit width x height and encode it as fmt.
+
+    JPEG sources are decoded at a reduced scale with draft(), then reduce()
+    shrinks by a whole factor cheaply while staying at least twice the target
+    size, so the final Lanczos resize only filters a small image.
+    """
+    from PIL import Image
+
+    pil_format, _ = VARIANT_FORMATS[fmt]
+    with observe_stage("resize") as resize_span, Image.open(source) as image:
+        target = fit_size(image.size, width, height)
+        image.draft("RGB", target)
+        factor = min(image.width // (target[0] * 2), image.height // (target[1] * 2))
+        if factor > 1:
+            image = image.reduce(factor)
+        if image.size != target:
+            image = image.resize(target, Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA") or (pil_format == "JPEG" and image.mode != "RGB"):
+            image = image.convert("RGB")
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=85)
+        resize_span.set_attribute("bytes", buffer.tell())
+        return buffer.getvalue()
+
+
+class VariantCache:
+    """
+    Disk cache of rendered variants, bounded to ``max_bytes``.
+
+    Files are written atomically, so workers sharing the directory never see
+    partial variants. Hits refresh the file's mtime and the oldest files are
+    deleted once the cache grows past its bound, except files touched in the
+    last ``pin_seconds``: those may be about to be streamed, and the cache
+    may overshoot its bound rather than delete them. Concurrent misses for
+    the same key in one worker share a single render.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, pin_seconds: float = PIN_SECONDS):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.pin_seconds = pin_seconds
+        self._size: Optional[int] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, result: str) -> None:
+        CACHE_LOOKUPS.labels(cache=VARIANT_CACHE_NAME, result=result).inc()
+        set_attribute(f"cache.{VARIANT_CACHE_NAME}", result)
+
+    async def get_or_render(self, key: str, render: Callable[[], bytes]) -> Path:
+        """Return the cached file for key, rendering it with render() on a miss"""
+        path = self.directory / key
+        try:
+            os.utime(path)
+            self._record("hit")
+            return path
+        except FileNotFoundError:
+            pass
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._record("coalesced")
+            return await asyncio.shield(pending)
+
+        self._record("miss")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await run_in_threadpool(render)
+            await run_in_threadpool(self._store, path, data)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _store(self, path: Path, data: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+        with self._lock:
+            self._size = self._scan_size() if self._size is None else self._size + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat_result = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        # Rescan: other workers write to the same directory
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        pinned_after = time.time() - self.pin_seconds
+        for mtime, size, path in entries:
+            if total <= self.max_bytes * EVICT_TO or mtime > pinned_after:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+
+@lru_cache(maxsize=None)
+def get_variant_cache() -> VariantCache:
+    """Process-wide variant cache configured from settings"""
+    return VariantCache(settings.MEDIA_VARIANT_CACHE_DIR, settings.MEDIA_VARIANT_CACHE_MAX_MB * 1024 * 1024)
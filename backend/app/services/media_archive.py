@@ -0,0 +1,111 @@
+"""
+Streamed ZIP archives of a user's generated images and videos
+"""
+
+import io
+import logging
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import select
+
+from ..db.models.dream import Dream
+from ..db.models.video import Video
+from ..db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_BATCH_SIZE = 500
+# ZIP timestamps cannot predate 1980
+ZIP_EPOCH = 315619200
+
+
+class _ArchiveBuffer(io.RawIOBase):
+    """
+    Write-only, non-seekable sink for ZipFile.
+
+    Because it cannot seek, ZipFile writes sizes and CRCs in data descriptors
+    after each entry, and the bytes written so far can be drained and sent.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def resolve_media(path: Optional[str], root: Path) -> Optional[Path]:
+    """Return the file for a stored path, or None if missing or outside root"""
+    if not path:
+        return None
+    resolved = Path(path).resolve()
+    if root not in resolved.parents or not resolved.is_file():
+        return None
+    return resolved
+
+
+def _user_media(user_id: int) -> Iterator[Tuple[str, Optional[str], Path]]:
+    db = SessionLocal()
+    try:
+        sources = (
+            (select(Dream.id, Dream.image_path).where(Dream.user_id == user_id).order_by(Dream.id), "images", Path("generated_images")),
+            (select(Video.id, Video.video_path).where(Video.user_id == user_id).order_by(Video.id), "videos", Path("generated_videos")),
+        )
+        for statement, folder, root in sources:
+            for row_id, path in db.execute(statement.execution_options(yield_per=ARCHIVE_BATCH_SIZE)):
+                yield f"{folder}/{row_id}_{os.path.basename(path or '')}", path, root.resolve()
+    finally:
+        db.close()
+
+
+def iter_zip_entries(entries: Iterable[Tuple[str, Optional[str], Path]], chunk_size: int = ARCHIVE_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of (archive name, stored path, root) entries as it is built.
+
+    Files are stored without recompression (images and videos are already
+    compressed) and read in chunks, so memory stays bounded by chunk_size.
+    ZIP64 records are used for large files so multi-gigabyte archives work.
+    """
+    buffer = _ArchiveBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, stored_path, root in entries:
+            source = resolve_media(stored_path, root)
+            if source is None:
+                logger.warning(f"Skipping missing media file: {stored_path}")
+                continue
+            stat_result = source.stat()
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime(max(stat_result.st_mtime, ZIP_EPOCH))[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = stat_result.st_size
+            with open(source, "rb") as src, archive.open(info, mode="w") as dest:
+                while chunk := src.read(chunk_size):
+                    dest.write(chunk)
+                    yield buffer.drain()
+            if data := buffer.drain():
+                yield data
+    if data := buffer.drain():
+        yield data
+
+
+def iter_user_archive(user_id: int) -> Iterator[bytes]:
+    """Yield a ZIP of every image and video a user has generated"""
+    return iter_zip_entries(_user_media(user_id))
@@ -0,0 +1,127 @@
+"""
+Deterministic stand-in for the remote image APIs, for offline capacity and regression testing
+"""
+
+import io
+import math
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import List, Optional
+
+# PIL and numpy are imported where they are used to keep API startup fast
+
+OUTCOME_STATUS = {"ok": 200, "503": 503, "500": 500}
+IMAGE_VARIANTS = 4
+
+
+class SimulatedResponse:
+    """The parts of a requests.Response the image providers read"""
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"content-type": "image/png" if status_code == 200 else "text/plain"}
+        self.text = "" if status_code == 200 else content.decode()
+
+
+@lru_cache(maxsize=16)
+def simulated_image(size: int, variant: int, seed: int) -> bytes:
+    """
+    PNG bytes resembling a generated picture: smooth gradients plus noise,
+    so it is about as large and as costly to decode as a real provider image
+    """
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed * IMAGE_VARIANTS + variant)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    phase = rng.uniform(0, 2 * np.pi, size=3)
+    channels = [127 + 100 * np.sin(2 * np.pi * (x * (c + 1) + y * (3 - c)) + phase[c]) for c in range(3)]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 12, size=(size, size, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class SimulatedImageProvider:
+    """
+    Returns image bytes after a simulated latency, failing some requests.
+
+    Latency is lognormal with the given median (sigma 0 gives a fixed
+    latency). Failures come from ``pattern``, a list of outcomes ("ok",
+    "503", "500") repeated in order, or otherwise at random from
+    ``unavailable_rate`` (503) and ``failure_rate`` (500). All randomness comes
+    from one generator seeded with ``seed``, so the same sequence of requests
+    sees the same latencies and outcomes on every run.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        latency_ms: float = 300.0,
+        latency_sigma: float = 0.0,
+        failure_rate: float = 0.0,
+        unavailable_rate: float = 0.0,
+        image_size: int = 512,
+        pattern: Optional[List[str]] = None,
+    ):
+        unknown = set(pattern or []) - set(OUTCOME_STATUS)
+        if unknown:
+            raise ValueError(f"Unknown simulated outcomes {sorted(unknown)}, expected {sorted(OUTCOME_STATUS)}")
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.unavailable_rate = unavailable_rate
+        self.image_size = image_size
+        self.pattern = pattern or []
+        self._rng = random.Random(seed)
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            index = self._requests
+            self._requests += 1
+            latency = self.latency_ms / 1000
+            if self.latency_sigma > 0:
+                latency *= math.exp(self._rng.gauss(0, self.latency_sigma))
+            if self.pattern:
+                outcome = self.pattern[index % len(self.pattern)]
+            else:
+                roll = self._rng.random()
+                if roll < self.unavailable_rate:
+                    outcome = "503"
+                elif roll < self.unavailable_rate + self.failure_rate:
+                    outcome = "500"
+                else:
+                    outcome = "ok"
+        return index, latency, outcome
+
+    def request(self, prompt: str) -> SimulatedResponse:
+        index, latency, outcome = self._next()
+        time.sleep(latency)
+        if outcome == "ok":
+            return SimulatedResponse(200, simulated_image(self.image_size, index % IMAGE_VARIANTS, self.seed))
+        if outcome == "503":
+            return SimulatedResponse(503, b"Model is currently loading")
+        return SimulatedResponse(500, b"Simulated provider error")
+
+
+@lru_cache(maxsize=None)
+def get_simulated_provider() -> SimulatedImageProvider:
+    """Process-wide simulated provider configured from settings"""
+    from ..core.config import settings
+
+    pattern = [item.strip() for item in settings.SIMULATED_PROVIDER_PATTERN.split(",") if item.strip()]
+    return SimulatedImageProvider(
+        seed=settings.SIMULATED_PROVIDER_SEED,
+        latency_ms=settings.SIMULATED_PROVIDER_LATENCY_MS,
+        latency_sigma=settings.SIMULATED_PROVIDER_LATENCY_SIGMA,
+        failure_rate=settings.SIMULATED_PROVIDER_FAILURE_RATE,
+        unavailable_rate=settings.SIMULATED_PROVIDER_UNAVAILABLE_RATE,
+        image_size=settings.SIMULATED_PROVIDER_IMAGE_SIZE,
+        pattern=pattern,
+    )
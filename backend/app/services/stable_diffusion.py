@@ -1,29 +1,69 @@
 import os
 import uuid
-import requests
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-from PIL import Image, ImageDraw, ImageFont
+from typing import TYPE_CHECKING, Optional, Tuple
 import logging
 import io
 import base64
 
+from ..core.config import settings
+from ..core.metrics import (
+    GENERATIONS_IN_FLIGHT,
+    IMAGE_DEDUP_RESULTS,
+    PLACEHOLDER_FALLBACKS,
+    PROVIDER_REQUESTS,
+    observe_stage,
+)
+from ..core.tracing import inject_headers, span
+
+# requests and PIL are imported where they are used to keep API startup fast
+if TYPE_CHECKING:
+    from PIL import Image
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PLACEHOLDER_FONT_PATHS = [
+    "/System/Library/Fonts/Helvetica.ttc",
+    "/System/Library/Fonts/Arial.ttf",
+    "/Library/Fonts/Arial.ttf"
+]
+
+@lru_cache(maxsize=None)
+def _placeholder_font():
+    """Load the placeholder caption font once per process"""
+    from PIL import ImageFont
+
+    for font_path in PLACEHOLDER_FONT_PATHS:
+        try:
+            return ImageFont.truetype(font_path, 28)
+        except Exception:
+            continue
+    return ImageFont.load_default()
+
+IMAGE_PROVIDERS = ("auto", "huggingface", "pollinations", "simulated")
+# PNG text chunk marking fallback placeholders, which are never deduplicated:
+# they show the prompt, and placeholders for different prompts look alike
+PLACEHOLDER_PNG_KEY = "dream-placeholder"
+
 class StableDiffusionService:
     """Service for generating images using Stable Diffusion"""
     
     def __init__(self):
         self.output_dir = Path("generated_images")
         self.output_dir.mkdir(exist_ok=True)
-        self.hf_api_url = "https://api-inference.huggingface.co/models/runwayml/stable-diffusion-v1-5"
+        self.hf_api_url = settings.HUGGINGFACE_API_URL
+        self.alternative_api_url = settings.POLLINATIONS_API_URL
         # note to self get a free token at https://huggingface.co/settings/tokens
         self.hf_token = os.getenv("HUGGINGFACE_TOKEN", "")
         
-    def _generate_with_huggingface(self, prompt: str) -> Image.Image:
+    def _generate_with_huggingface(self, prompt: str) -> "Image.Image":
         """Generate image using Hugging Face API"""
-        headers = {"Authorization": f"Bearer {self.hf_token}"}
+        import requests
+        from PIL import Image
+        
+        headers = inject_headers({"Authorization": f"Bearer {self.hf_token}"})
         
         payload = {
             "inputs": prompt,
@@ -36,13 +76,20 @@ class StableDiffusionService:
         }
         
         try:
-            response = requests.post(self.hf_api_url, headers=headers, json=payload)
+            with observe_stage("provider_http", provider="huggingface") as http_span:
+                response = requests.post(self.hf_api_url, headers=headers, json=payload)
+                http_span.set_attribute("http.status_code", response.status_code)
+                http_span.set_attribute("response_bytes", len(response.content))
             
             if response.status_code == 200:
-                image = Image.open(io.BytesIO(response.content))
+                with observe_stage("decode"):
+                    image = Image.open(io.BytesIO(response.content))
+                    image.load()
+                PROVIDER_REQUESTS.labels(provider="huggingface", outcome="success").inc()
                 return image
             elif response.status_code == 503:
                 logger.warning("Model loading, trying alternative API...")
+                PROVIDER_REQUESTS.labels(provider="huggingface", outcome="unavailable").inc()
                 return self._generate_with_alternative_api(prompt)
             else:
                 logger.error(f"HuggingFace API error: {response.status_code} - {response.text}")
@@ -50,17 +97,24 @@ class StableDiffusionService:
                 
         except Exception as e:
             logger.error(f"HuggingFace API failed: {e}")
+            PROVIDER_REQUESTS.labels(provider="huggingface", outcome="error").inc()
             raise
     
-    def _generate_with_alternative_api(self, prompt: str) -> Image.Image:
+    def _generate_with_alternative_api(self, prompt: str) -> "Image.Image":
         """Alternative free AI image generation API"""
+        import requests
+        from PIL import Image
+        
         try:
-            api_url = "https://image.pollinations.ai/prompt/"
+            api_url = self.alternative_api_url
             encoded_prompt = prompt.replace(" ", "%20").replace(",", "%2C")
             full_url = f"{api_url}{encoded_prompt}?width=512&height=512&nologo=true"
             
             logger.info(f"Requesting image from: {full_url}")
-            response = requests.get(full_url, timeout=10)
+            with observe_stage("provider_http", provider="pollinations") as http_span:
+                response = requests.get(full_url, timeout=10, headers=inject_headers())
+                http_span.set_attribute("http.status_code", response.status_code)
+                http_span.set_attribute("response_bytes", len(response.content))
             
             logger.info(f"Response status: {response.status_code}, Content-Type: {response.headers.get('content-type', 'unknown')}, Size: {len(response.content)} bytes")
             
@@ -70,7 +124,10 @@ class StableDiffusionService:
                     raise Exception("Response too small to be a valid image")
                 
                 try:
-                    image = Image.open(io.BytesIO(response.content))
+                    with observe_stage("decode"):
+                        image = Image.open(io.BytesIO(response.content))
+                        image.load()
+                    PROVIDER_REQUESTS.labels(provider="pollinations", outcome="success").inc()
                     logger.info(f"Successfully loaded image: {image.size}, format: {image.format}")
                     return image
                 except Exception as img_error:
@@ -82,10 +139,59 @@ class StableDiffusionService:
                 
         except Exception as e:
             logger.error(f"Alternative API failed: {e}")
+            PROVIDER_REQUESTS.labels(provider="pollinations", outcome="error").inc()
+            raise
+
+    def _generate_with_simulated_provider(self, prompt: str) -> "Image.Image":
+        """Generate image with the built-in simulated provider (IMAGE_PROVIDER=simulated)"""
+        from PIL import Image
+        from .simulated_provider import get_simulated_provider
+
+        try:
+            with observe_stage("provider_http", provider="simulated") as http_span:
+                response = get_simulated_provider().request(prompt)
+                http_span.set_attribute("http.status_code", response.status_code)
+                http_span.set_attribute("response_bytes", len(response.content))
+
+            if response.status_code == 200:
+                with observe_stage("decode"):
+                    image = Image.open(io.BytesIO(response.content))
+                    image.load()
+                PROVIDER_REQUESTS.labels(provider="simulated", outcome="success").inc()
+                return image
+            elif response.status_code == 503:
+                PROVIDER_REQUESTS.labels(provider="simulated", outcome="unavailable").inc()
+                raise Exception("Simulated provider unavailable: 503")
+            else:
+                PROVIDER_REQUESTS.labels(provider="simulated", outcome="error").inc()
+                raise Exception(f"Simulated provider error: {response.status_code}")
+
+        except Exception as e:
+            logger.error(f"Simulated provider failed: {e}")
             raise
+
+    def _provider(self) -> str:
+        """The image provider to use: IMAGE_PROVIDER, or for "auto" HuggingFace when a token is set"""
+        if settings.IMAGE_PROVIDER not in IMAGE_PROVIDERS:
+            raise ValueError(f"Unknown IMAGE_PROVIDER {settings.IMAGE_PROVIDER!r}, expected one of {IMAGE_PROVIDERS}")
+        if settings.IMAGE_PROVIDER != "auto":
+            return settings.IMAGE_PROVIDER
+        return "huggingface" if self.hf_token else "pollinations"
         
-    def _generate_placeholder_image(self, prompt: str, width: int = 512, height: int = 512) -> Image.Image:
+    def _find_duplicate(self, image: "Image.Image", owner_id: int) -> Tuple[int, Optional[Path]]:
+        """Perceptual hash of image and an existing near-identical file of the same owner, if there is one"""
+        from .image_dedup import HASH_FUNCTIONS, get_image_hash_index
+
+        image_hash = HASH_FUNCTIONS[settings.IMAGE_DEDUP_HASH](image)
+        match = get_image_hash_index().nearest(image_hash, settings.IMAGE_DEDUP_MAX_DISTANCE, owner_id, self.output_dir)
+        if match is not None:
+            return image_hash, self.output_dir / match[0]
+        return image_hash, None
+
+    def _generate_placeholder_image(self, prompt: str, width: int = 512, height: int = 512) -> "Image.Image":
         """Generate a placeholder image with the prompt text"""
+        from PIL import Image, ImageDraw, ImageFont
+        
         img = Image.new('RGB', (width, height), color=(70, 130, 180))
         draw = ImageDraw.Draw(img)
         
@@ -95,27 +201,14 @@ class StableDiffusionService:
             b = int(180 + (200 - 180) * y / height)
             draw.line([(0, y), (width, y)], fill=(r, g, b))
         
-        try:
-            font_paths = [
-                "/System/Library/Fonts/Helvetica.ttc",
-                "/System/Library/Fonts/Arial.ttf",
-                "/Library/Fonts/Arial.ttf"
-            ]
-            font = None
-            for font_path in font_paths:
-                try:
-                    font = ImageFont.truetype(font_path, 28)
-                    break
-                except:
-                    continue
-            if font is None:
-                font = ImageFont.load_default()
-        except:
-            font = ImageFont.load_default()
+        font = _placeholder_font()
         
         text = f"🎨 Dream: {prompt}"
         if len(text) > 60:
             text = f"🎨 Dream: {prompt[:55]}..."
+        if not isinstance(font, ImageFont.FreeTypeFont):
+            # PIL's built-in bitmap font only covers latin-1
+            text = text.encode("latin-1", "ignore").decode("latin-1").strip()
     
         bbox = draw.textbbox((0, 0), text, font=font)
         text_width = bbox[2] - bbox[0]
@@ -136,71 +229,114 @@ class StableDiffusionService:
         
         return img
     
-    def generate_image(self, prompt: str, filename: Optional[str] = None) -> dict:
+    def generate_image(self, prompt: str, filename: Optional[str] = None, owner_id: Optional[int] = None) -> dict:
         """
         Generate an image from a text prompt using real AI
         
         Args:
             prompt: Text description of the image to generate
             filename: Optional custom filename (without extension)
+            owner_id: User the image is for; only their own images are reused
+                by deduplication, and anonymous images are never deduplicated
             
         Returns:
             dict: Contains both file_path and image_url
         """
         try:
-            if filename is None:
-                filename = f"dream_{uuid.uuid4().hex[:8]}"
-            
-            logger.info(f"🎨 Generating REAL AI image for prompt: {prompt[:50]}...")
-            
-            try:
-                if self.hf_token:
-                    logger.info("Using Hugging Face Stable Diffusion API...")
-                    image = self._generate_with_huggingface(prompt)
-                    logger.info("✅ Successfully generated AI image with Hugging Face!")
-                else:
-                    logger.info("Using free Pollinations.AI for real AI generation...")
-                    image = self._generate_with_alternative_api(prompt)
-                    logger.info("✅ Successfully generated AI image with Pollinations.AI!")
-                    
-            except Exception as ai_error:
-                logger.error(f"❌ AI generation failed with error: {ai_error}")
-                logger.error(f"❌ Error type: {type(ai_error).__name__}")
-                logger.error(f"❌ Full traceback:", exc_info=True)
-                logger.info("🔄 Falling back to enhanced placeholder...")
-                image = self._generate_placeholder_image(prompt)
-            
-            image_path = self.output_dir / f"{filename}.png"
-            image.save(image_path, quality=95)
-            
-            image_url = f"/static/generated_images/{filename}.png"
-            
-            logger.info(f"Image saved to: {image_path}")
-            logger.info(f"Accessible URL: {image_url}")
-            
-            return {
-                "file_path": str(image_path),
-                "image_url": image_url
-            }
+            with GENERATIONS_IN_FLIGHT.labels(kind="image").track_inprogress(), span("image.generate") as generate_span:
+                if filename is None:
+                    filename = f"dream_{uuid.uuid4().hex[:8]}"
+                
+                logger.info(f"🎨 Generating REAL AI image for prompt: {prompt[:50]}...")
+                
+                provider = self._provider()
+                generate_span.set_attribute("provider", provider)
+                placeholder = False
+                try:
+                    if provider == "simulated":
+                        image = self._generate_with_simulated_provider(prompt)
+                    elif provider == "huggingface":
+                        logger.info("Using Hugging Face Stable Diffusion API...")
+                        image = self._generate_with_huggingface(prompt)
+                        logger.info("✅ Successfully generated AI image with Hugging Face!")
+                    else:
+                        logger.info("Using free Pollinations.AI for real AI generation...")
+                        image = self._generate_with_alternative_api(prompt)
+                        logger.info("✅ Successfully generated AI image with Pollinations.AI!")
+                        
+                except Exception as ai_error:
+                    logger.error(f"❌ AI generation failed with error: {ai_error}")
+                    logger.error(f"❌ Error type: {type(ai_error).__name__}")
+                    logger.error(f"❌ Full traceback:", exc_info=True)
+                    logger.info("🔄 Falling back to enhanced placeholder...")
+                    PLACEHOLDER_FALLBACKS.labels(provider=provider).inc()
+                    generate_span.set_attribute("fallback", "placeholder")
+                    with observe_stage("placeholder_render"):
+                        image = self._generate_placeholder_image(prompt)
+                    placeholder = True
+                
+                image_hash = None
+                if settings.IMAGE_DEDUP_ENABLED and not placeholder and owner_id is not None:
+                    with observe_stage("dedup") as dedup_span:
+                        image_hash, duplicate = self._find_duplicate(image, owner_id)
+                        dedup_span.set_attribute("duplicate", duplicate is not None)
+                    if duplicate is not None:
+                        logger.info(f"Reusing near-identical image {duplicate}")
+                        IMAGE_DEDUP_RESULTS.labels(result="reused").inc()
+                        return {
+                            "file_path": str(duplicate),
+                            "image_url": f"/static/generated_images/{duplicate.name}"
+                        }
+                
+                image_path = self.output_dir / f"{filename}.png"
+                with observe_stage("encode") as encode_span:
+                    buffer = io.BytesIO()
+                    pnginfo = None
+                    if placeholder:
+                        from PIL.PngImagePlugin import PngInfo
+                        pnginfo = PngInfo()
+                        pnginfo.add_text(PLACEHOLDER_PNG_KEY, "1")
+                    image.save(buffer, format="PNG", quality=95, pnginfo=pnginfo)
+                    encode_span.set_attribute("bytes", buffer.tell())
+                with observe_stage("storage_write", bytes=buffer.tell()):
+                    image_path.write_bytes(buffer.getvalue())
+                if image_hash is not None:
+                    from .image_dedup import get_image_hash_index
+                    get_image_hash_index().add(image_hash, image_path.name, owner_id)
+                    IMAGE_DEDUP_RESULTS.labels(result="stored").inc()
+                
+                image_url = f"/static/generated_images/{filename}.png"
+                
+                logger.info(f"Image saved to: {image_path}")
+                logger.info(f"Accessible URL: {image_url}")
+                
+                return {
+                    "file_path": str(image_path),
+                    "image_url": image_url
+                }
             
         except Exception as e:
             logger.error(f"Failed to generate image: {e}")
             raise
 
-stable_diffusion_service = StableDiffusionService()
+@lru_cache(maxsize=None)
+def get_stable_diffusion_service() -> StableDiffusionService:
+    """Shared service, created on first use"""
+    return StableDiffusionService()
 
-def generate_image(prompt: str, filename: Optional[str] = None) -> dict:
+def generate_image(prompt: str, filename: Optional[str] = None, owner_id: Optional[int] = None) -> dict:
     """
     Convenience function to generate an image
     
     Args:
         prompt: Text description of the image to generate
         filename: Optional custom filename (without extension)
+        owner_id: User the image is for, scoping deduplication
         
     Returns:
         dict: Contains both file_path and image_url
     """
-    return stable_diffusion_service.generate_image(prompt, filename)
+    return get_stable_diffusion_service().generate_image(prompt, filename, owner_id)
 
 if __name__ == "__main__":
     pass 
\ No newline at end of file
@@ -5,13 +5,13 @@ Video generation service using free APIs
 
 import os
 import uuid
-import requests
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+
+from ..core.metrics import GENERATIONS_IN_FLIGHT, PLACEHOLDER_FALLBACKS, PROVIDER_REQUESTS, observe_stage
+from ..core.tracing import span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -51,6 +51,11 @@ class VideoGenerationService:
         Returns:
             str: Path to generated video file
         """
+        # Imported here so the API starts without loading OpenCV/numpy/PIL
+        import cv2
+        import numpy as np
+        from PIL import Image, ImageDraw
+        
         width, height = 512, 512
         total_frames = duration * fps
         
@@ -140,41 +145,53 @@ class VideoGenerationService:
             dict: Contains file_path and video_url
         """
         try:
-            if filename is None:
-                filename = f"video_{uuid.uuid4().hex[:8]}"
-            
-            logger.info(f"🎬 Generating video for prompt: {prompt[:50]}...")
-            
-            try:
-                logger.info("Attempting to use free video generation APIs...")
-                video_path = self._generate_with_free_api(prompt)
-                logger.info("✅ Successfully generated video with free API!")
-                
-            except Exception as api_error:
-                logger.warning(f"Free API failed: {api_error}")
-                logger.info("🔄 Falling back to placeholder video...")
-                video_path = self._generate_placeholder_video(prompt)
-                logger.info("✅ Generated placeholder video!")
-            
-            final_path = self.output_dir / f"{filename}.mp4"
-            if video_path != str(final_path):
-                Path(video_path).rename(final_path)
-            
-            video_url = f"/static/generated_videos/{filename}.mp4"
-            
-            logger.info(f"Video saved to: {final_path}")
-            logger.info(f"Accessible URL: {video_url}")
-            
-            return {
-                "file_path": str(final_path),
-                "video_url": video_url
-            }
+            with GENERATIONS_IN_FLIGHT.labels(kind="video").track_inprogress(), span("video.generate") as generate_span:
+                if filename is None:
+                    filename = f"video_{uuid.uuid4().hex[:8]}"
+                
+                logger.info(f"🎬 Generating video for prompt: {prompt[:50]}...")
+                
+                try:
+                    logger.info("Attempting to use free video generation APIs...")
+                    with observe_stage("provider_http", provider="free_video_api"):
+                        video_path = self._generate_with_free_api(prompt)
+                    PROVIDER_REQUESTS.labels(provider="free_video_api", outcome="success").inc()
+                    logger.info("✅ Successfully generated video with free API!")
+                    
+                except Exception as api_error:
+                    logger.warning(f"Free API failed: {api_error}")
+                    logger.info("🔄 Falling back to placeholder video...")
+                    PROVIDER_REQUESTS.labels(provider="free_video_api", outcome="error").inc()
+                    PLACEHOLDER_FALLBACKS.labels(provider="free_video_api").inc()
+                    generate_span.set_attribute("fallback", "placeholder")
+                    # Frames are rendered and encoded together, so this covers both
+                    with observe_stage("placeholder_video_render"):
+                        video_path = self._generate_placeholder_video(prompt)
+                    logger.info("✅ Generated placeholder video!")
+                
+                final_path = self.output_dir / f"{filename}.mp4"
+                if video_path != str(final_path):
+                    with observe_stage("storage_write", bytes=os.path.getsize(video_path)):
+                        Path(video_path).rename(final_path)
+                
+                video_url = f"/static/generated_videos/{filename}.mp4"
+                
+                logger.info(f"Video saved to: {final_path}")
+                logger.info(f"Accessible URL: {video_url}")
+                
+                return {
+                    "file_path": str(final_path),
+                    "video_url": video_url
+                }
             
         except Exception as e:
             logger.error(f"Failed to generate video: {e}")
             raise
 
-video_generation_service = VideoGenerationService()
+@lru_cache(maxsize=None)
+def get_video_generation_service() -> VideoGenerationService:
+    """Shared service, created on first use"""
+    return VideoGenerationService()
 
 def generate_video(prompt: str, filename: Optional[str] = None) -> dict:
     """
@@ -187,7 +204,7 @@ def generate_video(prompt: str, filename: Optional[str] = None) -> dict:
     Returns:
         dict: Contains file_path and video_url
     """
-    return video_generation_service.generate_video(prompt, filename)
+    return get_video_generation_service().generate_video(prompt, filename)
 
 if __name__ == "__main__":
     result = generate_video("A peaceful sunset over the ocean with gentle waves")
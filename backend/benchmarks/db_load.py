@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Mixed read/write database load against the API, served in-process over ASGI.
+
+Each virtual user lists their dreams, searches them and periodically revokes
+their tokens (a row update), so handlers that block the event loop on the
+database show up directly as lower throughput and higher tail latency.
+
+    cd backend
+    python -m benchmarks.db_load --users 50 --requests 40 --write-ratio 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+from app.main import app
+from app.core.security import create_access_token
+from app.db.models.dream import Dream
+from app.db.models.user import User
+from app.db.session import SessionLocal
+
+
+def seed_users(count: int, dreams_per_user: int) -> list:
+    db = SessionLocal()
+    try:
+        users = [User(email=f"load_{uuid.uuid4().hex[:12]}@example.com", hashed_password="x") for _ in range(count)]
+        db.add_all(users)
+        db.commit()
+        db.add_all([
+            Dream(user_id=user.id, prompt=f"Load test dream {i} about flying over the ocean", image_path=f"generated_images/load_{i}.png")
+            for user in users
+            for i in range(dreams_per_user)
+        ])
+        db.commit()
+        return [(user.id, user.email) for user in users]
+    finally:
+        db.close()
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def virtual_user(client, user_id: int, email: str, requests: int, write_ratio: float, latencies: dict, errors: list):
+    version = 0
+    rng = random.Random(user_id)
+    for _ in range(requests):
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': email, 'uid': user_id, 'ver': version})}"}
+        roll = rng.random()
+        if roll < write_ratio:
+            kind, request = "revoke", client.post("/api/v1/auth/revoke", headers=headers)
+            version += 1
+        elif roll < (1 + write_ratio) / 2:
+            kind, request = "list", client.get("/api/v1/dreams/me", headers=headers)
+        else:
+            kind, request = "search", client.get("/api/v1/dreams/search", params={"q": "ocean"}, headers=headers)
+        started = time.perf_counter()
+        response = await request
+        latencies[kind].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors.append((kind, response.status_code))
+
+
+async def run(users: int, requests: int, write_ratio: float, dreams_per_user: int) -> dict:
+    accounts = seed_users(users, dreams_per_user)
+    latencies = defaultdict(list)
+    errors = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            virtual_user(client, user_id, email, requests, write_ratio, latencies, errors)
+            for user_id, email in accounts
+        ))
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(samples) for samples in latencies.values())
+    return {
+        "users": users,
+        "requests": total,
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 1),
+        "latency_ms": {
+            kind: {
+                "p50": round(statistics.median(samples) * 1000, 2),
+                "p95": round(percentile(samples, 0.95) * 1000, 2),
+                "p99": round(percentile(samples, 0.99) * 1000, 2),
+            }
+            for kind, samples in sorted(latencies.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=40, help="requests per virtual user")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="fraction of requests that write")
+    parser.add_argument("--dreams", type=int, default=20, help="dreams seeded per user")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(args.users, args.requests, args.write_ratio, args.dreams)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
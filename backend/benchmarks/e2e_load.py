@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark against a real server and a fake image provider.
+
+Starts benchmarks.fake_provider and a uvicorn server (in a scratch
+directory with its own SQLite database), registers users, then sends an
+open-loop mix of requests at a fixed target rate:
+
+    login         POST /api/v1/auth/login
+    create_dream  POST /api/v1/dreams/
+    my_dreams     GET  /api/v1/dreams/me
+    create_video  POST /api/v1/videos/
+    static        GET  /static/generated_images/<a generated image>
+
+Latency is measured from each request's scheduled start, so time spent
+queued behind a slow server counts (no coordinated omission). The report
+is JSON with p50/p95/p99, throughput and error rates per operation, plus
+the git commit, so runs can be compared across commits.
+
+    cd backend
+    python -m benchmarks.e2e_load --rps 20 --duration 30 --output e2e.json
+    python -m benchmarks.e2e_load --provider-latency-ms 800 --provider-failure-rate 0.1 \\
+        --mix login=1,create_dream=2,my_dreams=4,static=3
+    python -m benchmarks.e2e_load --provider simulated --provider-latency-sigma 0.5 \\
+        --provider-unavailable-rate 0.05
+
+With --provider simulated the server uses its built-in simulated provider
+(IMAGE_PROVIDER=simulated) instead of calling the fake provider over HTTP.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.fake_provider import start_fake_provider
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "login=1,create_dream=2,my_dreams=4,create_video=0.2,static=3"
+PASSWORD = "bench-password"
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}, expected one of {sorted(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def start_server(scratch: str, port: int, provider_url: str, args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        PYTHONPATH=BACKEND_DIR,
+        DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+        JWT_SECRET="bench-secret",
+        JWT_ALGORITHM="HS256",
+        ACCESS_TOKEN_EXPIRE_MINUTES="60",
+        HUGGINGFACE_API_URL=f"{provider_url}/models/fake",
+        POLLINATIONS_API_URL=f"{provider_url}/prompt/",
+        HUGGINGFACE_TOKEN="bench-token" if args.provider == "huggingface" else "",
+        DREAM_INDEX_DIR=os.path.join(scratch, "dream_index"),
+        LOGIN_RATE_LIMIT_ENABLED="false",
+        BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+    )
+    if args.provider == "simulated":
+        # In-process provider: no HTTP hop, same decode/save/fallback path
+        env.update(
+            IMAGE_PROVIDER="simulated",
+            SIMULATED_PROVIDER_SEED=str(args.seed),
+            SIMULATED_PROVIDER_LATENCY_MS=str(args.provider_latency_ms),
+            SIMULATED_PROVIDER_LATENCY_SIGMA=str(args.provider_latency_sigma),
+            SIMULATED_PROVIDER_FAILURE_RATE=str(args.provider_failure_rate),
+            SIMULATED_PROVIDER_UNAVAILABLE_RATE=str(args.provider_unavailable_rate),
+        )
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=scratch, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError("server did not become ready")
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, users: list):
+        self.client = client
+        self.users = users
+        self.images = []
+
+    def user(self, rng: random.Random) -> dict:
+        return rng.choice(self.users)
+
+    async def login(self, rng):
+        user = self.user(rng)
+        response = await self.client.post("/api/v1/auth/login", data={"username": user["email"], "password": PASSWORD})
+        if response.status_code == 200:
+            user["token"] = response.json()["access_token"]
+        return response
+
+    async def create_dream(self, rng):
+        headers = {"Authorization": f"Bearer {self.user(rng)['token']}"}
+        response = await self.client.post("/api/v1/dreams/", json={"prompt": f"benchmark dream {rng.random():.6f}"}, headers=headers)
+        if response.status_code == 200:
+            self.images.append(response.json()["image_url"])
+        return response
+
+    async def my_dreams(self, rng):
+        headers = {"Authorization": f"Bearer {self.user(rng)['token']}"}
+        return await self.client.get("/api/v1/dreams/me", headers=headers)
+
+    async def create_video(self, rng):
+        headers = {"Authorization": f"Bearer {self.user(rng)['token']}"}
+        return await self.client.post("/api/v1/videos/", json={"prompt": f"benchmark video {rng.random():.6f}"}, headers=headers)
+
+    async def static(self, rng):
+        return await self.client.get(rng.choice(self.images))
+
+
+OPERATIONS = {name for name in vars(Workload) if not name.startswith("_") and name != "user"}
+
+
+async def setup_users(client: httpx.AsyncClient, count: int) -> list:
+    users = []
+    for _ in range(count):
+        email = f"bench_{uuid.uuid4().hex[:12]}@example.com"
+        response = await client.post("/api/v1/auth/register", json={"email": email, "password": PASSWORD})
+        response.raise_for_status()
+        response = await client.post("/api/v1/auth/login", data={"username": email, "password": PASSWORD})
+        response.raise_for_status()
+        users.append({"email": email, "token": response.json()["access_token"]})
+    return users
+
+
+async def drive(workload: Workload, mix: dict, rps: float, duration: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+
+    async def one(name: str, scheduled: float):
+        try:
+            response = await getattr(workload, name)(rng)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies[name].append(time.perf_counter() - scheduled)
+        statuses[name][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            errors[name] += 1
+
+    started = time.perf_counter()
+    tasks = []
+    for i in range(int(rps * duration)):
+        scheduled = started + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(rng.choices(names, weights)[0], scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    def summarize(samples: list, failed: int) -> dict:
+        return {
+            "requests": len(samples),
+            "errors": failed,
+            "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+            "p50_ms": round(statistics.median(samples) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+        }
+
+    every = [sample for samples in latencies.values() for sample in samples]
+    return {
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(every) / elapsed, 2),
+        "overall": summarize(every, sum(errors.values())),
+        "operations": {
+            name: {**summarize(samples, errors[name]), "statuses": dict(statuses[name])}
+            for name, samples in sorted(latencies.items())
+        },
+    }
+
+
+async def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    provider = start_fake_provider(
+        latency=args.provider_latency_ms / 1000,
+        jitter=args.provider_jitter_ms / 1000,
+        failure_rate=args.provider_failure_rate,
+    )
+    port = free_port()
+    with tempfile.TemporaryDirectory() as scratch:
+        server = start_server(scratch, port, provider.url, args)
+        try:
+            limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+                await wait_until_ready(client)
+                workload = Workload(client, await setup_users(client, args.users))
+                if "static" in mix:
+                    # Something to fetch from the start
+                    for _ in range(3):
+                        await workload.create_dream(random.Random())
+                    if not workload.images:
+                        raise SystemExit("could not create any dream to serve as a static file")
+                results = await drive(workload, mix, args.rps, args.duration, args.seed)
+        finally:
+            server.terminate()
+            server.wait()
+            provider.shutdown()
+
+    return {
+        "benchmark": "e2e_load",
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {
+            "target_rps": args.rps,
+            "duration": args.duration,
+            "workers": args.workers,
+            "users": args.users,
+            "mix": mix,
+            "provider": args.provider,
+            "provider_latency_ms": args.provider_latency_ms,
+            "provider_jitter_ms": args.provider_jitter_ms,
+            "provider_failure_rate": args.provider_failure_rate,
+            "provider_latency_sigma": args.provider_latency_sigma,
+            "provider_unavailable_rate": args.provider_unavailable_rate,
+            "bcrypt_rounds": args.bcrypt_rounds,
+        },
+        "provider_requests": dict(provider.counts),
+        **results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=20.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight pairs")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--provider", choices=["pollinations", "huggingface", "simulated"], default="pollinations")
+    parser.add_argument("--provider-latency-ms", type=float, default=300.0)
+    parser.add_argument("--provider-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--provider-failure-rate", type=float, default=0.0)
+    parser.add_argument("--provider-latency-sigma", type=float, default=0.0, help="lognormal latency shape (simulated only)")
+    parser.add_argument("--provider-unavailable-rate", type=float, default=0.0, help="fraction of 503s (simulated only)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--max-connections", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--server-log", help="write the server's output to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the HuggingFace and Pollinations image APIs.
+
+Answers POST /models/... (HuggingFace) and GET /prompt/... (Pollinations)
+with a PNG after a configurable latency, failing a configurable fraction of
+requests with 500. Point the app at it with HUGGINGFACE_API_URL and
+POLLINATIONS_API_URL.
+
+    cd backend
+    python -m benchmarks.fake_provider --port 9100 --latency-ms 300 --failure-rate 0.05
+"""
+
+import argparse
+import io
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+def noise_png(size: int = 512, seed: int = 0) -> bytes:
+    """A PNG that does not compress away, so payloads are realistically sized"""
+    from PIL import Image
+
+    pixels = random.Random(seed).randbytes(size * size * 3)
+    image = Image.frombytes("RGB", (size, size), pixels)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float, jitter: float, failure_rate: float, image_size: int):
+        super().__init__(address, FakeProviderHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.image = noise_png(image_size)
+        self.counts = {"requests": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    server: FakeProviderServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.startswith("/prompt/"):
+            self._respond_with_image()
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/models/"):
+            self._respond_with_image()
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def _respond_with_image(self):
+        server = self.server
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        failed = random.random() < server.failure_rate
+        with server._lock:
+            server.counts["requests"] += 1
+            server.counts["failures"] += failed
+        if failed:
+            self._send(500, b"simulated provider failure", "text/plain")
+        else:
+            self._send(200, server.image, "image/png")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_provider(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.3,
+    jitter: float = 0.0,
+    failure_rate: float = 0.0,
+    image_size: int = 512,
+) -> FakeProviderServer:
+    """Serve the fake provider from a background thread; call shutdown() to stop it"""
+    server = FakeProviderServer((host, port), latency, jitter, failure_rate, image_size)
+    threading.Thread(target=server.serve_forever, name="fake-provider", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, default=512)
+    args = parser.parse_args()
+
+    server = FakeProviderServer(
+        (args.host, args.port), args.latency_ms / 1000, args.jitter_ms / 1000, args.failure_rate, args.image_size
+    )
+    print(f"HUGGINGFACE_API_URL={server.url}/models/fake")
+    print(f"POLLINATIONS_API_URL={server.url}/prompt/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
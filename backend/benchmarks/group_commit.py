@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Insert throughput with and without the group-commit writer.
+
+Concurrent tasks each insert dreams one at a time, either committing their
+own transaction (as create_dream does by default) or through BatchWriter.
+
+    cd backend
+    python -m benchmarks.group_commit --tasks 64 --inserts 50
+    SQLITE_SYNCHRONOUS=FULL python -m benchmarks.group_commit
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from app.core.config import settings
+from app.db.batch_writer import BatchWriter
+from app.db.init_db import init_db
+from app.db.models.dream import Dream
+from app.db.session import AsyncSessionLocal, engine
+
+
+async def insert_directly(obj):
+    async with AsyncSessionLocal() as db:
+        db.add(obj)
+        await db.commit()
+        await db.refresh(obj)
+    return obj
+
+
+async def measure(mode: str, tasks: int, inserts: int, interval_ms: float, max_batch: int) -> dict:
+    writer = BatchWriter(flush_interval=interval_ms / 1000, max_batch=max_batch)
+    save = writer.submit if mode == "batched" else insert_directly
+
+    async def client(task_id: int):
+        for i in range(inserts):
+            await save(Dream(prompt=f"group commit benchmark {task_id}-{i}"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(task_id) for task_id in range(tasks)))
+    elapsed = time.perf_counter() - started
+    await writer.close()
+    return {"mode": mode, "inserts_per_second": round(tasks * inserts / elapsed, 1), "seconds": round(elapsed, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=64, help="concurrent inserting tasks")
+    parser.add_argument("--inserts", type=int, default=50, help="inserts per task")
+    parser.add_argument("--interval-ms", type=float, default=settings.WRITE_BATCH_INTERVAL_MS)
+    parser.add_argument("--max-batch", type=int, default=settings.WRITE_BATCH_MAX_SIZE)
+    args = parser.parse_args()
+
+    init_db(engine)
+    results = [
+        asyncio.run(measure(mode, args.tasks, args.inserts, args.interval_ms, args.max_batch))
+        for mode in ("direct", "batched")
+    ]
+    print(json.dumps({"synchronous": settings.SQLITE_SYNCHRONOUS, "tasks": args.tasks, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the image and video rendering hot paths.
+
+Every case runs on fixed inputs with fixed seeds:
+
+    placeholder_image   StableDiffusionService._generate_placeholder_image
+    placeholder_video   VideoGenerationService._generate_placeholder_video
+    image_encode        PNG-encode a 512x512 image in memory
+    image_save          PNG-encode and write it to a file
+    dream_serialization serialize 100 DreamResponse items as /dreams/me does
+
+Throughput is the median ops/sec over several rounds. Peak memory is
+measured with tracemalloc in a separate run, because tracing slows the code
+down. It covers Python and numpy allocations; PIL and OpenCV buffers are
+not included.
+Save a baseline, then compare later runs against it; a case that gets
+slower or uses more memory than the threshold is flagged as a regression
+and the exit status is 1.
+
+    cd backend
+    python -m benchmarks.hot_paths --save hot_paths_baseline.json
+    python -m benchmarks.hot_paths --compare hot_paths_baseline.json --threshold 0.1
+    python -m benchmarks.hot_paths --cases image_encode dream_serialization
+"""
+
+import argparse
+import io
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict
+
+import numpy as np
+
+PROMPT = "A lighthouse on a floating island above a sea of clouds at dawn"
+SEED = 1234
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def fixed_image(size: int = 512):
+    """A deterministic image with gradients and noise, similar to a generated picture"""
+    from PIL import Image
+
+    rng = np.random.default_rng(SEED)
+    y, x = np.mgrid[0:size, 0:size]
+    base = np.stack([x * 255 // size, y * 255 // size, (x + y) * 127 // size], axis=-1)
+    noise = rng.integers(-24, 24, size=base.shape)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def build_cases(scratch: Path) -> Dict[str, dict]:
+    """name -> {"setup": () -> op, "iterations": calls per round}"""
+
+    def placeholder_image():
+        from app.services.stable_diffusion import StableDiffusionService
+
+        service = StableDiffusionService()
+        return lambda: service._generate_placeholder_image(PROMPT)
+
+    def placeholder_video():
+        from app.services.video_generation import VideoGenerationService
+
+        service = VideoGenerationService()
+        service.output_dir = scratch
+
+        def op():
+            Path(service._generate_placeholder_video(PROMPT)).unlink()
+        return op
+
+    def image_encode():
+        image = fixed_image()
+
+        def op():
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", quality=95)
+        return op
+
+    def image_save():
+        image = fixed_image()
+        path = scratch / "encoded.png"
+        return lambda: image.save(path, quality=95)
+
+    def dream_serialization():
+        from fastapi.encoders import jsonable_encoder
+        from fastapi.responses import JSONResponse
+
+        from app.db.schemas.dream import DreamResponse
+
+        created = datetime(2024, 1, 1, 12, 0, 0)
+        rows = [
+            dict(id=i, user_id=7, prompt=f"{PROMPT} #{i}", image_url=f"/static/generated_images/dream_{i:08x}.png", created_at=created)
+            for i in range(100)
+        ]
+        # What FastAPI does for a response_model=List[DreamResponse] route
+        return lambda: JSONResponse(jsonable_encoder([DreamResponse(**row) for row in rows])).body
+
+    return {
+        "placeholder_image": {"setup": placeholder_image, "iterations": 10},
+        "placeholder_video": {"setup": placeholder_video, "iterations": 1},
+        "image_encode": {"setup": image_encode, "iterations": 5},
+        "image_save": {"setup": image_save, "iterations": 5},
+        "dream_serialization": {"setup": dream_serialization, "iterations": 200},
+    }
+
+
+def seed_everything() -> None:
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+
+def measure(op: Callable[[], object], iterations: int, rounds: int) -> dict:
+    seed_everything()
+    op()  # warm-up: imports, caches, first-call allocations
+    rates = []
+    for _ in range(rounds):
+        seed_everything()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            op()
+        rates.append(iterations / (time.perf_counter() - started))
+
+    seed_everything()
+    tracemalloc.start()
+    try:
+        op()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(statistics.median(rates), 3),
+        "ops_per_sec_stdev": round(statistics.stdev(rates), 3) if len(rates) > 1 else 0.0,
+        "peak_bytes": peak,
+        "iterations": iterations,
+        "rounds": rounds,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> dict:
+    """Per-case change against the baseline; regressions beyond threshold are flagged"""
+    report = {}
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None or "error" in before:
+            report[name] = {"status": "new"}
+            continue
+        if "error" in result:
+            report[name] = {"status": "regression", "reason": "now failing"}
+            continue
+        speed = result["ops_per_sec"] / before["ops_per_sec"] - 1
+        memory = result["peak_bytes"] / before["peak_bytes"] - 1 if before["peak_bytes"] else 0.0
+        reasons = []
+        if speed < -threshold:
+            reasons.append(f"ops/sec {speed:+.1%}")
+        if memory > threshold:
+            reasons.append(f"peak memory {memory:+.1%}")
+        report[name] = {
+            "status": "regression" if reasons else "ok",
+            "ops_per_sec_change": round(speed, 4),
+            "peak_bytes_change": round(memory, 4),
+        }
+        if reasons:
+            report[name]["reason"] = ", ".join(reasons)
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", help="run only these cases")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the iterations per round")
+    parser.add_argument("--save", help="write the results to this baseline file")
+    parser.add_argument("--compare", help="compare against this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change treated as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        cases = build_cases(Path(scratch))
+        unknown = set(args.cases or []) - set(cases)
+        if unknown:
+            parser.error(f"unknown cases: {sorted(unknown)}")
+        results = {}
+        for name, case in cases.items():
+            if args.cases and name not in args.cases:
+                continue
+            iterations = max(1, round(case["iterations"] * args.scale))
+            try:
+                results[name] = measure(case["setup"](), iterations, args.rounds)
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+
+    report = {
+        "benchmark": "hot_paths",
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "seed": SEED,
+        "cases": results,
+    }
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        report["baseline_commit"] = baseline.get("git_commit")
+        report["threshold"] = args.threshold
+        report["comparison"] = compare(results, baseline["cases"], args.threshold)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.save:
+        Path(args.save).write_text(text + "\n")
+    if any(entry["status"] == "regression" for entry in report.get("comparison", {}).values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
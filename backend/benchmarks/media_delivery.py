@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Compare static media delivery modes: throughput and server CPU per request.
+
+For each MEDIA_DELIVERY mode, starts the API in a scratch directory with
+generated media files of a fixed size, then fetches them from
+/static/generated_images with a fixed number of concurrent clients:
+
+    python      the worker reads and streams the file (StaticFiles)
+    sendfile    the ASGI server sends it with os.sendfile, if it supports
+                the zerocopysend or pathsend extension (uvicorn does not,
+                so under uvicorn this mode streams from Python)
+    x-accel     the worker answers with X-Accel-Redirect and nginx sends it
+    x-sendfile  the worker answers with X-Sendfile (Apache, lighttpd)
+
+Server CPU is read from /proc for the server and its worker processes. In
+the proxy modes no proxy runs here, so the numbers show what is left on
+the API workers once the proxy takes over the transfer. The report also
+shows how many responses the server actually delivered in each mode,
+taken from /metrics.
+
+    cd backend
+    python -m benchmarks.media_delivery --duration 10 --concurrency 32 --file-kb 512
+    python -m benchmarks.media_delivery --server granian --modes python sendfile
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.e2e_load import BACKEND_DIR, free_port, git_commit, percentile, wait_until_ready
+
+MODES = ["python", "sendfile", "x-accel", "x-sendfile"]
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def process_tree(pid: int) -> list:
+    """pid and all its descendants"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of a process tree"""
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        total += int(fields[11]) + int(fields[12])
+    return total / CLOCK_TICKS
+
+
+def write_media(directory: str, count: int, size: int) -> list:
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for i in range(count):
+        name = f"bench_{i:04d}.png"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n" + os.urandom(size - 8))
+        names.append(name)
+    return names
+
+
+def start_server(scratch: str, port: int, mode: str, args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        PYTHONPATH=BACKEND_DIR,
+        DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+        JWT_SECRET="bench-secret",
+        DREAM_INDEX_DIR=os.path.join(scratch, "dream_index"),
+        MEDIA_DELIVERY=mode,
+    )
+    if args.server == "granian":
+        command = ["granian", "--interface", "asgi", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(args.workers), "app.main:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(args.workers), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=scratch, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+async def fetch_loop(client: httpx.AsyncClient, names: list, offset: int, deadline: float, stats: dict):
+    i = offset
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(f"/static/generated_images/{names[i % len(names)]}")
+            ok = response.status_code == 200
+            stats["bytes"] += len(response.content)
+        except httpx.HTTPError:
+            ok = False
+        stats["latencies"].append(time.perf_counter() - started)
+        stats["errors"] += not ok
+        i += 1
+
+
+async def delivered(client: httpx.AsyncClient) -> dict:
+    counts = {}
+    for line in (await client.get("/metrics")).text.splitlines():
+        if line.startswith("static_media_deliveries_total{"):
+            mode = line.split('mode="', 1)[1].split('"', 1)[0]
+            counts[mode] = counts.get(mode, 0) + int(float(line.rsplit(" ", 1)[1]))
+    return counts
+
+
+async def run_mode(mode: str, args) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as scratch:
+        names = write_media(os.path.join(scratch, "generated_images"), args.files, args.file_kb * 1024)
+        server = start_server(scratch, port, mode, args)
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+                await wait_until_ready(client)
+                stats = {"latencies": [], "errors": 0, "bytes": 0}
+                await fetch_loop(client, names, 0, time.perf_counter() + 1, {"latencies": [], "errors": 0, "bytes": 0})
+                cpu_before = cpu_seconds(server.pid)
+                started = time.perf_counter()
+                deadline = started + args.duration
+                await asyncio.gather(*(fetch_loop(client, names, i, deadline, stats) for i in range(args.concurrency)))
+                elapsed = time.perf_counter() - started
+                cpu = cpu_seconds(server.pid) - cpu_before
+                modes = await delivered(client)
+        finally:
+            server.terminate()
+            server.wait()
+
+    requests = len(stats["latencies"])
+    return {
+        "requests": requests,
+        "errors": stats["errors"],
+        "throughput_rps": round(requests / elapsed, 2),
+        "body_mib_per_sec": round(stats["bytes"] / elapsed / 2**20, 2),
+        "server_cpu_seconds": round(cpu, 3),
+        "server_cpu_ms_per_request": round(cpu * 1000 / requests, 4) if requests else None,
+        "p50_ms": round(percentile(stats["latencies"], 0.5) * 1000, 2),
+        "p99_ms": round(percentile(stats["latencies"], 0.99) * 1000, 2),
+        "delivered_by": modes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--server", choices=["uvicorn", "granian"], default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent client connections")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--file-kb", type=int, default=512, help="size of each media file")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "media_delivery",
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "modes": {mode: asyncio.run(run_mode(mode, args)) for mode in args.modes},
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory of prefork mode against plain uvicorn workers.
+
+Both servers start with WARM_STATE on, so every worker has the imaging
+libraries, fonts, dream index and services loaded. Worker pids come from
+/health/ready; RSS, PSS and USS (private) memory are read from
+/proc/<pid>/smaps_rollup once every worker has answered. Shared pages count
+fully in each worker's RSS but are split between workers in PSS, so the PSS
+total is the real footprint of the server.
+
+    cd backend
+    python -m benchmarks.prefork_memory --workers 4
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from app.core.warm_state import memory_usage
+
+MIB = 1024 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode: str, port: int, workers: int) -> list:
+    if mode == "prefork":
+        code = f"from app.core.prefork import serve_prefork; serve_prefork('127.0.0.1', {port}, {workers}, log_level='warning')"
+        return [sys.executable, "-c", code]
+    return [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"]
+
+
+def ready_worker(port: int):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=2) as response:
+            body = json.loads(response.read())
+    except (OSError, urllib.error.HTTPError, ValueError):
+        return None
+    return body if body.get("warm") else None
+
+
+def measure(mode: str, workers: int, timeout: float) -> dict:
+    port = free_port()
+    env = dict(os.environ, WARM_STATE="true")
+    started = time.perf_counter()
+    server = subprocess.Popen(server_command(mode, port, workers), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        seen = {}
+        while len(seen) < workers:
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f"{mode}: only {len(seen)} of {workers} workers became ready")
+            body = ready_worker(port)
+            if body is None:
+                time.sleep(0.05)
+                continue
+            seen[body["pid"]] = body
+        ready_seconds = time.perf_counter() - started
+
+        per_worker = []
+        for pid, body in sorted(seen.items()):
+            usage = memory_usage(pid)
+            per_worker.append({
+                "pid": pid,
+                "worker": body["worker"],
+                **{key: round(value / MIB, 1) for key, value in usage.items()},
+                "warm_up_seconds": round(sum(step["seconds"] for step in body["warm_state"].values()), 3),
+                "warmed_in_parent": all(step["pid"] != pid for step in body["warm_state"].values()),
+            })
+        parent = memory_usage(server.pid)
+        return {
+            "mode": mode,
+            "workers": workers,
+            "ready_seconds": round(ready_seconds, 3),
+            "parent_mib": {key: round(value / MIB, 1) for key, value in parent.items()},
+            "per_worker_mib": per_worker,
+            "total_mib": {
+                key: round(sum(worker[key] for worker in per_worker) + parent[key] / MIB, 1)
+                for key in ("rss", "pss", "uss")
+            },
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=["uvicorn", "prefork"], choices=["uvicorn", "prefork"])
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for every worker")
+    args = parser.parse_args()
+    print(json.dumps({"results": [measure(mode, args.workers, args.timeout) for mode in args.modes]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
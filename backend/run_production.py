@@ -12,7 +12,11 @@ This script provides a production-ready server configuration with:
 import uvicorn
 import logging
 import os
-from app.main import app
+import tempfile
+from app.core.config import settings
+from app.core.prefork import serve_prefork
+from app.db.init_db import init_db
+from app.db.session import engine
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,13 +30,36 @@ def main():
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
     workers = int(os.getenv("WORKERS", 1))
+    # "uvicorn" starts independent worker processes; "prefork" warms shared
+    # state once and forks the workers from it
+    server_mode = os.getenv("SERVER_MODE", "uvicorn")
     
     logger.info("🚀 Starting Dream Visualizer API (Production)")
     logger.info(f"📍 Server: {host}:{port}")
-    logger.info(f"👥 Workers: {workers}")
+    logger.info(f"👥 Workers: {workers} ({server_mode})")
     logger.info(f"🔗 API docs: http://{host}:{port}/docs")
     
+    if workers > 1:
+        # Each worker writes its metrics to files in this directory and
+        # /metrics adds them up, whichever worker answers the scrape. It has
+        # to be set before prometheus_client is first imported.
+        metrics_dir = os.environ.setdefault(
+            "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"dream-visualizer-metrics-{port}")
+        )
+        from app.core.metrics import prepare_multiprocess_dir
+        prepare_multiprocess_dir(metrics_dir)
+        logger.info(f"📊 Worker metrics: {metrics_dir}")
+    
+    # Create or upgrade the schema once here rather than in every worker
+    init_db(engine)
+    engine.dispose()
+    os.environ["DB_INIT_ON_STARTUP"] = "false"
+    settings.DB_INIT_ON_STARTUP = False
+    
     try:
+        if server_mode == "prefork":
+            serve_prefork(host, port, workers, log_level="info", access_log=True)
+            return
         uvicorn.run(
             "app.main:app",
             host=host,
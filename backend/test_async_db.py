@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Test the async database engine used by the request handlers
+"""
+
+import asyncio
+import uuid
+
+import httpx
+from app.main import app
+from app.db.session import SessionLocal, engine, Base, async_database_url
+from app.db.models.user import User
+from app.core.security import create_access_token, token_claims
+
+def test_async_database_url():
+    """Sync URLs are mapped to their asyncio drivers"""
+    assert async_database_url("sqlite:///./dream_visualizer.db") == "sqlite+aiosqlite:///./dream_visualizer.db"
+    assert async_database_url("postgresql://dv:secret@db:5432/dreams") == "postgresql+asyncpg://dv:secret@db:5432/dreams"
+    assert async_database_url("postgresql+psycopg2://dv@db/dreams") == "postgresql+asyncpg://dv@db/dreams"
+    assert async_database_url("mysql+aiomysql://dv@db/dreams") == "mysql+aiomysql://dv@db/dreams"
+
+def test_concurrent_reads_and_writes():
+    """Interleaved reads and row updates on one event loop all succeed"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        users = [User(email=f"async_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x") for _ in range(10)]
+        db.add_all(users)
+        db.commit()
+        tokens = [create_access_token(data=token_claims(user)) for user in users]
+    finally:
+        db.close()
+
+    async def exercise(client, token):
+        headers = {"Authorization": f"Bearer {token}"}
+        listed = await client.get("/api/v1/dreams/me", headers=headers)
+        revoked = await client.post("/api/v1/auth/revoke", headers=headers)
+        rejected = await client.get("/api/v1/dreams/me", headers=headers)
+        return listed.status_code, revoked.status_code, rejected.status_code
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await asyncio.gather(*(exercise(client, token) for token in tokens))
+
+    assert asyncio.run(run()) == [(200, 204, 401)] * len(tokens)
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
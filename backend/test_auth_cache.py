@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test the authenticated-user lookup cache used by the JWT dependencies
+"""
+
+import uuid
+
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.session import SessionLocal, engine, Base
+from app.db.models.user import User
+from app.core import security
+from app.core.security import authenticated_user_cache, create_access_token
+
+def count_user_queries(monkeypatch):
+    calls = []
+    original = security.get_user_by_email
+
+    def counting_get_user_by_email(db, email):
+        calls.append(email)
+        return original(db, email)
+
+    monkeypatch.setattr(security, "get_user_by_email", counting_get_user_by_email)
+    return calls
+
+def create_user():
+    db = SessionLocal()
+    try:
+        user = User(email=f"cache_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user.id, user.email
+    finally:
+        db.close()
+
+def test_repeat_requests_skip_user_lookup(monkeypatch):
+    """Only the first authenticated request hits the users table"""
+    Base.metadata.create_all(bind=engine)
+    authenticated_user_cache.invalidate()
+    calls = count_user_queries(monkeypatch)
+    client = TestClient(app)
+    user_id, email = create_user()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+    for _ in range(3):
+        assert client.get("/api/v1/dreams/me", headers=headers).status_code == 200
+    assert calls == [email]
+    assert authenticated_user_cache.get(email).id == user_id
+
+def test_cache_invalidated_when_user_changes(monkeypatch):
+    """Updating or deleting a user drops its cached record"""
+    Base.metadata.create_all(bind=engine)
+    authenticated_user_cache.invalidate()
+    client = TestClient(app)
+    user_id, email = create_user()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+    assert client.get("/api/v1/dreams/me", headers=headers).status_code == 200
+
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        user.email = f"renamed_{email}"
+        db.commit()
+    finally:
+        db.close()
+
+    assert authenticated_user_cache.get(email) is None
+    assert client.get("/api/v1/dreams/me", headers=headers).status_code == 401
+
+def test_cache_opt_out(monkeypatch):
+    """With AUTH_CACHE_ENABLED off every request looks the user up"""
+    Base.metadata.create_all(bind=engine)
+    authenticated_user_cache.invalidate()
+    monkeypatch.setattr(security.settings, "AUTH_CACHE_ENABLED", False)
+    calls = count_user_queries(monkeypatch)
+    client = TestClient(app)
+    _, email = create_user()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+    for _ in range(2):
+        assert client.get("/api/v1/dreams/me", headers=headers).status_code == 200
+    assert calls == [email, email]
+    assert len(authenticated_user_cache) == 0
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test the group-commit writer for dream and video inserts
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from app.db.batch_writer import BatchWriter
+from app.db.models.dream import Dream
+from app.db.models.video import Video
+from app.db.session import AsyncSessionLocal, engine, Base
+
+def count_commits():
+    commits = []
+
+    def factory():
+        session = AsyncSessionLocal()
+        event.listen(session.sync_session, "after_commit", lambda s: commits.append(1))
+        return session
+
+    return factory, commits
+
+def test_concurrent_inserts_share_a_commit():
+    """Inserts arriving together are committed in one transaction with ids handed back"""
+    Base.metadata.create_all(bind=engine)
+    factory, commits = count_commits()
+
+    async def run():
+        writer = BatchWriter(session_factory=factory, flush_interval=0.05, max_batch=100)
+        saved = await asyncio.gather(
+            *(writer.submit(Dream(prompt=f"batched dream {i}")) for i in range(20)),
+            writer.submit(Video(prompt="batched video", video_path="v.mp4", video_url="/static/v.mp4")),
+        )
+        await writer.close()
+        return saved
+
+    saved = asyncio.run(run())
+    assert len(commits) == 1
+    assert len({obj.id for obj in saved[:20]}) == 20
+    assert all(obj.created_at is not None for obj in saved)
+    assert saved[20].id is not None
+
+def test_max_batch_splits_transactions():
+    """No transaction holds more than max_batch rows"""
+    Base.metadata.create_all(bind=engine)
+    factory, commits = count_commits()
+
+    async def run():
+        writer = BatchWriter(session_factory=factory, flush_interval=0.05, max_batch=4)
+        await asyncio.gather(*(writer.submit(Dream(prompt=f"dream {i}")) for i in range(10)))
+        await writer.close()
+
+    asyncio.run(run())
+    assert len(commits) == 3
+
+def test_bad_row_fails_alone():
+    """A row that violates a constraint fails only its own request"""
+    Base.metadata.create_all(bind=engine)
+
+    async def run():
+        writer = BatchWriter(flush_interval=0.05)
+        results = await asyncio.gather(
+            writer.submit(Dream(prompt="good dream")),
+            writer.submit(Dream(prompt=None)),
+            writer.submit(Dream(prompt="another good dream")),
+            return_exceptions=True,
+        )
+        await writer.close()
+        return results
+
+    originals = [Dream(prompt="good dream"), Dream(prompt=None), Dream(prompt="another good dream")]
+
+    async def run_originals():
+        writer = BatchWriter(flush_interval=0.05)
+        results = await asyncio.gather(*(writer.submit(dream) for dream in originals), return_exceptions=True)
+        await writer.close()
+        return results
+
+    good, bad, other = asyncio.run(run())
+    assert good.id is not None and other.id is not None
+    assert isinstance(bad, Exception)
+
+    # Retried rows are rebuilt rather than reusing instances from the rolled-back session
+    good, bad, other = asyncio.run(run_originals())
+    assert good is not originals[0] and other is not originals[2]
+
+    async def stored(dream_id):
+        async with AsyncSessionLocal() as db:
+            return await db.get(Dream, dream_id)
+
+    assert asyncio.run(stored(good.id)).prompt == "good dream"
+    assert asyncio.run(stored(other.id)).prompt == "another good dream"
+
+def test_cancelled_writer_resolves_waiting_callers():
+    """Callers waiting on a writer task that is cancelled get CancelledError instead of hanging"""
+    Base.metadata.create_all(bind=engine)
+
+    class StuckSession:
+        async def __aenter__(self):
+            await asyncio.Event().wait()
+
+        async def __aexit__(self, *args):
+            return False
+
+    async def run():
+        writer = BatchWriter(session_factory=StuckSession, flush_interval=0.01, max_batch=1)
+        in_flight = asyncio.create_task(writer.submit(Dream(prompt="in flight")))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(writer.submit(Dream(prompt="queued")))
+        await asyncio.sleep(0)
+        writer._task.cancel()
+        for waiter in (in_flight, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
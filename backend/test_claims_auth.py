@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test claims-only authentication and token revocation
+"""
+
+import asyncio
+import time
+import uuid
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import text
+from app.main import app
+from app.db.session import AsyncSessionLocal, SessionLocal, engine, Base
+from app.db.models.user import User
+from app.core import cache, security
+from app.core.security import authenticated_user_cache, create_access_token, token_claims, token_version_cache
+
+def create_user():
+    db = SessionLocal()
+    try:
+        user = User(email=f"claims_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user.id, {"Authorization": f"Bearer {create_access_token(data=token_claims(user))}"}
+    finally:
+        db.close()
+
+def reset_caches():
+    Base.metadata.create_all(bind=engine)
+    authenticated_user_cache.invalidate()
+    token_version_cache.invalidate()
+
+def test_claims_mode_skips_user_lookup(monkeypatch):
+    """The principal comes from the token; only the token version is read"""
+    reset_caches()
+    monkeypatch.setattr(security.settings, "AUTH_CLAIMS_MODE", True)
+    calls = []
+    monkeypatch.setattr(security, "get_user_by_email", lambda db, email: calls.append(email))
+    client = TestClient(app)
+    user_id, headers = create_user()
+
+    for _ in range(3):
+        assert client.get("/api/v1/dreams/me", headers=headers).status_code == 200
+    assert calls == []
+    assert token_version_cache.get(user_id) == 0
+
+def test_revoke_invalidates_tokens():
+    """Revoking bumps the token version and rejects earlier tokens in both modes"""
+    for claims_mode in (True, False):
+        reset_caches()
+        security.settings.AUTH_CLAIMS_MODE = claims_mode
+        try:
+            client = TestClient(app)
+            user_id, headers = create_user()
+            assert client.get("/api/v1/dreams/me", headers=headers).status_code == 200
+
+            assert client.post("/api/v1/auth/revoke", headers=headers).status_code == 204
+            assert token_version_cache.get(user_id) is None
+            assert client.get("/api/v1/dreams/me", headers=headers).status_code == 401
+            assert client.post("/api/v1/auth/revoke", headers=headers).status_code == 401
+        finally:
+            security.settings.AUTH_CLAIMS_MODE = False
+
+def test_revoke_in_another_worker_applies_after_cache_ttl(monkeypatch):
+    """Workers that did not handle the revoke accept old tokens until their cached entry expires"""
+    for claims_mode in (True, False):
+        reset_caches()
+        monkeypatch.setattr(security.settings, "AUTH_CLAIMS_MODE", claims_mode)
+        monkeypatch.setattr(cache, "time", time)  # real clock again for the second mode
+        client = TestClient(app)
+        user_id, headers = create_user()
+        assert client.get("/api/v1/dreams/me", headers=headers).status_code == 200
+
+        # The revoke as another worker commits it: no ORM event fires in this process
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE users SET token_version = token_version + 1 WHERE id = :id"), {"id": user_id})
+        assert client.get("/api/v1/dreams/me", headers=headers).status_code == 200
+
+        expired = time.monotonic() + security.settings.AUTH_CACHE_TTL_SECONDS + 1
+        monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: expired))
+        assert client.get("/api/v1/dreams/me", headers=headers).status_code == 401
+
+def test_revoke_invalidates_cache_at_commit_not_flush():
+    """A lookup between flush and commit cannot leave the old token version cached"""
+    reset_caches()
+    user_id, _ = create_user()
+
+    async def lookup(between=None):
+        async with AsyncSessionLocal() as db:
+            if between is None:
+                return await security.get_token_version(db, user_id)
+
+            class InterleavedSession:
+                async def scalar(self, statement):
+                    value = await db.scalar(statement)
+                    between()
+                    return value
+
+            return await security.get_token_version(InterleavedSession(), user_id)
+
+    writer = SessionLocal()
+    try:
+        user = writer.get(User, user_id)
+        user.token_version += 1
+        writer.flush()
+        # Reloaded after the flush: the old version is read and cached
+        assert asyncio.run(lookup()) == 0
+        writer.commit()
+        assert asyncio.run(lookup()) == 1
+
+        # Read before the commit but cached after it
+        token_version_cache.invalidate()
+        user.token_version += 1
+        writer.flush()
+        assert asyncio.run(lookup(between=writer.commit)) == 1
+        assert asyncio.run(lookup()) == 2
+
+        # A rolled-back change does not evict anything
+        user.token_version += 1
+        writer.flush()
+        writer.rollback()
+        assert token_version_cache.get(user_id) == 2
+    finally:
+        writer.close()
+
+def test_login_issues_claims():
+    """Login tokens carry the user id and token version"""
+    reset_caches()
+    client = TestClient(app)
+    email = f"claims_{uuid.uuid4().hex[:8]}@example.com"
+    assert client.post("/api/v1/auth/register", json={"email": email, "password": "secret123"}).status_code == 200
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "secret123"})
+    claims = jwt.get_unverified_claims(response.json()["access_token"])
+    assert claims["sub"] == email
+    assert isinstance(claims["uid"], int)
+    assert claims["ver"] == 0
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
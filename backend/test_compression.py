@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test response compression and precompressed static files
+"""
+
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+from app.core.compression import (
+    CompressionMiddleware,
+    PrecompressedStaticFiles,
+    brotli,
+    negotiate_encodings,
+    precompress_directory,
+)
+
+def build_app():
+    test_app = FastAPI()
+    test_app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @test_app.get("/big")
+    async def big():
+        return {"items": ["dream"] * 200}
+
+    @test_app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @test_app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" + b"0" * 5000, media_type="image/png")
+
+    @test_app.get("/stream")
+    async def stream():
+        return StreamingResponse((f"line {i}\n" for i in range(1000)), media_type="application/x-ndjson")
+
+    return test_app
+
+def test_negotiate_encodings():
+    """Quality values and wildcards are honoured in server preference order"""
+    assert negotiate_encodings("gzip, br", ["br", "gzip"]) == ["br", "gzip"]
+    assert negotiate_encodings("gzip;q=0, br;q=0.5", ["br", "gzip"]) == ["br"]
+    assert negotiate_encodings("*", ["br", "gzip"]) == ["br", "gzip"]
+    assert negotiate_encodings("identity", ["br", "gzip"]) == []
+
+def test_compression_middleware():
+    """Large JSON is compressed, small bodies and images are left alone"""
+    client = TestClient(build_app())
+
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == {"items": ["dream"] * 200}
+
+    if brotli is not None:
+        response = client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+        assert response.headers["content-encoding"] == "br"
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert len(response.content) == 5004
+
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text.splitlines()[-1] == "line 999"
+
+def test_precompressed_static_files(tmp_path):
+    """A .gz sibling is served as-is with the original content type"""
+    (tmp_path / "app.js").write_text("console.log('dream');" * 100)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG")
+    assert precompress_directory(str(tmp_path)) >= 1
+    (tmp_path / "app.js.gz").write_bytes(gzip.compress(b"precompressed"))
+
+    static_app = FastAPI()
+    static_app.mount("/assets", PrecompressedStaticFiles(directory=str(tmp_path)), name="assets")
+    client = TestClient(static_app)
+
+    response = client.get("/assets/app.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "javascript" in response.headers["content-type"]
+    assert response.text == "precompressed"
+
+    response = client.get("/assets/app.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.text.startswith("console.log")
+
+    response = client.get("/assets/logo.png", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+def test_metrics_endpoint_reports_compression():
+    """Compression counters are exposed on /metrics"""
+    from app.main import app
+
+    client = TestClient(build_app())
+    client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert 'http_compression_input_bytes_total{encoding="gzip"}' in response.text
+    assert "http_compression_cpu_seconds_total" in response.text
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_negotiate_encodings()
+    test_compression_middleware()
+    test_precompressed_static_files(pathlib.Path(tempfile.mkdtemp()))
+    test_metrics_endpoint_reports_compression()
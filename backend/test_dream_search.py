@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test full-text search over dream prompts
+"""
+
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.main import app
+from app.db.session import SessionLocal, engine, Base
+from app.db.models.dream import Dream
+from app.db.models.user import User
+from app.db.search import build_match_query, ensure_dream_search, rebuild_dream_search
+from app.core.security import create_access_token
+
+def create_user_with_dreams(prompts):
+    db = SessionLocal()
+    try:
+        user = User(email=f"search_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        for prompt in prompts:
+            db.add(Dream(user_id=user.id, prompt=prompt, image_path=f"generated_images/{uuid.uuid4().hex[:8]}.png"))
+        db.commit()
+        token = create_access_token(data={"sub": user.email})
+        return user.id, {"Authorization": f"Bearer {token}"}
+    finally:
+        db.close()
+
+def test_build_match_query_quotes_terms():
+    """User input is quoted so FTS operators cannot break the query"""
+    assert build_match_query('flying "cats" OR') == '"flying" """cats""" "OR"*'
+    assert build_match_query("   ") is None
+
+def test_dream_search_ranking_scoping_and_pagination():
+    """Search is ranked, scoped to the caller and paginated with a cursor"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    client = TestClient(app)
+
+    _, headers = create_user_with_dreams([
+        "Flying over a stormy ocean",
+        "An ocean of stars above the ocean",
+        "A dark forest <with> owls",
+        "Swimming in the ocean at night",
+    ])
+    create_user_with_dreams(["Someone else's ocean dream"])
+
+    response = client.get("/api/v1/dreams/search", params={"q": "ocean", "limit": 2}, headers=headers)
+    assert response.status_code == 200
+    page = response.json()
+    assert len(page["results"]) == 2
+    assert page["results"][0]["prompt"] == "An ocean of stars above the ocean"
+    assert "<mark>ocean</mark>" in page["results"][0]["highlight"]
+    assert page["next_cursor"]
+
+    response = client.get("/api/v1/dreams/search", params={"q": "ocean", "limit": 2, "cursor": page["next_cursor"]}, headers=headers)
+    second = response.json()
+    assert len(second["results"]) == 1
+    assert second["next_cursor"] is None
+
+    prompts = [r["prompt"] for r in page["results"] + second["results"]]
+    assert "Someone else's ocean dream" not in prompts
+    assert len(set(prompts)) == 3
+
+    response = client.get("/api/v1/dreams/search", params={"q": "owl"}, headers=headers)
+    assert response.json()["results"][0]["highlight"] == "A dark forest &lt;with&gt; <mark>owls</mark>"
+
+    response = client.get("/api/v1/dreams/search", params={"q": "ocean", "cursor": "bogus"}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.get("/api/v1/dreams/search", params={"q": "ocean"})
+    assert response.status_code == 401
+
+def test_rebuild_dream_search_backfills_index():
+    """The backfill command re-indexes rows the triggers never saw"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    client = TestClient(app)
+    _, headers = create_user_with_dreams(["A lighthouse in the fog"])
+
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO dreams_fts(dreams_fts) VALUES ('delete-all')"))
+    response = client.get("/api/v1/dreams/search", params={"q": "lighthouse"}, headers=headers)
+    assert response.json()["results"] == []
+
+    assert rebuild_dream_search(engine) == 1
+    response = client.get("/api/v1/dreams/search", params={"q": "lighthouse"}, headers=headers)
+    assert len(response.json()["results"]) == 1
+
+def test_ensure_dream_search_backfills_existing_rows():
+    """Adding the index to a database that already has dreams leaves it writable"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for statement in ("DROP TRIGGER dreams_fts_ai", "DROP TRIGGER dreams_fts_ad", "DROP TRIGGER dreams_fts_au", "DROP TABLE dreams_fts"):
+            conn.execute(text(statement))
+    client = TestClient(app)
+    _, headers = create_user_with_dreams(["A lighthouse in the fog", "A desert of glass", "Snow on the moon"])
+
+    ensure_dream_search(engine)
+    response = client.get("/api/v1/dreams/search", params={"q": "lighthouse"}, headers=headers)
+    assert len(response.json()["results"]) == 1
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE dreams SET prompt = 'A lighthouse on the sea' WHERE prompt = 'A desert of glass'"))
+        conn.execute(text("DELETE FROM dreams WHERE prompt = 'Snow on the moon'"))
+        # Raises when the index and the dreams table disagree
+        conn.execute(text("INSERT INTO dreams_fts(dreams_fts, rank) VALUES ('integrity-check', 1)"))
+    response = client.get("/api/v1/dreams/search", params={"q": "lighthouse"}, headers=headers)
+    assert len(response.json()["results"]) == 2
+    assert client.get("/api/v1/dreams/search", params={"q": "moon"}, headers=headers).json()["results"] == []
+
+if __name__ == "__main__":
+    test_build_match_query_quotes_terms()
+    test_dream_search_ranking_scoping_and_pagination()
+    test_rebuild_dream_search_backfills_index()
+    test_ensure_dream_search_backfills_existing_rows()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test prompt embeddings, the vector index and the similar-dream endpoints
+"""
+
+import threading
+import uuid
+
+import numpy as np
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.session import SessionLocal, engine, Base
+from app.db.models.dream import Dream
+from app.db.models.user import User
+from app.core.security import create_access_token
+from app.services import dream_embeddings
+from app.services.dream_embeddings import DreamVectorIndex, embed_prompt
+
+def test_embeddings_rank_related_prompts_higher():
+    """Prompts sharing words score higher than unrelated prompts"""
+    query = embed_prompt("flying over a stormy ocean").astype(np.float32)
+    related = embed_prompt("a stormy ocean at night").astype(np.float32)
+    unrelated = embed_prompt("a quiet library full of books").astype(np.float32)
+    assert query.dtype == np.float32 and query.shape == (dream_embeddings.EMBEDDING_DIM,)
+    assert query @ related > query @ unrelated
+
+def test_index_scoping_persistence_and_ivf(tmp_path):
+    """Rows survive reopening, searches respect owners and IVF keeps results"""
+    index = DreamVectorIndex(str(tmp_path), ivf_min_candidates=0)
+    prompts = ["red dragon in the sky", "blue ocean waves", "red dragon sleeping", "green forest path"]
+    for dream_id, prompt in enumerate(prompts, start=1):
+        index.add(dream_id, 7 if dream_id != 3 else 8, prompt)
+    index.add(5, None, "red dragon anonymous")
+
+    reopened = DreamVectorIndex(str(tmp_path), ivf_min_candidates=0)
+    assert len(reopened) == 5
+
+    results = reopened.search(embed_prompt("red dragon"), k=2, owner_id=7)
+    assert results[0][0] == 1
+    assert all(dream_id not in (3, 5) for dream_id, _ in results)
+
+    results = reopened.search(embed_prompt("red dragon in the sky"), k=3, exclude_id=1)
+    assert 1 not in [dream_id for dream_id, _ in results]
+
+    reopened.train_ivf(nlist=2, seed=1)
+    index.add(6, 7, "red dragon flying")
+    results = reopened.search(embed_prompt("red dragon flying"), k=1, nprobe=2)
+    assert results[0][0] == 6
+
+def test_ivf_training_leaves_the_index_writable(tmp_path):
+    """Dreams can be added while k-means runs, and are assigned when the result is swapped in"""
+    index = DreamVectorIndex(str(tmp_path), ivf_min_candidates=0)
+    for dream_id in range(1, 41):
+        index.add(dream_id, dream_id % 3, f"dream number {dream_id} about {['ships', 'owls', 'rain'][dream_id % 3]}")
+    writer = DreamVectorIndex(str(tmp_path))
+    blocked = []
+    assign_clusters = index._assign_clusters
+
+    def add_during_training(vectors, centroids=None):
+        if not blocked:
+            adder = threading.Thread(target=writer.add, args=(41, 2, "a late dream about rain and ships"))
+            adder.start()
+            adder.join(5)
+            blocked.append(adder.is_alive())
+        return assign_clusters(vectors, centroids)
+
+    index._assign_clusters = add_during_training
+    index.train_ivf(nlist=4, seed=0)
+    assert blocked == [False]
+
+    reader = DreamVectorIndex(str(tmp_path), ivf_min_candidates=0)
+    assert len(reader) == 41
+    assert (tmp_path / "ivf_assign.i32").stat().st_size == 41 * 4
+    assert reader.search(embed_prompt("a late dream about rain and ships"), k=1, owner_id=2, nprobe=4)[0][0] == 41
+    results = reader.search(embed_prompt("dream about owls"), k=50, owner_id=1, nprobe=4)
+    assert results and all(dream_id % 3 == 1 for dream_id, _ in results)
+
+def test_similar_dream_endpoints(tmp_path, monkeypatch):
+    """Endpoints return the caller's most similar dreams only"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    index = DreamVectorIndex(str(tmp_path))
+    monkeypatch.setattr(dream_embeddings, "_dream_index", index)
+    client = TestClient(app)
+
+    db = SessionLocal()
+    try:
+        owner = User(email=f"similar_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        other = User(email=f"similar_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add_all([owner, other])
+        db.commit()
+        dreams = [
+            Dream(user_id=owner.id, prompt="A castle made of clouds", image_path="generated_images/a.png"),
+            Dream(user_id=owner.id, prompt="Clouds over a floating castle", image_path="generated_images/b.png"),
+            Dream(user_id=owner.id, prompt="Diving with sharks", image_path="generated_images/c.png"),
+            Dream(user_id=other.id, prompt="A castle made of clouds too", image_path="generated_images/d.png"),
+        ]
+        db.add_all(dreams)
+        db.commit()
+        for dream in dreams:
+            index.add(dream.id, dream.user_id, dream.prompt)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': owner.email})}"}
+        other_dream_id = dreams[3].id
+        first_id, second_id = dreams[0].id, dreams[1].id
+    finally:
+        db.close()
+
+    response = client.get(f"/api/v1/dreams/{first_id}/similar", params={"limit": 5}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert results[0]["id"] == second_id
+    assert first_id not in [r["id"] for r in results]
+    assert other_dream_id not in [r["id"] for r in results]
+
+    response = client.get("/api/v1/dreams/similar", params={"q": "sharks"}, headers=headers)
+    assert response.json()[0]["prompt"] == "Diving with sharks"
+
+    response = client.get(f"/api/v1/dreams/{other_dream_id}/similar", headers=headers)
+    assert response.status_code == 404
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_embeddings_rank_related_prompts_higher()
+    test_index_scoping_persistence_and_ivf(pathlib.Path(tempfile.mkdtemp()))
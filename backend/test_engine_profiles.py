@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Test the per-backend database engine profiles
+"""
+
+from sqlalchemy import create_engine
+from app.db.engine_profiles import configure_engine, engine_options
+
+def test_sqlite_pragmas_applied_on_connect(tmp_path):
+    """New SQLite connections run in WAL mode with the configured PRAGMAs"""
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    engine = create_engine(url, **engine_options(url))
+    configure_engine(engine)
+
+    with engine.connect() as connection:
+        pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1
+        assert pragma("busy_timeout") == 5000
+        assert pragma("cache_size") == -65536
+    engine.dispose()
+
+def test_postgresql_pool_profile():
+    """PostgreSQL URLs get a pre-pinged pool and a driver-specific statement timeout"""
+    options = engine_options("postgresql+asyncpg://dv@db/dreams")
+    assert options["pool_pre_ping"] is True
+    assert options["pool_size"] == 10 and options["max_overflow"] == 20
+    assert options["connect_args"] == {"server_settings": {"statement_timeout": "30000"}}
+
+    options = engine_options("postgresql://dv@db/dreams")
+    assert options["connect_args"] == {"options": "-c statement_timeout=30000"}
+
+def test_other_backends_untouched():
+    """Unknown backends keep SQLAlchemy's defaults"""
+    assert engine_options("mysql+pymysql://dv@db/dreams") == {}
+    assert "poolclass" in engine_options("sqlite+aiosqlite:///dreams.db")
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
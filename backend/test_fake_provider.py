@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Test that image providers are configurable and work against the local fake provider
+"""
+
+from PIL import Image
+from benchmarks.fake_provider import start_fake_provider
+from app.core.config import settings
+from app.services.stable_diffusion import StableDiffusionService
+
+def test_service_uses_configured_provider_urls(tmp_path, monkeypatch):
+    """POLLINATIONS_API_URL and HUGGINGFACE_API_URL replace the public endpoints"""
+    provider = start_fake_provider(latency=0, image_size=64)
+    try:
+        monkeypatch.setattr(settings, "POLLINATIONS_API_URL", f"{provider.url}/prompt/")
+        monkeypatch.setattr(settings, "HUGGINGFACE_API_URL", f"{provider.url}/models/fake")
+        service = StableDiffusionService()
+        service.output_dir = tmp_path
+
+        service.hf_token = ""
+        pollinations = service.generate_image("a fake sunrise", filename="pollinations")
+        service.hf_token = "test-token"
+        huggingface = service.generate_image("a fake sunset", filename="huggingface")
+    finally:
+        provider.shutdown()
+
+    assert provider.counts == {"requests": 2, "failures": 0}
+    assert Image.open(pollinations["file_path"]).size == (64, 64)
+    assert Image.open(huggingface["file_path"]).size == (64, 64)
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
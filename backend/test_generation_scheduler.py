@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test the fair-share generation scheduler and its 429 admission control
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core import scheduler
+from app.core.config import Settings
+from app.core.scheduler import FairScheduler, SchedulerFull, parse_pairs
+from pydantic import ValidationError
+
+def recorder(order, lock=threading.Lock()):
+    def job(name):
+        time.sleep(0.02)
+        with lock:
+            order.append(name)
+        return name
+    return job
+
+def test_weighted_users_overtake_anonymous_flood():
+    """A flooding anonymous client only delays itself"""
+    order = []
+    job = recorder(order)
+    fair = FairScheduler(max_concurrency=1, per_client_queue=10, weights={"anonymous": 1.0, "user": 4.0})
+
+    async def main():
+        flood = [asyncio.create_task(fair.run("ip:1", "anonymous", job, f"anon{i}")) for i in range(6)]
+        await asyncio.sleep(0)
+        users = [asyncio.create_task(fair.run("user:7", "user", job, f"user{i}")) for i in range(2)]
+        await asyncio.gather(*flood, *users)
+
+    asyncio.run(main())
+    assert order[:3] == ["anon0", "user0", "user1"]
+    assert order[3:] == [f"anon{i}" for i in range(1, 6)]
+
+def test_equal_weights_alternate_between_clients():
+    """Two equally weighted busy clients share slots round-robin"""
+    order = []
+    job = recorder(order)
+    fair = FairScheduler(max_concurrency=1, per_client_queue=10, weights={"user": 1.0})
+
+    async def main():
+        await asyncio.gather(*(
+            fair.run(client, "user", job, f"{client}-{i}") for i in range(3) for client in ("a", "b")
+        ))
+
+    asyncio.run(main())
+    assert [name.split("-")[0] for name in order] == ["a", "b"] * 3
+
+def test_per_client_concurrency_cap():
+    """One client never holds more than its share of running slots"""
+    peak = []
+    running = []
+    lock = threading.Lock()
+
+    def job():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    fair = FairScheduler(max_concurrency=4, per_client_concurrency=2, per_client_queue=10, weights={"user": 1.0})
+
+    async def main():
+        await asyncio.gather(*(fair.run("user:1", "user", job) for _ in range(6)))
+
+    asyncio.run(main())
+    assert max(peak) == 2
+
+def test_admission_control_rejects_when_full():
+    """Full per-client or global queues are rejected immediately"""
+    release = threading.Event()
+    fair = FairScheduler(max_concurrency=1, max_queue=3, per_client_queue=2, weights={"user": 1.0})
+
+    async def main():
+        tasks = [asyncio.create_task(fair.run("a", "user", release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(SchedulerFull) as client_full:
+            await fair.run("a", "user", release.wait)
+        tasks.append(asyncio.create_task(fair.run("b", "user", release.wait)))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerFull) as global_full:
+            await fair.run("c", "user", release.wait)
+        release.set()
+        await asyncio.gather(*tasks)
+        return client_full.value, global_full.value
+
+    client_full, global_full = asyncio.run(main())
+    assert client_full.scope == "client"
+    assert global_full.scope == "global"
+    assert global_full.retry_after >= 1
+    assert fair.queued == 0 and fair.running == 0
+
+def test_cancelled_job_leaves_the_queue():
+    """A request that goes away before its job starts frees its queue slot"""
+    release = threading.Event()
+    fair = FairScheduler(max_concurrency=1, weights={"user": 1.0})
+
+    async def main():
+        first = asyncio.create_task(fair.run("a", "user", release.wait))
+        waiting = asyncio.create_task(fair.run("b", "user", release.wait))
+        await asyncio.sleep(0.05)
+        assert fair.queued == 1
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert fair.queued == 0
+        release.set()
+        await first
+
+    asyncio.run(main())
+
+def test_parse_pairs():
+    assert parse_pairs("anonymous=1, user=4,,premium=8") == {"anonymous": "1", "user": "4", "premium": "8"}
+
+def test_bad_tiers_fail_when_settings_load():
+    """Unusable tier weights and unknown user tiers are rejected at startup, not on the first job"""
+    assert Settings(SCHEDULER_TIER_WEIGHTS="anonymous=1,user=4,gold=8", SCHEDULER_USER_TIERS="7=gold")
+    for weights, user_tiers in (
+        ("anonymous=1,user=0", ""),
+        ("anonymous=1,user=fast", ""),
+        ("anonymous=1,user=-2", ""),
+        ("anonymous=1", ""),
+        ("anonymous=1,user=4", "7=gold"),
+    ):
+        with pytest.raises(ValidationError):
+            Settings(SCHEDULER_TIER_WEIGHTS=weights, SCHEDULER_USER_TIERS=user_tiers)
+    with pytest.raises(ValueError):
+        FairScheduler(weights={"anonymous": 1.0, "user": 0.0})
+
+def test_disabled_scheduler_runs_off_the_event_loop(monkeypatch):
+    """With the scheduler off, generation still runs in a worker thread"""
+    monkeypatch.setattr(scheduler.settings, "SCHEDULER_ENABLED", False)
+
+    async def main():
+        loop_thread = threading.get_ident()
+        ticks = []
+
+        async def tick():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        def job():
+            time.sleep(0.1)
+            return threading.get_ident(), time.monotonic()
+
+        (worker_thread, finished), _ = await asyncio.gather(scheduler.schedule_generation(None, None, job), tick())
+        return loop_thread, worker_thread, finished, ticks
+
+    loop_thread, worker_thread, finished, ticks = asyncio.run(main())
+    assert worker_thread != loop_thread
+    # The event loop kept ticking while the job ran
+    assert sum(tick < finished for tick in ticks) >= 3
+
+def test_create_dream_returns_429_when_queue_full(monkeypatch):
+    """The route answers 429 with Retry-After instead of queueing"""
+    monkeypatch.setattr(scheduler, "generation_scheduler", FairScheduler(max_queue=0, weights={"anonymous": 1.0, "user": 4.0}))
+    response = TestClient(app).post("/api/v1/dreams/", json={"prompt": "one prompt too many"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])
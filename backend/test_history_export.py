@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test streaming NDJSON/CSV export of dream and video history
+"""
+
+import csv
+import io
+import json
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app.main import app
+from app.db.session import SessionLocal, engine, Base
+from app.db.models.dream import Dream
+from app.db.models.user import User
+from app.db.models.video import Video
+from app.core.security import create_access_token
+from app.services.history_export import iter_export
+
+def create_user_history(dream_count: int, video_count: int):
+    db = SessionLocal()
+    try:
+        user = User(email=f"export_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.add_all([
+            Dream(user_id=user.id, prompt=f"Dream number {i}, with \"quotes\"", image_path=f"generated_images/dream_{i}.png")
+            for i in range(dream_count)
+        ])
+        db.add_all([
+            Video(user_id=user.id, prompt=f"Video {i}", video_path=f"generated_videos/v{i}.mp4", video_url=f"/static/generated_videos/v{i}.mp4")
+            for i in range(video_count)
+        ])
+        db.commit()
+        token = create_access_token(data={"sub": user.email})
+        return user.id, {"Authorization": f"Bearer {token}"}
+    finally:
+        db.close()
+
+def test_iter_export_yields_one_chunk_per_batch():
+    """Rows are streamed in yield_per sized batches"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    user_id, _ = create_user_history(25, 0)
+
+    statement = select(Dream.id, Dream.prompt).where(Dream.user_id == user_id).order_by(Dream.id)
+    chunks = list(iter_export(statement, ["id", "prompt"], lambda row: dict(row._mapping), "ndjson", batch_size=10))
+    assert len(chunks) == 3
+    assert sum(chunk.count(b"\n") for chunk in chunks) == 25
+
+def test_dream_and_video_export_endpoints():
+    """Exports contain exactly the caller's rows in NDJSON and CSV"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    client = TestClient(app)
+    user_id, headers = create_user_history(1200, 3)
+    create_user_history(5, 5)
+
+    response = client.get("/api/v1/dreams/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert 'filename="dreams.ndjson"' in response.headers["content-disposition"]
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert len(records) == 1200
+    assert all(record["user_id"] == user_id for record in records)
+    assert records[0]["image_url"] == "/static/generated_images/dream_0.png"
+
+    response = client.get("/api/v1/dreams/export", params={"format": "csv"}, headers=headers)
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 1200
+    assert rows[1]["prompt"] == 'Dream number 1, with "quotes"'
+
+    response = client.get("/api/v1/videos/export", params={"format": "csv"}, headers=headers)
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["prompt"] for row in rows] == ["Video 0", "Video 1", "Video 2"]
+
+    assert client.get("/api/v1/videos/export").status_code == 401
+    assert client.get("/api/v1/dreams/export", params={"format": "xml"}, headers=headers).status_code == 422
+
+if __name__ == "__main__":
+    test_iter_export_yields_one_chunk_per_batch()
+    test_dream_and_video_export_endpoints()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Test perceptual-hash deduplication of generated images
+"""
+
+import io
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from app.core.config import settings
+from app.db.models.dream import Dream
+from app.db.session import SessionLocal, engine, Base
+from app.services import image_dedup
+from app.services.image_dedup import ImageHashIndex, dedup_directory, dhash, hamming_distances, phash
+from app.services.stable_diffusion import StableDiffusionService
+
+def scene(seed, size=256):
+    """A smooth picture, different for each seed"""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, size=(4, 4, 3), dtype=np.uint8)
+    return Image.fromarray(coarse, "RGB").resize((size, size), Image.BICUBIC)
+
+def test_hashes_survive_small_changes():
+    """Rescaling and lossy re-encoding stay close; other pictures are far"""
+    original = scene(1)
+    buffer = io.BytesIO()
+    original.save(buffer, format="JPEG", quality=40)
+    edited = Image.open(buffer)
+    for hash_function in (dhash, phash):
+        reference = np.array([hash_function(original)], dtype=np.uint64)
+        assert hamming_distances(reference, hash_function(original.resize((512, 512))))[0] <= 4
+        assert hamming_distances(reference, hash_function(edited))[0] <= 4
+        assert hamming_distances(reference, hash_function(scene(2)))[0] > 10
+
+def test_hamming_distances_match_bit_counts():
+    """The vectorized popcount agrees with counting bits one hash at a time"""
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, size=100, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+    value = int(hashes[7]) ^ 0b1011
+    expected = [bin(int(h) ^ value).count("1") for h in hashes]
+    assert hamming_distances(hashes, value).tolist() == expected
+    assert hamming_distances(hashes, value)[7] == 3
+
+def test_index_persists_and_finds_nearest(tmp_path):
+    """Records written by one index instance are visible to another"""
+    writer = ImageHashIndex(str(tmp_path))
+    writer.add(0b1111, "dream_a.png", 1)
+    writer.add(0xFF00FF00, "dream_b.png", 1)
+    reader = ImageHashIndex(str(tmp_path))
+    assert len(reader) == 2
+    assert reader.nearest(0b0111, max_distance=2, owner_id=1) == ("dream_a.png", 1)
+    assert reader.nearest(0xF0F0F0F0F0F0, max_distance=2, owner_id=1) is None
+
+def test_nearest_only_matches_the_owner(tmp_path):
+    """Another user's identical image is never returned"""
+    index = ImageHashIndex(str(tmp_path))
+    index.add(0b1111, "alice.png", 1)
+    assert index.nearest(0b1111, 2, owner_id=2) is None
+    index.add(0b1110, "bob.png", 2)
+    assert index.nearest(0b1111, 2, owner_id=2) == ("bob.png", 1)
+    assert index.nearest(0b1111, 2, owner_id=1) == ("alice.png", 0)
+
+def test_banded_lookup_matches_a_full_scan(tmp_path):
+    """Byte-bucket candidates find the same nearest record as comparing every record"""
+    rng = np.random.default_rng(1)
+    hashes = rng.integers(0, 2**63, size=2000, dtype=np.int64).astype(np.uint64)
+    index = ImageHashIndex(str(tmp_path))
+    for i, value in enumerate(hashes.tolist()):
+        index.add(value, f"img_{i}.png", i % 3)
+    for i in range(0, 2000, 37):
+        # Flip up to 7 bits, spread over different bytes
+        flips = rng.choice(64, size=rng.integers(0, 8), replace=False)
+        value = int(hashes[i]) ^ sum(1 << int(bit) for bit in flips)
+        for max_distance in (4, 7, 12):
+            owned = np.flatnonzero(np.arange(2000) % 3 == i % 3)
+            distances = hamming_distances(hashes[owned], value)
+            best = int(np.argmin(distances))
+            expected = (f"img_{owned[best]}.png", int(distances[best])) if distances[best] <= max_distance else None
+            assert index.nearest(value, max_distance, owner_id=i % 3) == expected
+
+def test_lookups_share_the_lock(tmp_path):
+    """Lookups from several workers run together; only a writer holds them out"""
+    index = ImageHashIndex(str(tmp_path / "index"))
+    index.add(0b1111, "a.png", 1)
+    (tmp_path / "a.png").write_bytes(b"")
+    other = ImageHashIndex(str(tmp_path / "index"))
+    with index._locked(shared=True):
+        assert other.nearest(0b1111, 2, 1, tmp_path) == ("a.png", 0)
+
+    matches = []
+    with index._locked():
+        lookup = threading.Thread(target=lambda: matches.append(other.nearest(0b1111, 2, 1, tmp_path)))
+        lookup.start()
+        lookup.join(0.2)
+        assert lookup.is_alive()
+        # The writer itself can still look up while holding the lock
+        assert index.nearest(0b1111, 2, 1, tmp_path) == ("a.png", 0)
+    lookup.join()
+    assert matches == [("a.png", 0)]
+
+def test_placeholders_for_different_prompts_match():
+    """Fallback placeholders differ only in their caption and count as duplicates"""
+    service = StableDiffusionService()
+    first = service._generate_placeholder_image("a lighthouse on a floating island")
+    second = service._generate_placeholder_image("dragons over a neon city at night")
+    distance = hamming_distances(np.array([dhash(first)], dtype=np.uint64), dhash(second))[0]
+    assert distance <= settings.IMAGE_DEDUP_MAX_DISTANCE
+
+def test_service_reuses_near_identical_image(tmp_path, monkeypatch):
+    """A second near-identical image points at the first file instead of a new one"""
+    monkeypatch.setattr(settings, "IMAGE_DEDUP_ENABLED", True)
+    monkeypatch.setattr(image_dedup, "_image_hash_index", ImageHashIndex(str(tmp_path / "index")))
+    images = iter([scene(3), scene(3).resize((300, 300)), scene(4)])
+    service = StableDiffusionService()
+    service.output_dir = tmp_path
+    service.hf_token = ""
+    monkeypatch.setattr(service, "_generate_with_alternative_api", lambda prompt: next(images))
+
+    first = service.generate_image("a dream", "first", owner_id=1)
+    second = service.generate_image("the same dream", "second", owner_id=1)
+    third = service.generate_image("another dream", "third", owner_id=1)
+
+    assert second == first
+    assert third["file_path"] != first["file_path"]
+    assert sorted(path.name for path in tmp_path.glob("*.png")) == ["first.png", "third.png"]
+
+def test_service_never_shares_across_owners_or_placeholders(tmp_path, monkeypatch):
+    """Other users, anonymous dreams and fallback placeholders always get their own file"""
+    monkeypatch.setattr(settings, "IMAGE_DEDUP_ENABLED", True)
+    monkeypatch.setattr(image_dedup, "_image_hash_index", ImageHashIndex(str(tmp_path / "index")))
+    service = StableDiffusionService()
+    service.output_dir = tmp_path
+    service.hf_token = ""
+    monkeypatch.setattr(service, "_generate_with_alternative_api", lambda prompt: scene(8))
+
+    alice = service.generate_image("a dream", "alice", owner_id=1)
+    assert service.generate_image("a dream", "bob", owner_id=2) != alice
+    assert service.generate_image("a dream", "anonymous") != alice
+
+    def fail(prompt):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(service, "_generate_with_alternative_api", fail)
+    first = service.generate_image("a lighthouse on a floating island", "placeholder_a", owner_id=1)
+    second = service.generate_image("dragons over a neon city at night", "placeholder_b", owner_id=1)
+    assert first != second
+    assert Image.open(second["file_path"]).info.get("dream-placeholder") == "1"
+    assert len(image_dedup._image_hash_index) == 2
+
+def test_offline_dedup_pass(tmp_path, monkeypatch):
+    """Duplicates are deleted, their dreams repointed and the reclaimed bytes reported"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.chdir(tmp_path)
+    directory = Path("generated_images")
+    directory.mkdir()
+    tag = uuid.uuid4().hex[:8]
+    scene(5).save(directory / f"keep_{tag}.png")
+    os.utime(directory / f"keep_{tag}.png", (1, 1))
+    scene(5).resize((300, 300)).save(directory / f"dup_{tag}.png")
+    scene(6).save(directory / f"other_{tag}.png")
+    # The same picture for another user, and two placeholders
+    scene(5).save(directory / f"theirs_{tag}.png")
+    service = StableDiffusionService()
+    service.output_dir = directory
+    service.hf_token = ""
+    monkeypatch.setattr(settings, "IMAGE_DEDUP_ENABLED", False)
+    monkeypatch.setattr(service, "_generate_with_alternative_api", lambda prompt: 1 / 0)
+    for name in ("placeholder_a", "placeholder_b"):
+        service.generate_image(f"{name} {tag}", f"{name}_{tag}")
+    duplicate_size = (directory / f"dup_{tag}.png").stat().st_size
+
+    owner, other_owner = (uuid.uuid4().int % 10**9 for _ in range(2))
+    db = SessionLocal()
+    try:
+        for name in ("keep", "other", "placeholder_a", "placeholder_b"):
+            db.add(Dream(user_id=owner, prompt=name, image_path=f"generated_images/{name}_{tag}.png"))
+        db.add(Dream(user_id=other_owner, prompt="theirs", image_path=f"generated_images/theirs_{tag}.png"))
+        dream = Dream(user_id=owner, prompt="dup", image_path=f"generated_images/dup_{tag}.png")
+        # Only exact paths are repointed
+        elsewhere = Dream(user_id=owner, prompt="dup", image_path=f"archive/generated_images/dup_{tag}.png")
+        db.add_all([dream, elsewhere])
+        db.commit()
+
+        preview = dedup_directory(db, directory, ImageHashIndex(str(tmp_path / "index")), dry_run=True)
+        assert preview["duplicates"] == 1
+        assert (directory / f"dup_{tag}.png").exists()
+
+        index = ImageHashIndex(str(tmp_path / "index"))
+        report = dedup_directory(db, directory, index)
+        db.refresh(dream)
+        db.refresh(elsewhere)
+    finally:
+        db.close()
+
+    assert report["files_scanned"] == 6
+    assert report["placeholders_skipped"] == 2
+    assert report["duplicates"] == 1
+    assert report["dream_rows_repointed"] == 1
+    assert report["bytes_reclaimed"] == duplicate_size
+    assert not (directory / f"dup_{tag}.png").exists()
+    assert (directory / f"theirs_{tag}.png").exists()
+    assert (directory / f"placeholder_b_{tag}.png").exists()
+    assert dream.image_path == f"generated_images/keep_{tag}.png"
+    assert elsewhere.image_path == f"archive/generated_images/dup_{tag}.png"
+    assert len(index) == 3
+    assert index.nearest(dhash(scene(5)), 4, other_owner) == (f"theirs_{tag}.png", 0)
+
+def test_offline_pass_coordinates_with_workers(tmp_path, monkeypatch):
+    """Workers cannot match files while the pass deletes them, and dreams saved meanwhile are repointed"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.chdir(tmp_path)
+    tag = uuid.uuid4().hex[:8]
+    owner = uuid.uuid4().int % 10**9
+    matches = []
+    waited = []
+    workers = []
+
+    class WatchedPath(type(Path())):
+        def unlink(self, *args, **kwargs):
+            # A worker in another process, with its own view of the index
+            worker_index = ImageHashIndex(str(tmp_path / "index"))
+            lookup = threading.Thread(target=lambda: matches.append(worker_index.nearest(dhash(scene(7)), 4, owner, directory)))
+            lookup.start()
+            lookup.join(0.2)
+            waited.append(lookup.is_alive())
+            workers.append(lookup)
+            worker_db = SessionLocal()
+            try:
+                worker_db.add(Dream(user_id=owner, prompt="saved during the pass", image_path=f"generated_images/dup_{tag}.png"))
+                worker_db.commit()
+            finally:
+                worker_db.close()
+            super().unlink(*args, **kwargs)
+
+    directory = WatchedPath("generated_images")
+    directory.mkdir()
+    scene(7).save(directory / f"keep_{tag}.png")
+    os.utime(directory / f"keep_{tag}.png", (1, 1))
+    scene(7).resize((300, 300)).save(directory / f"dup_{tag}.png")
+    index = ImageHashIndex(str(tmp_path / "index"))
+    index.add(dhash(scene(7)), f"dup_{tag}.png", owner)
+
+    db = SessionLocal()
+    try:
+        db.add_all([
+            Dream(user_id=owner, prompt="kept", image_path=f"generated_images/keep_{tag}.png"),
+            Dream(user_id=owner, prompt="duplicate", image_path=f"generated_images/dup_{tag}.png"),
+        ])
+        db.commit()
+        report = dedup_directory(db, directory, index)
+        paths = {dream.image_path for dream in db.query(Dream).filter(Dream.prompt == "saved during the pass")}
+    finally:
+        db.close()
+    workers[0].join()
+
+    assert waited == [True]
+    assert matches == [(f"keep_{tag}.png", 0)]
+    assert report["dream_rows_repointed"] == 2
+    assert f"generated_images/dup_{tag}.png" not in paths
+    assert f"generated_images/keep_{tag}.png" in paths
+
+def test_nearest_skips_deleted_files(tmp_path):
+    """A lookup with a directory ignores matches whose file is gone"""
+    index = ImageHashIndex(str(tmp_path / "index"))
+    index.add(0b1111, "gone.png", 1)
+    assert index.nearest(0b1111, 2, 1) == ("gone.png", 0)
+    assert index.nearest(0b1111, 2, 1, tmp_path) is None
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
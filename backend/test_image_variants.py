@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test on-demand image resizing and the variant disk cache
+"""
+
+import asyncio
+import io
+import os
+import threading
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.main import app
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db.models.dream import Dream
+from app.db.models.user import User
+from app.db.session import SessionLocal, engine, Base
+from app.services.image_variants import VariantCache, fit_size, get_variant_cache, render_variant
+
+def test_fit_size_keeps_aspect_and_never_upscales():
+    """Variants fit inside the requested box"""
+    assert fit_size((512, 512), 128, None) == (128, 128)
+    assert fit_size((1024, 512), 256, 256) == (256, 128)
+    assert fit_size((512, 256), None, 64) == (128, 64)
+    assert fit_size((100, 100), 512, 512) == (100, 100)
+
+def test_render_variant_from_large_jpeg(tmp_path):
+    """JPEG sources are drafted and reduced before the final resize"""
+    source = tmp_path / "big.jpg"
+    Image.effect_noise((2048, 1024), 40).convert("RGB").save(source, quality=90)
+    variant = Image.open(io.BytesIO(render_variant(source, 256, 256, "webp")))
+    assert variant.format == "WEBP"
+    assert variant.size == (256, 128)
+
+def test_cache_evicts_oldest_files(tmp_path):
+    """Past max_bytes the least recently used variants are deleted"""
+    cache = VariantCache(str(tmp_path), max_bytes=3500)
+
+    async def fill():
+        for i in range(3):
+            await cache.get_or_render(f"v{i}.png", lambda: b"x" * 1000)
+            os.utime(tmp_path / f"v{i}.png", (i, i))
+        # A hit makes v0 the most recently used
+        await cache.get_or_render("v0.png", lambda: b"unused")
+        await cache.get_or_render("v3.png", lambda: b"x" * 1000)
+
+    asyncio.run(fill())
+    assert sorted(os.listdir(tmp_path)) == ["v0.png", "v2.png", "v3.png"]
+
+def test_eviction_spares_variants_being_served(tmp_path):
+    """A render that overflows the cache does not delete variants other requests were just handed"""
+    cache = VariantCache(str(tmp_path), max_bytes=5000)
+    for i in range(4):
+        (tmp_path / f"v{i}.png").write_bytes(b"x" * 1000)
+        os.utime(tmp_path / f"v{i}.png", (i, i))
+
+    async def serve_during_eviction():
+        hits = [cache.get_or_render(f"v{i}.png", lambda: b"unused") for i in (1, 3)]
+        miss = cache.get_or_render("big.png", lambda: b"x" * 6000)
+        paths = await asyncio.gather(*hits, miss)
+        return [path.read_bytes() for path in paths[:2]]
+
+    assert asyncio.run(serve_during_eviction()) == [b"x" * 1000] * 2
+    assert sorted(os.listdir(tmp_path)) == ["big.png", "v1.png", "v3.png"]
+
+def test_concurrent_misses_share_one_render(tmp_path):
+    """Requests for the same variant while it renders wait for that render"""
+    cache = VariantCache(str(tmp_path), max_bytes=10**6)
+    calls = []
+
+    def render():
+        calls.append(threading.get_ident())
+        time.sleep(0.1)
+        return b"variant"
+
+    async def fetch_all():
+        return await asyncio.gather(*(cache.get_or_render("same.png", render) for _ in range(5)))
+
+    paths = asyncio.run(fetch_all())
+    assert len(calls) == 1
+    assert set(paths) == {tmp_path / "same.png"}
+
+def test_media_image_endpoint(tmp_path, monkeypatch):
+    """Whitelisted sizes are resized and cached; other sizes and other users' dreams are refused"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("generated_images")
+    Image.effect_noise((512, 512), 40).convert("RGB").save("generated_images/dream_resize.png")
+    monkeypatch.setattr(settings, "MEDIA_VARIANT_CACHE_DIR", str(tmp_path / "variants"))
+    get_variant_cache.cache_clear()
+
+    db = SessionLocal()
+    try:
+        owner = User(email=f"resize_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        other = User(email=f"resize_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add_all([owner, other])
+        db.commit()
+        dream = Dream(user_id=owner.id, prompt="resize me", image_path="generated_images/dream_resize.png")
+        db.add(dream)
+        db.commit()
+        dream_id = dream.id
+        owner_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': owner.email})}"}
+        other_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': other.email})}"}
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    url = f"/api/v1/media/images/{dream_id}"
+    try:
+        response = client.get(url, params={"w": 128, "fmt": "webp"}, headers=owner_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["cache-control"].startswith("private")
+        assert Image.open(io.BytesIO(response.content)).size == (128, 128)
+        assert os.listdir(tmp_path / "variants") == ["dream_resize-128x0.webp"]
+
+        again = client.get(url, params={"w": 128, "fmt": "webp"}, headers=owner_headers)
+        assert again.content == response.content
+
+        original = client.get(url, headers=owner_headers)
+        assert Image.open(io.BytesIO(original.content)).size == (512, 512)
+
+        assert client.get(url, params={"w": 100}, headers=owner_headers).status_code == 400
+        assert client.get(url, params={"w": 128, "fmt": "gif"}, headers=owner_headers).status_code == 422
+        assert client.get(url, params={"w": 128}, headers=other_headers).status_code == 404
+        assert client.get(url, params={"w": 128}).status_code == 404
+    finally:
+        get_variant_cache.cache_clear()
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
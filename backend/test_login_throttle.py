@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test the sliding-window login throttle
+"""
+
+import multiprocessing
+import os
+import uuid
+
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.session import engine, Base
+from app.api.v1.routes import auth
+from app.core.rate_limit import LoginThrottle, SlidingWindowLimiter, SQLiteWindowStore
+
+def test_sliding_window_weights_previous_window():
+    """Attempts in the previous window count in proportion to their overlap"""
+    limiter = SlidingWindowLimiter(limit=10, window_seconds=60)
+    for _ in range(10):
+        assert limiter.retry_after("k", now=30) == 0
+        limiter.hit("k", now=30)
+    assert limiter.retry_after("k", now=59) == 1
+
+    # 45s into the next window only a quarter of the previous 10 still counts
+    assert limiter.retry_after("k", now=105) == 0
+    # Early in the next window the previous attempts still block
+    wait = limiter.retry_after("k", now=61)
+    assert 0 < wait <= 59
+
+def test_throttle_checks_ip_and_account():
+    """Either scope can reject, and rejected attempts are not counted"""
+    throttle = LoginThrottle(ip_limit=3, account_limit=2, window_seconds=60)
+    assert throttle.check("1.1.1.1", "a@example.com", now=0) == (None, 0)
+    assert throttle.check("2.2.2.2", "A@example.com ", now=1) == (None, 0)
+    assert throttle.check("3.3.3.3", "a@example.com", now=2) == ("account", 58)
+
+    assert throttle.check("1.1.1.1", "b@example.com", now=3) == (None, 0)
+    assert throttle.check("1.1.1.1", "c@example.com", now=4) == (None, 0)
+    assert throttle.check("1.1.1.1", "d@example.com", now=5)[0] == "ip"
+
+def test_sqlite_store_shared_between_throttles(tmp_path):
+    """Two throttles on the same SQLite file see each other's attempts"""
+    path = str(tmp_path / "limits.db")
+    first = LoginThrottle(ip_limit=100, account_limit=2, window_seconds=60, store=SQLiteWindowStore(path))
+    second = LoginThrottle(ip_limit=100, account_limit=2, window_seconds=60, store=SQLiteWindowStore(path))
+    assert first.check("1.1.1.1", "shared@example.com", now=0)[0] is None
+    assert second.check("2.2.2.2", "shared@example.com", now=1)[0] is None
+    assert first.check("3.3.3.3", "shared@example.com", now=2)[0] == "account"
+
+def test_sqlite_store_reconnects_after_fork(tmp_path):
+    """A forked worker gets its own connection instead of the parent's"""
+    store = SQLiteWindowStore(str(tmp_path / "limits.db"))
+    parent_connection = store._connection
+    store.increment("ip:1", 5)
+    pid = os.fork()
+    if pid == 0:
+        ok = store._connection is not parent_connection
+        store.increment("ip:1", 5)
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert store.counts("ip:1", 5) == (0, 2)
+
+def test_successful_logins_are_not_counted():
+    """Released attempts give their slot back; failed ones keep it"""
+    throttle = LoginThrottle(ip_limit=100, account_limit=2, window_seconds=60)
+    for second in range(5):
+        assert throttle.check("1.1.1.1", "tabs@example.com", now=second) == (None, 0)
+        throttle.release("1.1.1.1", "tabs@example.com", now=second)
+    assert throttle.check("1.1.1.1", "tabs@example.com", now=10) == (None, 0)
+    assert throttle.check("1.1.1.1", "tabs@example.com", now=11) == (None, 0)
+    assert throttle.check("1.1.1.1", "tabs@example.com", now=12)[0] == "account"
+
+def _attempt_logins(path, attempts, results):
+    throttle = LoginThrottle(ip_limit=1000, account_limit=5, window_seconds=60, store=SQLiteWindowStore(path))
+    for _ in range(attempts):
+        results.put(throttle.check("1.1.1.1", "race@example.com", now=30)[0] is None)
+
+def test_sqlite_check_and_increment_are_atomic(tmp_path):
+    """Concurrent workers never let more attempts through than the limit"""
+    path = str(tmp_path / "limits.db")
+    SQLiteWindowStore(path)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=_attempt_logins, args=(path, 10, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    allowed = [results.get(timeout=30) for _ in range(40)]
+    for worker in workers:
+        worker.join()
+    assert sum(allowed) == 5
+
+def test_login_endpoint_rejects_before_hashing(monkeypatch):
+    """Over the limit, login returns 429 with Retry-After without verifying the password"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(auth, "login_throttle", LoginThrottle(ip_limit=100, account_limit=2, window_seconds=60))
+    client = TestClient(app)
+    email = f"throttle_{uuid.uuid4().hex[:8]}@example.com"
+
+    for _ in range(2):
+        response = client.post("/api/v1/auth/login", data={"username": email, "password": "wrong"})
+        assert response.status_code == 401
+
+    async def fail_verify(*args):
+        raise AssertionError("password verified while throttled")
+
+    monkeypatch.setattr(auth.password_hasher, "verify_and_update", fail_verify)
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "wrong"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+def test_login_endpoint_counts_only_failures(monkeypatch):
+    """Logging in from many tabs or devices does not lock the account"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(auth, "login_throttle", LoginThrottle(ip_limit=100, account_limit=2, window_seconds=60))
+    client = TestClient(app)
+    email = f"tabs_{uuid.uuid4().hex[:8]}@example.com"
+    assert client.post("/api/v1/auth/register", json={"email": email, "password": "secret123"}).status_code == 200
+
+    for _ in range(4):
+        assert client.post("/api/v1/auth/login", data={"username": email, "password": "secret123"}).status_code == 200
+    for _ in range(2):
+        assert client.post("/api/v1/auth/login", data={"username": email, "password": "wrong"}).status_code == 401
+    assert client.post("/api/v1/auth/login", data={"username": email, "password": "secret123"}).status_code == 429
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test the streamed ZIP archive of a user's generated media
+"""
+
+import io
+import os
+import uuid
+import zipfile
+
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.session import SessionLocal, engine, Base
+from app.db.models.dream import Dream
+from app.db.models.user import User
+from app.db.models.video import Video
+from app.core.security import create_access_token
+from app.services.media_archive import iter_zip_entries
+
+def test_iter_zip_entries_streams_in_chunks(tmp_path):
+    """Large files are emitted in bounded chunks and stored uncompressed"""
+    root = tmp_path.resolve()
+    payload = os.urandom(300_000)
+    (root / "big.png").write_bytes(payload)
+
+    chunks = list(iter_zip_entries([("images/big.png", str(root / "big.png"), root)], chunk_size=64 * 1024))
+    assert len(chunks) > 4
+    assert max(len(chunk) for chunk in chunks) < 70 * 1024
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.getinfo("images/big.png").compress_type == zipfile.ZIP_STORED
+    assert archive.read("images/big.png") == payload
+
+def test_archive_endpoint(tmp_path, monkeypatch):
+    """The archive holds only the caller's existing media files"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("generated_images")
+    os.makedirs("generated_videos")
+    with open("generated_images/dream_a.png", "wb") as f:
+        f.write(b"\x89PNG image a")
+    with open("generated_videos/video_a.mp4", "wb") as f:
+        f.write(b"mp4 video a")
+
+    db = SessionLocal()
+    try:
+        user = User(email=f"archive_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.add_all([
+            Dream(user_id=user.id, prompt="a", image_path="generated_images/dream_a.png"),
+            Dream(user_id=user.id, prompt="gone", image_path="generated_images/missing.png"),
+            Dream(user_id=None, prompt="someone else", image_path="generated_images/dream_a.png"),
+            Video(user_id=user.id, prompt="v", video_path="generated_videos/video_a.mp4", video_url="/static/generated_videos/video_a.mp4"),
+        ])
+        db.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+    finally:
+        db.close()
+
+    response = TestClient(app).get("/api/v1/dreams/archive", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    names = archive.namelist()
+    assert len(names) == 2
+    assert any(name.startswith("images/") and name.endswith("dream_a.png") for name in names)
+    assert any(name.startswith("videos/") and name.endswith("video_a.mp4") for name in names)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_iter_zip_entries_streams_in_chunks(pathlib.Path(tempfile.mkdtemp()))
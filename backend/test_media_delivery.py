@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test static media delivery modes: Python, zero-copy and proxy offload
+"""
+
+import asyncio
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.core.media import MediaFiles, owner_authorizer
+from app.core.security import create_access_token
+from app.db.models.dream import Dream
+from app.db.models.user import User
+from app.db.init_db import init_db
+from app.db.session import SessionLocal, engine, Base
+
+PNG = b"\x89PNG" + b"0" * 5000
+
+def media_app(tmp_path, mode, authorize=None):
+    (tmp_path / "dream_1.png").write_bytes(PNG)
+    (tmp_path / "notes.txt").write_text("dream notes " * 200)
+    media = FastAPI()
+    media.mount(
+        "/static/generated_images",
+        MediaFiles(directory=str(tmp_path), mode=mode, accel_prefix="/_media/generated_images", authorize=authorize),
+        name="generated_images",
+    )
+    return media
+
+def test_python_mode_streams_file(tmp_path):
+    """The default mode behaves like the old StaticFiles mount"""
+    client = TestClient(media_app(tmp_path, "python"))
+    assert client.get("/static/generated_images/dream_1.png").content == PNG
+    assert client.get("/static/generated_images/missing.png").status_code == 404
+
+def test_x_accel_redirect(tmp_path):
+    """The app answers with headers only and nginx sends the file"""
+    client = TestClient(media_app(tmp_path, "x-accel"))
+    response = client.get("/static/generated_images/dream_1.png")
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == "/_media/generated_images/dream_1.png"
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == b""
+    assert client.get("/static/generated_images/missing.png").status_code == 404
+    assert client.get("/static/generated_images/../secret.png").status_code == 404
+    # Compressible files still go through Python for their precompressed variants
+    assert "x-accel-redirect" not in client.get("/static/generated_images/notes.txt").headers
+
+def test_x_sendfile(tmp_path):
+    """X-Sendfile carries the absolute path of the resolved file"""
+    response = TestClient(media_app(tmp_path, "x-sendfile")).get("/static/generated_images/dream_1.png")
+    assert response.headers["x-sendfile"] == str((tmp_path / "dream_1.png").resolve())
+    assert response.content == b""
+
+def call(app, path, extensions):
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "scheme": "http", "server": ("test", 80), "extensions": extensions,
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message = dict(message, data=message["file"].read(message["count"]))
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+@pytest.mark.parametrize("extension", ["http.response.zerocopysend", "http.response.pathsend"])
+def test_sendfile_uses_server_extension(tmp_path, extension):
+    """With sendfile the body is handed to the server instead of read in Python"""
+    messages = call(media_app(tmp_path, "sendfile"), "/static/generated_images/dream_1.png", {extension: {}})
+    assert [message["type"] for message in messages] == ["http.response.start", extension]
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-length"] == str(len(PNG)).encode()
+    if extension == "http.response.zerocopysend":
+        assert messages[1]["data"] == PNG
+    else:
+        assert messages[1]["path"] == str(tmp_path / "dream_1.png")
+
+def test_sendfile_falls_back_without_extension(tmp_path):
+    """Servers without a zero-copy extension still get the file from Python"""
+    messages = call(media_app(tmp_path, "sendfile"), "/static/generated_images/dream_1.png", {})
+    assert b"".join(message.get("body", b"") for message in messages) == PNG
+
+def test_authorization_runs_before_hand_off(tmp_path):
+    """With an authorizer, owned files are only handed to the proxy for their owner"""
+    Base.metadata.create_all(bind=engine)
+    tag = uuid.uuid4().hex[:8]
+    (tmp_path / f"owned_{tag}.png").write_bytes(PNG)
+    (tmp_path / f"public_{tag}.png").write_bytes(PNG)
+    db = SessionLocal()
+    try:
+        owner = User(email=f"media_{tag}@example.com", hashed_password="x")
+        other = User(email=f"media_other_{tag}@example.com", hashed_password="x")
+        db.add_all([owner, other])
+        db.commit()
+        db.add_all([
+            Dream(user_id=owner.id, prompt="owned", image_path=f"generated_images/owned_{tag}.png"),
+            Dream(prompt="public", image_path=f"generated_images/public_{tag}.png"),
+        ])
+        db.commit()
+        owner_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': owner.email})}"}
+        other_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': other.email})}"}
+    finally:
+        db.close()
+
+    client = TestClient(media_app(tmp_path, "x-accel", owner_authorizer(Dream, "image_path", "generated_images")))
+    owned = f"/static/generated_images/owned_{tag}.png"
+    response = client.get(owned, headers=owner_headers)
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == f"/_media/generated_images/owned_{tag}.png"
+    assert response.headers["cache-control"] == "private"
+    for headers in (other_headers, {}, {"Authorization": "Bearer not-a-token"}):
+        response = client.get(owned, headers=headers)
+        assert response.status_code == 404
+        assert "x-accel-redirect" not in response.headers
+    assert client.get(f"/static/generated_images/public_{tag}.png").status_code == 200
+    # Files no dream points at are not served either
+    assert client.get("/static/generated_images/dream_1.png", headers=owner_headers).status_code == 404
+    # LIKE wildcards in a name match nothing
+    assert client.get(f"/static/generated_images/%wned_{tag}.png").status_code == 404
+    assert client.get(f"/static/generated_images/_wned_{tag}.png").status_code == 404
+
+def test_media_path_lookups_use_an_index():
+    """The authorizer's exact path match is served by an index on existing databases too"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_dreams_image_path"))
+    init_db(engine)
+    with engine.connect() as conn:
+        plan = conn.execute(text("EXPLAIN QUERY PLAN SELECT user_id FROM dreams WHERE image_path = 'generated_images/x.png'")).all()
+    assert "ix_dreams_image_path" in " ".join(str(row) for row in plan)
+
+def test_unknown_mode_is_rejected(tmp_path):
+    """A typo in MEDIA_DELIVERY fails at startup rather than per request"""
+    with pytest.raises(ValueError):
+        MediaFiles(directory=str(tmp_path), mode="carrier-pigeon")
+
+if __name__ == "__main__":
+    pytest.main([__file__])
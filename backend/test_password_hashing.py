@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test the bcrypt thread pool and cost-factor upgrades on login
+"""
+
+import asyncio
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from app.main import app
+from app.db.session import SessionLocal, engine, Base
+from app.db.models.user import User
+from app.api.v1.routes import auth
+from app.core.security import PasswordHasher, PasswordHasherBusy
+
+def pinned_context(rounds: int) -> CryptContext:
+    return CryptContext(
+        schemes=["bcrypt"],
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+def test_hashing_does_not_block_event_loop():
+    """The loop keeps running other tasks while bcrypt works"""
+    hasher = PasswordHasher(pinned_context(10), max_workers=1, max_queue=4)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.create_task(ticker())
+        hashed = await hasher.hash("secret")
+        task.cancel()
+        return hashed, ticks
+
+    hashed, ticks = asyncio.run(run())
+    assert hashed.startswith("$2b$10$")
+    assert ticks > 5
+
+def test_full_queue_rejects():
+    """Jobs beyond the pool and queue limits are rejected immediately"""
+    hasher = PasswordHasher(pinned_context(10), max_workers=1, max_queue=0)
+
+    async def run():
+        first = asyncio.create_task(hasher.hash("one"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(hasher.hash("two"))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordHasherBusy):
+            await second
+        await first
+
+    asyncio.run(run())
+
+def test_login_upgrades_outdated_hash(monkeypatch):
+    """A hash with the old cost factor is replaced on successful login"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(auth, "password_hasher", PasswordHasher(pinned_context(5), max_workers=1, max_queue=4))
+    email = f"rehash_{uuid.uuid4().hex[:8]}@example.com"
+
+    db = SessionLocal()
+    try:
+        db.add(User(email=email, hashed_password=pinned_context(4).hash("password123")))
+        db.commit()
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "wrong"})
+    assert response.status_code == 401
+
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "password123"})
+    assert response.status_code == 200
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        assert user.hashed_password.startswith("$2b$05$")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the pipeline stage histograms, provider/cache counters and multi-worker metrics
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from PIL import Image
+from prometheus_client import REGISTRY
+from app.core.cache import TTLCache
+from app.services.stable_diffusion import StableDiffusionService
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def stage_count(stage):
+    return sample("dream_pipeline_stage_seconds_count", stage=stage)
+
+def test_placeholder_fallback_is_counted_and_timed(tmp_path, monkeypatch):
+    """A failing provider counts an error and a fallback, and every stage is timed"""
+    service = StableDiffusionService()
+    service.output_dir = tmp_path
+    service.hf_token = ""
+
+    def unreachable(prompt):
+        raise ConnectionError("provider down")
+
+    monkeypatch.setattr(service, "_generate_with_alternative_api", unreachable)
+    monkeypatch.setattr(service, "_generate_placeholder_image", lambda prompt: Image.new("RGB", (8, 8)))
+
+    fallbacks = sample("media_placeholder_fallbacks_total", provider="pollinations")
+    stages = {stage: stage_count(stage) for stage in ("placeholder_render", "encode", "storage_write")}
+
+    result = service.generate_image("a lighthouse in fog", filename="metrics_test")
+
+    assert os.path.exists(result["file_path"])
+    assert Image.open(result["file_path"]).size == (8, 8)
+    assert sample("media_placeholder_fallbacks_total", provider="pollinations") == fallbacks + 1
+    for stage, count in stages.items():
+        assert stage_count(stage) == count + 1
+    assert sample("media_generations_in_flight", kind="image") == 0
+
+def test_cache_lookups_are_counted_per_cache():
+    """Named caches report hits and misses; unnamed caches stay out of the metric"""
+    cache = TTLCache(ttl=60, name="test_cache")
+    cache.get("missing")
+    cache.set("key", "value")
+    cache.get("key")
+    cache.get("key", version=2)
+
+    assert sample("cache_lookups_total", cache="test_cache", result="hit") == 1
+    assert sample("cache_lookups_total", cache="test_cache", result="miss") == 2
+
+def test_multiple_workers_are_aggregated(tmp_path):
+    """With PROMETHEUS_MULTIPROC_DIR every worker's samples are added up on /metrics"""
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    record = (
+        "from app.core.metrics import PROVIDER_REQUESTS, observe_stage\n"
+        "PROVIDER_REQUESTS.labels(provider='huggingface', outcome='success').inc()\n"
+        "with observe_stage('db_commit'):\n"
+        "    pass\n"
+    )
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", record], env=env, check=True)
+
+    render = "import json; from app.core.metrics import render_metrics; print(json.dumps(render_metrics()[0].decode()))"
+    output = subprocess.run([sys.executable, "-c", render], env=env, capture_output=True, text=True, check=True).stdout
+    text = json.loads(output.strip().splitlines()[-1])
+    assert 'media_provider_requests_total{outcome="success",provider="huggingface"} 2.0' in text
+    assert 'dream_pipeline_stage_seconds_count{stage="db_commit"} 2.0' in text
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test warm shared state, the health endpoints and prefork workers
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.core import warm_state
+
+def test_memory_usage_reports_shared_and_private_pages():
+    """smaps_rollup is split into rss, pss, shared and private (uss) bytes"""
+    usage = warm_state.memory_usage()
+    if "max_rss" in usage:
+        assert usage["max_rss"] > 0
+        return
+    assert usage["rss"] > 0
+    assert usage["uss"] <= usage["rss"]
+    assert usage["shared"] + usage["uss"] == usage["rss"]
+
+def test_warm_up_records_each_step_once():
+    """Every step is timed once per process and skipped when already loaded"""
+    warm_state.reset_warm_state()
+    try:
+        state = warm_state.warm_up()
+        assert set(state) == set(warm_state.WARM_STEPS)
+        assert all(step["loaded"] and step["pid"] == os.getpid() for step in state.values())
+        assert warm_state.is_warm()
+        assert warm_state.warm_up() == state
+    finally:
+        warm_state.reset_warm_state()
+
+def test_health_endpoints_report_worker_state():
+    """Liveness always answers; readiness waits for warm state when WARM_STATE is on"""
+    warm_state.reset_warm_state()
+    with TestClient(app) as client:
+        live = client.get("/health/live")
+        assert live.status_code == 200
+        assert live.json()["pid"] == os.getpid()
+        assert "rss" in live.json()["memory"] or "max_rss" in live.json()["memory"]
+
+        ready = client.get("/health/ready")
+        assert ready.status_code == 200
+        assert ready.json()["checks"] == {"warm": True, "database": True}
+
+        settings.WARM_STATE = True
+        try:
+            ready = client.get("/health/ready")
+            assert ready.status_code == 503
+            assert ready.json()["checks"]["warm"] is False
+            warm_state.warm_up()
+            assert client.get("/health/ready").status_code == 200
+        finally:
+            settings.WARM_STATE = False
+            warm_state.reset_warm_state()
+
+def test_prefork_workers_inherit_warm_state():
+    """Forked workers serve requests with the state the parent warmed"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    code = f"from app.core.prefork import serve_prefork; serve_prefork('127.0.0.1', {port}, 2, log_level='warning')"
+    server = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        body = None
+        deadline = time.monotonic() + 60
+        while body is None and time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=2) as response:
+                    body = json.loads(response.read())
+            except OSError:
+                time.sleep(0.1)
+        assert body is not None
+        assert body["warm"]
+        assert body["worker"] in ("0", "1")
+        assert body["pid"] != server.pid
+        assert all(step["pid"] == server.pid for step in body["warm_state"].values())
+    finally:
+        server.terminate()
+        assert server.wait(timeout=30) == 0
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
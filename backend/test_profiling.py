@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test the opt-in per-request profiling middleware
+"""
+
+import pstats
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.core import scheduler
+from app.core.profiling import ProfilingMiddleware
+
+def busy_handler_work(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def busy_generation_work(seconds):
+    busy_handler_work(seconds)
+    return {"ok": True}
+
+def build_app(**options):
+    app = FastAPI()
+
+    @app.post("/api/v1/dreams/")
+    async def create_dream():
+        busy_handler_work(0.05)
+        return {"ok": True}
+
+    @app.get("/other")
+    async def other():
+        return {"ok": True}
+
+    @app.post("/api/v1/videos/")
+    async def create_video(request: Request):
+        return await scheduler.schedule_generation(request, None, busy_generation_work, 0.05)
+
+    app.add_middleware(ProfilingMiddleware, **options)
+    return app
+
+def test_requests_without_token_or_sampling_are_not_profiled(tmp_path):
+    """No header and a zero sample rate leave the request and the output directory alone"""
+    client = TestClient(build_app(output_dir=str(tmp_path), token="secret"))
+    response = client.post("/api/v1/dreams/", headers={"X-Profile-Token": "wrong"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+def test_authorized_header_writes_collapsed_stacks(tmp_path):
+    """A sampling profile keyed by the request id shows the handler's frames"""
+    client = TestClient(build_app(output_dir=str(tmp_path), token="secret", interval=0.001))
+    response = client.post("/api/v1/dreams/", headers={"X-Profile-Token": "secret", "X-Request-ID": "req-42"})
+    assert response.headers["x-profile-id"] == "req-42"
+
+    lines = (tmp_path / "req-42.collapsed").read_text().splitlines()
+    assert lines
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("busy_handler_work" in line for line in lines)
+
+def test_sampling_covers_generation_threads(tmp_path, monkeypatch):
+    """Work a profiled request hands to generation threads shows up in its profile, scheduled or not"""
+    client = TestClient(build_app(output_dir=str(tmp_path), token="secret", interval=0.001))
+    for enabled in (True, False):
+        monkeypatch.setattr(scheduler.settings, "SCHEDULER_ENABLED", enabled)
+        response = client.post("/api/v1/videos/", headers={"X-Profile-Token": "secret", "X-Request-ID": f"gen-{enabled}"})
+        assert response.json() == {"ok": True}
+        lines = (tmp_path / f"gen-{enabled}.collapsed").read_text().splitlines()
+        assert any("busy_generation_work" in line for line in lines)
+
+def test_deterministic_mode_writes_cprofile_dump(tmp_path):
+    """X-Profile-Mode picks cProfile, and unsafe request ids are replaced"""
+    client = TestClient(build_app(output_dir=str(tmp_path), token="secret"))
+    response = client.post(
+        "/api/v1/dreams/",
+        headers={"X-Profile-Token": "secret", "X-Profile-Mode": "deterministic", "X-Request-ID": "../../etc"},
+    )
+    profile_id = response.headers["x-profile-id"]
+    assert profile_id != "../../etc"
+
+    stats = pstats.Stats(str(tmp_path / f"{profile_id}.prof"))
+    assert any(function == "busy_handler_work" for _, _, function in stats.stats)
+
+def test_sampling_rule_only_matches_configured_paths(tmp_path):
+    """With a sample rate of 1 every request under the configured prefixes is profiled"""
+    client = TestClient(build_app(output_dir=str(tmp_path), sample_rate=1.0, paths=["/api/v1/dreams/"]))
+    assert "x-profile-id" not in client.get("/other").headers
+    profile_id = client.post("/api/v1/dreams/").headers["x-profile-id"]
+    assert (tmp_path / f"{profile_id}.collapsed").exists()
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
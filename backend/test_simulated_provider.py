@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test the deterministic simulated image provider
+"""
+
+import io
+
+from PIL import Image
+from app.core.config import settings
+from app.core.metrics import PLACEHOLDER_FALLBACKS, PROVIDER_REQUESTS
+from app.services.simulated_provider import SimulatedImageProvider, get_simulated_provider
+from app.services.stable_diffusion import StableDiffusionService
+
+def outcomes(provider, count):
+    return [provider._next()[1:] for _ in range(count)]
+
+def test_same_seed_same_sequence():
+    """Latencies and failures repeat exactly for a given seed"""
+    options = dict(latency_ms=200, latency_sigma=0.5, failure_rate=0.2, unavailable_rate=0.2)
+    first = outcomes(SimulatedImageProvider(seed=7, **options), 50)
+    assert first == outcomes(SimulatedImageProvider(seed=7, **options), 50)
+    assert first != outcomes(SimulatedImageProvider(seed=8, **options), 50)
+    assert {outcome for _, outcome in first} == {"ok", "503", "500"}
+    assert len({latency for latency, _ in first}) > 1
+
+def test_pattern_cycles():
+    """A pattern overrides the rates and repeats in order"""
+    provider = SimulatedImageProvider(latency_ms=0, pattern=["ok", "503", "500"])
+    assert [provider.request("p").status_code for _ in range(6)] == [200, 503, 500, 200, 503, 500]
+
+def test_image_bytes_are_realistic():
+    """Successful responses are decodable PNGs of the configured size"""
+    response = SimulatedImageProvider(latency_ms=0, image_size=256).request("p")
+    assert response.headers["content-type"] == "image/png"
+    assert Image.open(io.BytesIO(response.content)).size == (256, 256)
+    assert len(response.content) > 50_000
+
+def counter(metric, **labels):
+    return metric.labels(**labels)._value.get()
+
+def test_service_saves_and_falls_back(monkeypatch, tmp_path):
+    """A 200 is decoded and saved; a 503 falls back to the placeholder"""
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "simulated")
+    monkeypatch.setattr(settings, "SIMULATED_PROVIDER_LATENCY_MS", 0.0)
+    monkeypatch.setattr(settings, "SIMULATED_PROVIDER_IMAGE_SIZE", 128)
+    monkeypatch.setattr(settings, "SIMULATED_PROVIDER_PATTERN", "ok,503")
+    get_simulated_provider.cache_clear()
+    service = StableDiffusionService()
+    service.output_dir = tmp_path
+    successes = counter(PROVIDER_REQUESTS, provider="simulated", outcome="success")
+    fallbacks = counter(PLACEHOLDER_FALLBACKS, provider="simulated")
+    try:
+        saved = Image.open(service.generate_image("a simulated dream", "ok")["file_path"])
+        assert saved.size == (128, 128)
+        placeholder = Image.open(service.generate_image("a simulated dream", "fallback")["file_path"])
+        assert placeholder.size == (512, 512)
+    finally:
+        get_simulated_provider.cache_clear()
+    assert counter(PROVIDER_REQUESTS, provider="simulated", outcome="success") == successes + 1
+    assert counter(PLACEHOLDER_FALLBACKS, provider="simulated") == fallbacks + 1
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
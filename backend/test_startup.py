@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Test that importing the app stays cheap and schema setup is a lifecycle step
+"""
+
+import json
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+from app.main import app
+from app.db.session import engine, Base
+
+def test_import_skips_heavy_modules():
+    """OpenCV, numpy, PIL and requests are not loaded until a feature needs them"""
+    script = "import json, sys, app.main; print(json.dumps(sorted(m for m in ('cv2', 'numpy', 'PIL', 'requests') if m in sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == []
+
+def test_lifespan_creates_schema():
+    """Starting the app creates missing tables"""
+    Base.metadata.drop_all(bind=engine)
+    assert not inspect(engine).has_table("dreams")
+
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
+    assert inspect(engine).has_table("dreams")
+    assert "token_version" in {column["name"] for column in inspect(engine).get_columns("users")}
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
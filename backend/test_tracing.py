@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test request tracing across the route, service and provider layers
+"""
+
+import io
+import json
+import uuid
+
+import requests
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.main import app
+from app.core import tracing
+from app.core.security import create_access_token
+from app.db.models.user import User
+from app.db.session import SessionLocal, engine, Base
+from app.services.stable_diffusion import get_stable_diffusion_service
+
+class FakeResponse:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.headers = {"content-type": "image/png"}
+        self.text = ""
+
+def noisy_png():
+    buffer = io.BytesIO()
+    Image.effect_noise((64, 64), 50).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def test_spans_are_noops_without_exporter():
+    """With tracing off, span() hands back the shared no-op and nothing is recorded"""
+    tracing.set_exporter(None)
+    with tracing.span("anything") as current:
+        current.set_attribute("ignored", True)
+    assert current is tracing.NOOP_SPAN
+    assert tracing.inject_headers({"a": "b"}) == {"a": "b"}
+
+def test_dream_request_is_one_trace(monkeypatch):
+    """Auth, provider call, encode, file write and commit are children of the request span"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = User(email=f"trace_{uuid.uuid4().hex[:8]}@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    token = create_access_token(data={"sub": user.email, "uid": user.id, "ver": 0})
+    db.close()
+
+    outbound = []
+
+    def fake_get(url, timeout=None, headers=None):
+        outbound.append(headers)
+        return FakeResponse(noisy_png())
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    monkeypatch.setattr(get_stable_diffusion_service(), "hf_token", "")
+
+    exporter = tracing.InMemoryExporter()
+    tracing.set_exporter(exporter)
+    remote_trace = "ab" * 16
+    try:
+        with TestClient(tracing.TracingMiddleware(app)) as client:
+            response = client.post(
+                "/api/v1/dreams/",
+                json={"prompt": "a traced dream"},
+                headers={"Authorization": f"Bearer {token}", "traceparent": f"00-{remote_trace}-{'cd' * 8}-01"},
+            )
+    finally:
+        tracing.set_exporter(None)
+
+    assert response.status_code == 200
+    assert response.headers["x-trace-id"] == remote_trace
+    spans = {record["name"]: record for record in exporter.spans}
+    assert {record["trace_id"] for record in exporter.spans} == {remote_trace}
+
+    root = spans["POST /api/v1/dreams/"]
+    assert root["parent_id"] == "cd" * 8
+    assert root["attributes"]["http.status_code"] == 200
+    assert spans["auth.resolve_principal"]["parent_id"] == root["span_id"]
+    assert spans["image.generate"]["attributes"]["provider"] == "pollinations"
+
+    provider = spans["provider_http"]
+    assert provider["parent_id"] == spans["image.generate"]["span_id"]
+    assert provider["attributes"]["response_bytes"] > 1000
+    assert outbound[0]["traceparent"] == f"00-{remote_trace}-{provider['span_id']}-01"
+
+    assert spans["storage_write"]["attributes"]["bytes"] == spans["encode"]["attributes"]["bytes"]
+    assert spans["db_commit"]["attributes"]["model"] == "Dream"
+    assert "serialization" in spans
+
+def test_jsonl_export_and_timeline(tmp_path):
+    """Spans written to JSONL can be regrouped into an indented request timeline"""
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.JSONLExporter(str(path))
+    tracing.set_exporter(exporter)
+    try:
+        with tracing.start_trace("POST /api/v1/dreams/"):
+            with tracing.span("image.generate", provider="pollinations"):
+                with tracing.span("provider_http"):
+                    pass
+            try:
+                with tracing.span("db_commit"):
+                    raise RuntimeError("disk full")
+            except RuntimeError:
+                pass
+    finally:
+        tracing.set_exporter(None)
+        exporter.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 4
+    traces = tracing.load_traces(str(path))
+    timeline = tracing.format_timeline(next(iter(traces.values()))).splitlines()
+    assert [line.split("ms")[2].split()[0] for line in timeline] == ["POST", "image.generate", "provider_http", "db_commit"]
+    assert "  provider_http" in timeline[2]
+    assert "[RuntimeError: disk full]" in timeline[3]
+
+if __name__ == "__main__":
+    import pytest
+    pytest.main([__file__])
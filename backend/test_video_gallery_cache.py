@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test the cached public video gallery and its invalidation
+"""
+
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.session import SessionLocal, engine, Base
+from app.db.models.video import Video
+from app.core.cache import TTLCache, get_cache_version
+from app.api.v1 import routes
+from app.api.v1.routes.videos import gallery_cache, gallery_version_cache, GALLERY_CACHE_NAME
+
+def add_video(prompt: str) -> Video:
+    db = SessionLocal()
+    try:
+        video = Video(prompt=prompt, video_path=f"generated_videos/{prompt}.mp4", video_url=f"/static/generated_videos/{prompt}.mp4")
+        db.add(video)
+        db.commit()
+        db.refresh(video)
+        return video
+    finally:
+        db.close()
+
+def test_ttl_cache_expiry_and_versions():
+    """Entries expire after the TTL and are stale once the version changes"""
+    cache = TTLCache(ttl=0.05, maxsize=2)
+    cache.set("a", 1, version=1)
+    assert cache.get("a", version=1) == 1
+    assert cache.get("a", version=2) is None
+
+    cache.set("b", 2)
+    time.sleep(0.06)
+    assert cache.get("b") is None
+
+    cache.set("x", 1)
+    cache.set("y", 2)
+    cache.set("z", 3)
+    assert len(cache) == 2
+    assert cache.get("x") is None
+
+def test_ttl_cache_single_flight():
+    """Concurrent misses for the same key call the loader only once"""
+    cache = TTLCache(ttl=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_load("k", loader) for _ in range(20)])
+
+    results = asyncio.run(run())
+    assert results == ["value"] * 20
+    assert len(calls) == 1
+
+def test_gallery_cache_invalidated_on_insert():
+    """Creating a video bumps the shared version and refreshes the gallery"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    gallery_cache.invalidate()
+    gallery_version_cache.invalidate()
+
+    client = TestClient(app)
+    add_video("first")
+
+    response = client.get("/api/v1/videos/?limit=5")
+    assert response.status_code == 200
+    assert [v["prompt"] for v in response.json()] == ["first"]
+    assert len(gallery_cache) == 1
+
+    db = SessionLocal()
+    try:
+        version_before = get_cache_version(db, GALLERY_CACHE_NAME)
+    finally:
+        db.close()
+
+    add_video("second")
+
+    db = SessionLocal()
+    try:
+        assert get_cache_version(db, GALLERY_CACHE_NAME) == version_before + 1
+    finally:
+        db.close()
+
+    response = client.get("/api/v1/videos/?limit=5")
+    assert response.status_code == 200
+    assert {v["prompt"] for v in response.json()} == {"first", "second"}
+
+def test_gallery_limit_bounds_and_version_reads(monkeypatch):
+    """Out-of-range limits are rejected and cache hits skip the version query"""
+    Base.metadata.create_all(bind=engine)
+    gallery_cache.invalidate()
+    gallery_version_cache.invalidate()
+    reads = []
+
+    def counting_version(db, name):
+        reads.append(name)
+        return get_cache_version(db, name)
+
+    monkeypatch.setattr(routes.videos, "get_cache_version", counting_version)
+    client = TestClient(app)
+    assert client.get("/api/v1/videos/?limit=0").status_code == 422
+    assert client.get("/api/v1/videos/?limit=101").status_code == 422
+    for _ in range(5):
+        assert client.get("/api/v1/videos/?limit=5").status_code == 200
+    assert reads == [GALLERY_CACHE_NAME]
+
+if __name__ == "__main__":
+    test_ttl_cache_expiry_and_versions()
+    test_ttl_cache_single_flight()
+    test_gallery_cache_invalidated_on_insert()